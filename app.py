@@ -6,49 +6,225 @@ Backend Flask optimizado para procesamiento de CSV y transcripción de audios
 """
 
 import threading
+import contextlib
+import bisect
+import queue
+import socket
+import atexit
 import uuid
+import struct
+import hashlib
+import hmac
+from collections import deque, OrderedDict, Counter
 import time
 import os
 import subprocess
 import re
+import sys
+import functools
 import shutil
-from datetime import datetime
-from flask import Flask, request, jsonify, send_from_directory, send_file
-import pandas as pd
-import nltk
-import spacy
+import wave
+import zipfile
+import io
+import tempfile
+import itertools
+import numbers
 import string
-from sklearn.feature_extraction.text import TfidfVectorizer
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
 import json
+import sqlite3
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlparse, urlencode
+
+# Tiempo de la primera carga de cada dependencia pesada. Las que no se usan al
+# arrancar (spaCy, nltk, sklearn, scipy, requests, transformers, matplotlib...)
+# se importan en el primer endpoint que las necesita y quedan registradas con
+# fase "diferida".
+TIEMPOS_IMPORTACION = OrderedDict()
+_INICIO_ARRANQUE = time.perf_counter()
+_arranque_terminado = False
+
+@contextlib.contextmanager
+def medir_import(nombre):
+    if nombre in TIEMPOS_IMPORTACION:
+        yield
+        return
+    inicio = time.perf_counter()
+    yield
+    TIEMPOS_IMPORTACION[nombre] = {
+        "segundos": round(time.perf_counter() - inicio, 4),
+        "fase": "diferida" if _arranque_terminado else "arranque"
+    }
+
+with medir_import("flask"):
+    from flask import Flask, Response, request, jsonify, send_from_directory, send_file, g, has_request_context
+    from werkzeug.exceptions import RequestEntityTooLarge
+with medir_import("pandas"):
+    import pandas as pd
+with medir_import("numpy"):
+    import numpy as np
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Descargar recursos NLTK si no están
-try:
-    nltk.data.find('tokenizers/punkt')
-    nltk.data.find('corpora/stopwords')
-except LookupError:
-    nltk.download('punkt', quiet=True)
-    nltk.download('stopwords', quiet=True)
-
-# Cargar modelo de spaCy
-try:
-    nlp = spacy.load("es_core_news_sm")
-    logger.info("✅ Modelo spaCy cargado correctamente")
-except OSError:
-    logger.error("❌ Error: Instala el modelo spaCy con: python -m spacy download es_core_news_sm")
-    nlp = None
+# ================================
+# MÉTRICAS (FORMATO PROMETHEUS)
+# ================================
+
+# Se exponen en /metrics en formato de texto de Prometheus, sin cliente externo.
+# Cada proceso lleva sus propios contadores.
+LATENCIA_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+def _etiquetas(pares):
+    def escapar(valor):
+        return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return ",".join(f'{nombre}="{escapar(valor)}"' for nombre, valor in pares)
+
+class Contador:
+    """Contador monótono con etiquetas"""
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *valores, cantidad=1):
+        with self._lock:
+            self._valores[valores] = self._valores.get(valores, 0) + cantidad
+
+    def total(self):
+        with self._lock:
+            return sum(self._valores.values())
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} counter"]
+        with self._lock:
+            valores = sorted(self._valores.items())
+        if not valores and not self.etiquetas:
+            valores = [((), 0)]
+        for clave, valor in valores:
+            etiquetas = _etiquetas(zip(self.etiquetas, clave))
+            lineas.append(f"{self.nombre}{{{etiquetas}}} {valor}" if etiquetas else f"{self.nombre} {valor}")
+        return lineas
+
+class Histograma:
+    """Histograma acumulativo (le = límite superior) con una etiqueta"""
+    def __init__(self, nombre, ayuda, etiqueta, buckets=LATENCIA_BUCKETS):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiqueta = etiqueta
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, valor, segundos):
+        i = bisect.bisect_left(self.buckets, segundos)
+        with self._lock:
+            serie = self._series.get(valor)
+            if serie is None:
+                serie = self._series[valor] = {"buckets": [0] * len(self.buckets), "suma": 0.0, "total": 0}
+            if i < len(self.buckets):
+                serie["buckets"][i] += 1
+            serie["suma"] += segundos
+            serie["total"] += 1
+
+    def resumen(self):
+        """{valor de la etiqueta: (suma de segundos, observaciones)}"""
+        with self._lock:
+            return {valor: (serie["suma"], serie["total"]) for valor, serie in self._series.items()}
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        with self._lock:
+            series = sorted((valor, dict(serie, buckets=list(serie["buckets"]))) for valor, serie in self._series.items())
+        for valor, serie in series:
+            acumulado = 0
+            for limite, conteo in zip(self.buckets, serie["buckets"]):
+                acumulado += conteo
+                lineas.append(f"{self.nombre}_bucket{{{_etiquetas([(self.etiqueta, valor), ('le', limite)])}}} {acumulado}")
+            lineas.append(f"{self.nombre}_bucket{{{_etiquetas([(self.etiqueta, valor), ('le', '+Inf')])}}} {serie['total']}")
+            lineas.append(f"{self.nombre}_sum{{{_etiquetas([(self.etiqueta, valor)])}}} {round(serie['suma'], 6)}")
+            lineas.append(f"{self.nombre}_count{{{_etiquetas([(self.etiqueta, valor)])}}} {serie['total']}")
+        return lineas
+
+METRICA_ETAPAS = Histograma("app_stage_duration_seconds", "Duración de cada etapa del pipeline", "stage")
+METRICA_PETICIONES = Contador("app_http_requests_total", "Peticiones HTTP por endpoint y código", ("endpoint", "status"))
+METRICA_LATENCIA_HTTP = Histograma("app_http_request_duration_seconds", "Latencia de las peticiones HTTP por endpoint", "endpoint")
+METRICA_AUDIO_SEGUNDOS = Contador("app_audio_seconds_transcribed_total", "Segundos de audio transcritos")
+METRICA_WHISPER_SEGUNDOS = Contador("app_whisper_wall_seconds_total", "Segundos de reloj dedicados a transcribir ese audio")
+
+@contextlib.contextmanager
+def medir_etapa(etapa):
+    """Observa la duración del bloque (o de la función decorada) en app_stage_duration_seconds"""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        METRICA_ETAPAS.observe(etapa, time.perf_counter() - inicio)
+
+@functools.lru_cache(maxsize=None)
+def cargar_nltk():
+    """Importa nltk y descarga punkt/stopwords sólo si aún no están instalados"""
+    with medir_import("nltk"):
+        import nltk
+    try:
+        nltk.data.find('tokenizers/punkt')
+        nltk.data.find('corpora/stopwords')
+    except LookupError:
+        nltk.download('punkt', quiet=True)
+        nltk.download('stopwords', quiet=True)
+    return nltk
+
+@functools.lru_cache(maxsize=None)
+def stopwords_es():
+    cargar_nltk()
+    from nltk.corpus import stopwords
+    try:
+        return frozenset(stopwords.words('spanish'))
+    except LookupError:
+        return frozenset()
+
+# Modelo de spaCy (se carga una sola vez por proceso, al primer uso)
+SPACY_MODEL = os.environ.get("SPACY_MODEL", "es_core_news_sm")
+
+class SpacyModelHolder:
+    """Mantiene un único modelo de spaCy compartido por todo el proceso"""
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self._nlp = None
+        self._intentado = False
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._nlp is not None
+
+    def get(self):
+        """Devuelve el modelo (o None si no está instalado), cargándolo la primera vez"""
+        if not self._intentado:
+            with self._lock:
+                if not self._intentado:
+                    with medir_import("spacy"):
+                        import spacy
+                    try:
+                        with medir_import(f"spacy.load({self.model_name})"):
+                            self._nlp = spacy.load(self.model_name)
+                        logger.info("✅ Modelo spaCy cargado correctamente")
+                    except OSError:
+                        logger.error(f"❌ Error: Instala el modelo spaCy con: python -m spacy download {self.model_name}")
+                    self._intentado = True
+        return self._nlp
+
+modelo_spacy = SpacyModelHolder(SPACY_MODEL)
 
 app = Flask(__name__, static_folder=".", static_url_path="")
 app.config['MAX_CONTENT_LENGTH'] = 45 * 1024 * 1024  # 45MB
 
 # Configuración de directorios
-BASE_DIR = '/home/josfel/Documents/Python/flask-whisper-transcription'
+BASE_DIR = os.environ.get("BASE_DIR", '/home/josfel/Documents/Python/flask-whisper-transcription')
 UPLOAD_FOLDER = os.path.join(BASE_DIR, 'uploads')
 TRANSCRIPTS_FOLDER = os.path.join(BASE_DIR, 'Transcripts_txt')
 RESULTS_FOLDER = os.path.join(BASE_DIR, 'results')
@@ -65,22 +241,196 @@ WHISPER_MODEL = '/home/josfel/whisper.cpp/models/ggml-small.bin'
 for folder in [UPLOAD_FOLDER, TRANSCRIPTS_FOLDER, RESULTS_FOLDER, TEXTOS_FOLDER, JOBS_FOLDER]:
     os.makedirs(folder, exist_ok=True)
 
+# ================================
+# ALMACENAMIENTO DE TRABAJOS
+# ================================
+
+# sqlite: compartido entre procesos (gunicorn) y sobrevive reinicios
+# memory: diccionario en memoria del proceso (modo original)
+JOB_STORE = os.environ.get("JOB_STORE", "sqlite")
+JOB_STORE_PATH = os.environ.get("JOB_STORE_PATH", os.path.join(BASE_DIR, "jobs.db"))
+JOB_TTL_SECONDS = 3600  # 1 hora, contada desde que el trabajo termina
+# Identificador de este arranque: los trabajos activos de un arranque anterior quedaron huérfanos.
+# Con varios workers de gunicorn hay que compartirlo: --preload (se genera antes del fork) o INSTANCE_ID
+INSTANCIA_ID = os.environ.get("INSTANCE_ID") or uuid.uuid4().hex
+# Los trabajos en estos estados no expiran: el TTL empieza al pasar a completed/failed
+ESTADOS_ACTIVOS = ("queued", "processing")
+
+class MemoryJobStore:
+    """Trabajos en un diccionario del proceso"""
+    nombre = "memory"
+
+    def __init__(self, ttl=JOB_TTL_SECONDS):
+        self.ttl = ttl
+        self._jobs = {}
+        self._expira = {}
+        self._lock = threading.Lock()
+
+    def create(self, job_id, data):
+        with self._lock:
+            self._jobs[job_id] = dict(data)
+            self._expira[job_id] = data.get("start_time", time.time()) + self.ttl
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def update(self, job_id, **campos):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(campos)
+                if "status" in campos and campos["status"] not in ESTADOS_ACTIVOS:
+                    self._expira[job_id] = time.time() + self.ttl
+
+    def delete(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+            self._expira.pop(job_id, None)
+
+    def expired(self, now):
+        with self._lock:
+            return [job_id for job_id, job in self._jobs.items()
+                    if job.get("status") not in ESTADOS_ACTIVOS and self._expira[job_id] < now]
+
+    def count(self, status=None):
+        with self._lock:
+            if status is None:
+                return len(self._jobs)
+            return sum(1 for job in self._jobs.values() if job.get("status") == status)
+
+    def __contains__(self, job_id):
+        with self._lock:
+            return job_id in self._jobs
+
+    def __len__(self):
+        return self.count()
+
+class SqliteJobStore:
+    """Trabajos en SQLite (modo WAL) para compartirlos entre procesos y reinicios"""
+    nombre = "sqlite"
+
+    def __init__(self, path, ttl=JOB_TTL_SECONDS, instancia=INSTANCIA_ID):
+        self.path = path
+        self.ttl = ttl
+        self.instancia = instancia
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                start_time REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                pid INTEGER,
+                data TEXT NOT NULL,
+                instancia TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status);
+            CREATE INDEX IF NOT EXISTS idx_jobs_expires_at ON jobs(expires_at);
+        """)
+        # Bases creadas antes de guardar la instancia
+        columnas = [fila[1] for fila in conn.execute("PRAGMA table_info(jobs)")]
+        if "instancia" not in columnas:
+            conn.execute("ALTER TABLE jobs ADD COLUMN instancia TEXT")
+        self._recover_orphans()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA busy_timeout=30000")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _recover_orphans(self):
+        """Marca como fallidos los trabajos activos de otro arranque (su cola en memoria ya no existe)"""
+        filas = self._conn().execute(
+            "SELECT job_id FROM jobs WHERE status IN ('queued', 'processing') "
+            "AND (instancia IS NULL OR instancia != ?)", (self.instancia,)
+        ).fetchall()
+        for (job_id,) in filas:
+            self.update(job_id, status="failed", progress=0,
+                        error="El trabajo se interrumpió por un reinicio del servidor")
+
+    def create(self, job_id, data):
+        data = dict(data)
+        start_time = data.get("start_time", time.time())
+        self._conn().execute(
+            "INSERT OR REPLACE INTO jobs (job_id, status, start_time, expires_at, pid, data, instancia) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (job_id, data.get("status", "queued"), start_time, start_time + self.ttl, os.getpid(), json.dumps(data),
+             self.instancia)
+        )
+
+    def get(self, job_id):
+        fila = self._conn().execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(fila[0]) if fila else None
+
+    def update(self, job_id, **campos):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            fila = conn.execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if fila:
+                data = json.loads(fila[0])
+                data.update(campos)
+                conn.execute(
+                    "UPDATE jobs SET status = ?, data = ? WHERE job_id = ?",
+                    (data.get("status"), json.dumps(data), job_id)
+                )
+                if "status" in campos and campos["status"] not in ESTADOS_ACTIVOS:
+                    conn.execute("UPDATE jobs SET expires_at = ? WHERE job_id = ?", (time.time() + self.ttl, job_id))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def delete(self, job_id):
+        self._conn().execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+
+    def expired(self, now):
+        filas = self._conn().execute(
+            "SELECT job_id FROM jobs WHERE expires_at < ? AND status NOT IN ('queued', 'processing')", (now,)
+        )
+        return [fila[0] for fila in filas.fetchall()]
+
+    def count(self, status=None):
+        if status is None:
+            return self._conn().execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+        return self._conn().execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (status,)).fetchone()[0]
+
+    def __contains__(self, job_id):
+        return self._conn().execute("SELECT 1 FROM jobs WHERE job_id = ?", (job_id,)).fetchone() is not None
+
+    def __len__(self):
+        return self.count()
+
+def crear_job_store(modo=JOB_STORE):
+    if modo == "memory":
+        return MemoryJobStore()
+    return SqliteJobStore(JOB_STORE_PATH)
+
 # Almacenamiento para los trabajos
-jobs = {}
+jobs = crear_job_store()
 
 def clean_old_jobs():
-    """Limpia trabajos antiguos (más de 1 hora)"""
-    current_time = time.time()
+    """Limpia trabajos terminados hace más de 1 hora"""
     expired_jobs = []
-    for job_id, job_data in jobs.items():
-        if current_time - job_data.get('start_time', 0) > 3600:  # 1 hora
-            expired_jobs.append(job_id)
-            # Limpiar directorio del job
-            job_dir = os.path.join(JOBS_FOLDER, job_id)
-            if os.path.exists(job_dir):
-                shutil.rmtree(job_dir, ignore_errors=True)
-    for job_id in expired_jobs:
-        del jobs[job_id]
+    for job_id in jobs.expired(time.time()):
+        # Un lote vive mientras quede alguno de sus clips (los clips expiran al terminar + TTL)
+        grupo = jobs.get(job_id)
+        if grupo and grupo.get("tipo") == "lote" and any(clip in jobs for clip in grupo["jobs"]):
+            continue
+        expired_jobs.append(job_id)
+        # Limpiar directorio del job
+        job_dir = os.path.join(JOBS_FOLDER, job_id)
+        if os.path.exists(job_dir):
+            shutil.rmtree(job_dir, ignore_errors=True)
+        jobs.delete(job_id)
     logger.info(f"Limpiados {len(expired_jobs)} trabajos expirados")
 
 def get_next_opinion_number():
@@ -93,6 +443,7 @@ def get_next_opinion_number():
     numeros = [int(re.search(r"\d{3}", f).group()) for f in existentes]
     return max(numeros) + 1
 
+@medir_etapa("ffmpeg")
 def convert_audio_to_wav(input_path, output_path):
     """Convierte audio a WAV 16kHz mono usando ffmpeg"""
     try:
@@ -113,7 +464,8 @@ def convert_audio_to_wav(input_path, output_path):
         )
         return True, None
     except subprocess.CalledProcessError as e:
-        return False, f"Error en conversión: {e.stderr}"
+        # El prefijo "Error en conversión:" lo pone quien informa del fallo
+        return False, e.stderr.strip()
     except Exception as e:
         return False, f"Error inesperado: {str(e)}"
 
@@ -133,21 +485,748 @@ def check_wav_format(wav_path):
     except:
         return False
 
-def process_audio_background(job_id, file_path, original_filename):
+# ================================
+# DETECCIÓN DE FORMATO EN PROCESO
+# ================================
+
+PROBE_CACHE_SIZE = 1024
+_probe_cache = OrderedDict()
+_probe_cache_lock = threading.Lock()
+
+def hash_archivo(path, chunk_size=1024 * 1024):
+    """SHA-256 del contenido de un archivo"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for bloque in iter(lambda: f.read(chunk_size), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+def _probe_wav(f):
+    cabecera = f.read(12)
+    if len(cabecera) < 12 or cabecera[:4] != b"RIFF" or cabecera[8:12] != b"WAVE":
+        return None
+    info = None
+    while True:
+        chunk = f.read(8)
+        if len(chunk) < 8:
+            return info
+        chunk_id, chunk_size = chunk[:4], struct.unpack("<I", chunk[4:])[0]
+        if chunk_id == b"data" and info:
+            # Duración a partir del tamaño del bloque de datos (0xFFFFFFFF: WAV en streaming, desconocida)
+            bytes_por_segundo = info["sample_rate"] * info["channels"] * info["bits"] // 8
+            if bytes_por_segundo and chunk_size != 0xFFFFFFFF:
+                info["duracion"] = chunk_size / bytes_por_segundo
+            return info
+        if chunk_id == b"fmt ":
+            fmt = f.read(min(chunk_size, 40))
+            if len(fmt) < 16:
+                return None
+            audio_format, channels, sample_rate = struct.unpack("<HHI", fmt[:8])
+            bits = struct.unpack("<H", fmt[14:16])[0]
+            # WAVE_FORMAT_EXTENSIBLE: el códec real está en el subformato
+            if audio_format == 0xFFFE and len(fmt) >= 26:
+                audio_format = struct.unpack("<H", fmt[24:26])[0]
+            codec = "pcm" if audio_format == 1 else f"wav-{audio_format}"
+            info = {"formato": "wav", "codec": codec, "sample_rate": sample_rate, "channels": channels, "bits": bits}
+            f.seek(chunk_size - len(fmt) + (chunk_size & 1), os.SEEK_CUR)
+            continue
+        f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+
+def _saltar_id3(f):
+    cabecera = f.read(10)
+    if cabecera[:3] == b"ID3" and len(cabecera) == 10:
+        tam = cabecera[6:10]
+        f.seek(10 + ((tam[0] << 21) | (tam[1] << 14) | (tam[2] << 7) | tam[3]))
+    else:
+        f.seek(0)
+
+def _probe_flac(f):
+    _saltar_id3(f)
+    if f.read(4) != b"fLaC":
+        return None
+    bloque = f.read(4)
+    if len(bloque) < 4 or bloque[0] & 0x7F != 0:
+        return None
+    info = f.read(18)
+    if len(info) < 18:
+        return None
+    # STREAMINFO: 20 bits sample rate, 3 bits canales-1, 5 bits bits-1, 36 bits muestras totales
+    valor = int.from_bytes(info[10:18], "big")
+    sample_rate = valor >> 44
+    channels = ((valor >> 41) & 0x7) + 1
+    bits = ((valor >> 36) & 0x1F) + 1
+    muestras = valor & 0xFFFFFFFFF
+    resultado = {"formato": "flac", "codec": "flac", "sample_rate": sample_rate, "channels": channels, "bits": bits}
+    if sample_rate and muestras:
+        resultado["duracion"] = muestras / sample_rate
+    return resultado
+
+def _probe_ogg(f):
+    pagina = f.read(27)
+    if len(pagina) < 27 or pagina[:4] != b"OggS":
+        return None
+    segmentos = f.read(pagina[26])
+    paquete = f.read(min(sum(segmentos), 64))
+    if paquete[:7] == b"\x01vorbis" and len(paquete) >= 16:
+        channels = paquete[11]
+        sample_rate = struct.unpack("<I", paquete[12:16])[0]
+        return {"formato": "ogg", "codec": "vorbis", "sample_rate": sample_rate, "channels": channels}
+    if paquete[:8] == b"OpusHead" and len(paquete) >= 16:
+        # Opus siempre se decodifica a 48 kHz
+        return {"formato": "ogg", "codec": "opus", "sample_rate": 48000, "channels": paquete[9]}
+    if paquete[:5] == b"\x7fFLAC":
+        return {"formato": "ogg", "codec": "flac-ogg", "sample_rate": None, "channels": None}
+    return None
+
+def probe_audio(path, file_hash=None):
+    """Lee la cabecera WAV/FLAC/OGG sin lanzar ffprobe; None si no se reconoce.
+
+    Los resultados se guardan por hash de contenido para no repetir la lectura.
+    """
+    file_hash = file_hash or hash_archivo(path)
+    with _probe_cache_lock:
+        if file_hash in _probe_cache:
+            _probe_cache.move_to_end(file_hash)
+            return _probe_cache[file_hash]
+    info = None
+    try:
+        with open(path, "rb") as f:
+            for parser in (_probe_wav, _probe_flac, _probe_ogg):
+                f.seek(0)
+                info = parser(f)
+                if info:
+                    break
+    except (OSError, struct.error):
+        info = None
+    with _probe_cache_lock:
+        _probe_cache[file_hash] = info
+        while len(_probe_cache) > PROBE_CACHE_SIZE:
+            _probe_cache.popitem(last=False)
+    return info
+
+def duracion_audio(path, file_hash=None):
+    """Duración en segundos desde la cabecera (WAV/FLAC) o con ffprobe; None si no se puede saber"""
+    info = probe_audio(path, file_hash)
+    if info and info.get("duracion"):
+        return info["duracion"]
+    try:
+        salida = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration",
+             "-of", "default=noprint_wrappers=1:nokey=1", path],
+            capture_output=True, text=True, timeout=30
+        ).stdout.strip()
+        return float(salida)
+    except (OSError, subprocess.SubprocessError, ValueError):
+        return None
+
+@medir_etapa("ffprobe")
+def audio_listo_para_whisper(path, necesita_wav=False, file_hash=None):
+    """True si el audio ya es 16kHz mono y whisper puede leerlo sin pasar por ffmpeg"""
+    info = probe_audio(path, file_hash)
+    if info is None:
+        # Cabecera no reconocida: para .wav se conserva la verificación con ffprobe
+        return path.lower().endswith(".wav") and check_wav_format(path)
+    if info["sample_rate"] != 16000 or info["channels"] != 1:
+        return False
+    if info["codec"] == "pcm":
+        return True
+    # whisper.cpp decodifica FLAC y Vorbis por sí mismo; el corte por ventanas necesita WAV
+    return info["codec"] in ("flac", "vorbis") and not necesita_wav
+
+# ================================
+# BACKENDS DE TRANSCRIPCIÓN
+# ================================
+
+# cli: un whisper-cli por trabajo (modo original)
+# server: uno o varios whisper-server ya levantados (WHISPER_SERVER_URLS)
+# pool: la app levanta WHISPER_POOL_SIZE procesos whisper-server con el modelo en memoria
+WHISPER_BACKEND = os.environ.get("WHISPER_BACKEND", "cli")
+WHISPER_LANGUAGE = "es"
+WHISPER_SERVER_BINARY = os.environ.get("WHISPER_SERVER_BINARY", "/home/josfel/whisper.cpp/build/bin/whisper-server")
+WHISPER_SERVER_URLS = [u.strip() for u in os.environ.get("WHISPER_SERVER_URLS", "http://127.0.0.1:8080").split(",") if u.strip()]
+WHISPER_SERVER_TIMEOUT = int(os.environ.get("WHISPER_SERVER_TIMEOUT", "600"))
+WHISPER_POOL_SIZE = int(os.environ.get("WHISPER_POOL_SIZE", "2"))
+WHISPER_POOL_HOST = "127.0.0.1"
+# 0: cada proceso pide puertos libres al sistema (varios workers de gunicorn no chocan).
+# Un valor fijo usa base_port + i y sólo sirve con un único proceso.
+WHISPER_POOL_BASE_PORT = int(os.environ.get("WHISPER_POOL_BASE_PORT", "0"))
+# Streaming: ffmpeg escribe PCM a una tubería que consume whisper, sin WAV temporal
+STREAM_AUDIO = os.environ.get("STREAM_AUDIO", "0") == "1"
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Línea de progreso de whisper-cli -pp: "whisper_print_progress_callback: progress =  40%"
+WHISPER_PROGRESS_RE = re.compile(r"progress\s*=\s*(\d+)%")
+
+class BackendNoDisponible(Exception):
+    """El backend no pudo atender el trabajo (servidor caído, sin procesos, etc.)"""
+
+class CliBackend:
+    """Ejecuta whisper-cli una vez por trabajo (carga el modelo en cada llamada)"""
+    nombre = "cli"
+
+    def available(self):
+        return os.path.exists(WHISPER_BINARY) and os.path.exists(WHISPER_MODEL)
+
+    def preparar(self):
+        """Verifica que el backend puede atender trabajos (usado por el calentamiento)"""
+        if not self.available():
+            raise BackendNoDisponible(f"Falta whisper-cli ({WHISPER_BINARY}) o el modelo ({WHISPER_MODEL})")
+
+    def _run(self, entrada, output_prefix, threads=None, progress_cb=None, stdin=None):
+        if not os.path.exists(WHISPER_BINARY):
+            raise Exception(f"No se encontró whisper-cli en: {WHISPER_BINARY}")
+        if not os.path.exists(WHISPER_MODEL):
+            raise Exception(f"No se encontró el modelo en: {WHISPER_MODEL}")
+        cmd = [
+            WHISPER_BINARY,
+            "-m", WHISPER_MODEL,
+            "-f", entrada,
+            "-l", WHISPER_LANGUAGE,
+            "-otxt",
+            "-of", output_prefix
+        ]
+        if threads:
+            cmd += ["-t", str(threads)]
+        if progress_cb:
+            cmd.append("-pp")
+        logger.info(f"Ejecutando Whisper: {' '.join(cmd)}")
+        # El texto se lee del .txt; stderr se recorre línea a línea para el progreso
+        proceso = subprocess.Popen(
+            cmd,
+            stdin=stdin,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+            errors="replace"
+        )
+        errores = deque(maxlen=50)
+        for linea in proceso.stderr:
+            errores.append(linea)
+            if progress_cb:
+                match = WHISPER_PROGRESS_RE.search(linea)
+                if match:
+                    progress_cb(int(match.group(1)))
+        returncode = proceso.wait()
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, cmd, None, "".join(errores))
+        texto_path = output_prefix + ".txt"
+        if not os.path.exists(texto_path):
+            raise Exception(f"No se generó el archivo de transcripción: {texto_path}")
+        with open(texto_path, "r", encoding="utf-8") as f:
+            return f.read().strip()
+
+    def transcribe(self, wav_path, output_prefix, threads=None, progress_cb=None):
+        return self._run(wav_path, output_prefix, threads, progress_cb)
+
+    def transcribe_pipe(self, stream, output_prefix, threads=None, progress_cb=None):
+        """Transcribe el WAV que llega por stream (p. ej. la salida de ffmpeg) vía stdin"""
+        # La tubería del sistema entre ffmpeg y whisper hace de buffer acotado
+        return self._run("-", output_prefix, threads, progress_cb, stdin=stream)
+
+    def close(self):
+        pass
+
+class ServerBackend:
+    """Envía los trabajos a servidores whisper.cpp con el modelo ya cargado.
+
+    Cada servidor atiende un trabajo a la vez; si todos están ocupados el
+    trabajo espera a que se libere alguno.
+    """
+    nombre = "server"
+
+    def __init__(self, urls):
+        self.urls = list(urls)
+        self._libres = queue.Queue()
+        for url in self.urls:
+            self._libres.put(url)
+
+    def available(self):
+        return any(self._responde(url) for url in self.urls)
+
+    def preparar(self):
+        if not self.available():
+            raise BackendNoDisponible(f"Ningún servidor whisper responde: {', '.join(self.urls)}")
+
+    def _responde(self, url):
+        parsed = urlparse(url)
+        try:
+            with socket.create_connection((parsed.hostname, parsed.port or 80), timeout=1):
+                return True
+        except OSError:
+            return False
+
+    def _post(self, **kwargs):
+        try:
+            url = self._libres.get(timeout=WHISPER_SERVER_TIMEOUT)
+        except queue.Empty:
+            raise BackendNoDisponible("No hay servidores whisper libres")
+        with medir_import("requests"):
+            import requests
+        try:
+            resp = requests.post(url.rstrip("/") + "/inference", timeout=WHISPER_SERVER_TIMEOUT, **kwargs)
+        except requests.ConnectionError as e:
+            raise BackendNoDisponible(f"Servidor whisper no disponible en {url}: {e}")
+        finally:
+            self._libres.put(url)
+        if resp.status_code != 200:
+            raise Exception(f"Error del servidor whisper ({resp.status_code}): {resp.text[:200]}")
+        return resp.json().get("text", "").strip()
+
+    def transcribe(self, wav_path, output_prefix, threads=None, progress_cb=None):
+        # whisper-server no informa progreso parcial
+        with open(wav_path, "rb") as f:
+            return self._post(
+                files={"file": (os.path.basename(wav_path), f, "audio/wav")},
+                data={"language": WHISPER_LANGUAGE, "response_format": "json", "temperature": "0.0"}
+            )
+
+    def transcribe_pipe(self, stream, output_prefix, threads=None, progress_cb=None):
+        """Sube el WAV que llega por stream como multipart en trozos (transfer-encoding chunked)"""
+        boundary = uuid.uuid4().hex
+        campos = {"language": WHISPER_LANGUAGE, "response_format": "json", "temperature": "0.0"}
+
+        def cuerpo():
+            for nombre, valor in campos.items():
+                yield (f"--{boundary}\r\nContent-Disposition: form-data; name=\"{nombre}\"\r\n\r\n{valor}\r\n").encode()
+            yield (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"audio.wav\"\r\n"
+                   f"Content-Type: audio/wav\r\n\r\n").encode()
+            while True:
+                trozo = stream.read(STREAM_CHUNK_SIZE)
+                if not trozo:
+                    break
+                yield trozo
+            yield f"\r\n--{boundary}--\r\n".encode()
+
+        return self._post(data=cuerpo(), headers={"Content-Type": f"multipart/form-data; boundary={boundary}"})
+
+    def close(self):
+        pass
+
+class PoolBackend(ServerBackend):
+    """Levanta N procesos whisper-server residentes y reparte los trabajos entre ellos"""
+    nombre = "pool"
+
+    def __init__(self, size, binary, model, host=WHISPER_POOL_HOST, base_port=WHISPER_POOL_BASE_PORT):
+        self.binary = binary
+        self.model = model
+        self.host = host
+        self.size = size
+        self.base_port = base_port
+        self.procesos = []
+        # Las URLs se fijan al arrancar los servidores, con los puertos de este proceso
+        super().__init__([])
+        self._lock = threading.Lock()
+        self._iniciado = False
+
+    def _puertos(self):
+        """base_port + i, o puertos libres elegidos por el sistema si base_port es 0"""
+        if self.base_port:
+            return [self.base_port + i for i in range(self.size)]
+        reservas = []
+        try:
+            for _ in range(self.size):
+                reserva = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                reserva.bind((self.host, 0))
+                reservas.append(reserva)
+            return [reserva.getsockname()[1] for reserva in reservas]
+        finally:
+            for reserva in reservas:
+                reserva.close()
+
+    def _iniciar(self):
+        with self._lock:
+            if self._iniciado:
+                return
+            if not os.path.exists(self.binary):
+                raise BackendNoDisponible(f"No se encontró whisper-server en: {self.binary}")
+            urls = [f"http://{self.host}:{port}" for port in self._puertos()]
+            # Si ya responde algo en el puerto, el sondeo de abajo lo confundiría con nuestro servidor
+            ocupados = [url for url in urls if self._responde(url)]
+            if ocupados:
+                raise BackendNoDisponible(f"Puerto ya en uso por otro proceso: {', '.join(ocupados)}")
+            self.urls = urls
+            self._libres = queue.Queue()
+            for url in urls:
+                self._libres.put(url)
+            for url in self.urls:
+                port = urlparse(url).port
+                cmd = [
+                    self.binary,
+                    "-m", self.model,
+                    "-l", WHISPER_LANGUAGE,
+                    "--host", self.host,
+                    "--port", str(port)
+                ]
+                logger.info(f"Iniciando whisper-server: {' '.join(cmd)}")
+                self.procesos.append(subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+            limite = time.time() + 60
+            pendientes = list(self.urls)
+            while pendientes and time.time() < limite:
+                self._comprobar_procesos()
+                pendientes = [u for u in pendientes if not self._responde(u)]
+                if pendientes:
+                    time.sleep(0.2)
+            if pendientes:
+                self.close()
+                raise BackendNoDisponible(f"whisper-server no respondió: {', '.join(pendientes)}")
+            self._comprobar_procesos()
+            self._iniciado = True
+            logger.info(f"✅ Pool de {len(self.procesos)} whisper-server listo")
+
+    def _comprobar_procesos(self):
+        """Falla si alguno de nuestros whisper-server terminó (p. ej. no pudo abrir su puerto)"""
+        caidos = [f"{url} (código {p.returncode})" for url, p in zip(self.urls, self.procesos) if p.poll() is not None]
+        if caidos:
+            self.close()
+            raise BackendNoDisponible(f"whisper-server terminó al arrancar: {', '.join(caidos)}")
+
+    def available(self):
+        return self._iniciado and all(p.poll() is None for p in self.procesos)
+
+    def preparar(self):
+        self._iniciar()
+
+    def transcribe(self, wav_path, output_prefix, threads=None, progress_cb=None):
+        self._iniciar()
+        return super().transcribe(wav_path, output_prefix, threads, progress_cb)
+
+    def transcribe_pipe(self, stream, output_prefix, threads=None, progress_cb=None):
+        self._iniciar()
+        return super().transcribe_pipe(stream, output_prefix, threads, progress_cb)
+
+    def close(self):
+        for proceso in self.procesos:
+            if proceso.poll() is None:
+                proceso.terminate()
+        for proceso in self.procesos:
+            try:
+                proceso.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                proceso.kill()
+        self.procesos = []
+        self.urls = []
+        self._libres = queue.Queue()
+        self._iniciado = False
+
+def crear_backend_transcripcion(modo=WHISPER_BACKEND):
+    """Crea el backend de transcripción configurado"""
+    if modo == "server":
+        return ServerBackend(WHISPER_SERVER_URLS)
+    if modo == "pool":
+        return PoolBackend(WHISPER_POOL_SIZE, WHISPER_SERVER_BINARY, WHISPER_MODEL)
+    if modo != "cli":
+        logger.warning(f"Backend de transcripción desconocido '{modo}', se usa cli")
+    return CliBackend()
+
+transcription_backend = crear_backend_transcripcion()
+cli_backend = transcription_backend if isinstance(transcription_backend, CliBackend) else CliBackend()
+atexit.register(transcription_backend.close)
+
+def transcribir_wav(wav_path, output_prefix, threads=None, progress_cb=None):
+    """Transcribe un WAV 16kHz mono con el backend activo, usando whisper-cli como respaldo"""
+    try:
+        return transcription_backend.transcribe(wav_path, output_prefix, threads, progress_cb)
+    except BackendNoDisponible as e:
+        if transcription_backend is cli_backend:
+            raise
+        logger.warning(f"⚠️ {e}. Usando whisper-cli como respaldo")
+        return cli_backend.transcribe(wav_path, output_prefix, threads, progress_cb)
+
+def _transcribir_stream_con(backend, input_path, output_prefix, progress_cb=None):
+    cmd = [
+        "ffmpeg", "-nostdin", "-v", "error", "-i", input_path,
+        "-ar", "16000", "-ac", "1",
+        "-acodec", "pcm_s16le",
+        "-f", "wav", "-"
+    ]
+    logger.info(f"Convirtiendo en streaming: {input_path}")
+    ffmpeg = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=STREAM_CHUNK_SIZE)
+    # Leer stderr en otro hilo para que ffmpeg no se bloquee; sólo se guarda el final
+    errores = deque(maxlen=50)
+    lector = threading.Thread(
+        target=lambda: errores.extend(ffmpeg.stderr.read().decode(errors="replace").splitlines()),
+        daemon=True
+    )
+    lector.start()
+    error_transcripcion = None
+    texto = None
+    try:
+        texto = backend.transcribe_pipe(ffmpeg.stdout, output_prefix, progress_cb=progress_cb)
+    except Exception as e:
+        error_transcripcion = e
+    finally:
+        ffmpeg.stdout.close()
+    if error_transcripcion is not None and ffmpeg.poll() is None:
+        ffmpeg.kill()
+    returncode = ffmpeg.wait()
+    lector.join(timeout=5)
+    # Un fallo de ffmpeg se reporta igual que en la conversión a archivo
+    if returncode != 0 and not (error_transcripcion is not None and returncode < 0):
+        raise Exception(f"Error en conversión: {chr(10).join(errores)}")
+    if error_transcripcion is not None:
+        raise error_transcripcion
+    return texto
+
+def transcribir_audio_stream(input_path, output_prefix, progress_cb=None):
+    """Convierte con ffmpeg y transcribe al vuelo, sin escribir audio_converted.wav"""
+    try:
+        return _transcribir_stream_con(transcription_backend, input_path, output_prefix, progress_cb)
+    except BackendNoDisponible as e:
+        if transcription_backend is cli_backend:
+            raise
+        logger.warning(f"⚠️ {e}. Usando whisper-cli como respaldo")
+        return _transcribir_stream_con(cli_backend, input_path, output_prefix, progress_cb)
+
+# ================================
+# TRANSCRIPCIÓN PARALELA POR VENTANAS
+# ================================
+
+# single: una sola llamada a whisper por audio (modo original)
+# parallel: el WAV se corta en ventanas solapadas que se transcriben a la vez
+TRANSCRIPTION_MODE = os.environ.get("TRANSCRIPTION_MODE", "single")
+WINDOW_SECONDS = float(os.environ.get("WINDOW_SECONDS", "30"))
+WINDOW_OVERLAP_SECONDS = float(os.environ.get("WINDOW_OVERLAP_SECONDS", "2"))
+# WHISPER_PARALLEL_WORKERS (ventanas simultáneas por trabajo) se define con la cola de transcripción
+MAX_OVERLAP_WORDS = 30
+
+def dividir_wav(wav_path, out_dir, window_s=None, overlap_s=None):
+    """Corta un WAV en ventanas de window_s segundos que se solapan overlap_s segundos"""
+    window_s = window_s or WINDOW_SECONDS
+    overlap_s = WINDOW_OVERLAP_SECONDS if overlap_s is None else overlap_s
+    if overlap_s >= window_s:
+        raise ValueError("El solape debe ser menor que la ventana")
+    rutas = []
+    with wave.open(wav_path, "rb") as entrada:
+        params = entrada.getparams()
+        rate = entrada.getframerate()
+        total = entrada.getnframes()
+        ventana = int(window_s * rate)
+        paso = int((window_s - overlap_s) * rate)
+        inicio = 0
+        while True:
+            entrada.setpos(inicio)
+            frames = entrada.readframes(ventana)
+            ruta = os.path.join(out_dir, f"ventana_{len(rutas):04d}.wav")
+            with wave.open(ruta, "wb") as salida:
+                salida.setparams(params)
+                salida.writeframes(frames)
+            rutas.append(ruta)
+            if inicio + ventana >= total:
+                break
+            inicio += paso
+    return rutas
+
+def _normalizar_palabra(palabra):
+    return palabra.lower().strip(string.punctuation + "¡¿")
+
+def unir_transcripciones(textos, max_overlap=MAX_OVERLAP_WORDS):
+    """Une los textos de ventanas consecutivas eliminando las palabras repetidas del solape"""
+    palabras = []
+    for texto in textos:
+        nuevas = texto.split()
+        if not palabras:
+            palabras = nuevas
+            continue
+        cola = [_normalizar_palabra(p) for p in palabras[-max_overlap:]]
+        cabeza = [_normalizar_palabra(p) for p in nuevas[:max_overlap + 2]]
+        descartar = 0
+        # Busca el solape más largo; se permite que la ventana nueva empiece con un
+        # par de palabras cortadas antes de coincidir. Una sola palabra sólo cuenta
+        # justo en la frontera: más adentro suele ser una palabra común repetida
+        for k in range(min(len(cola), len(cabeza)), 0, -1):
+            for desfase in range(0, min(3 if k > 1 else 1, len(cabeza) - k + 1)):
+                if cola[-k:] == cabeza[desfase:desfase + k]:
+                    descartar = desfase + k
+                    break
+            if descartar:
+                break
+        palabras.extend(nuevas[descartar:])
+    return " ".join(palabras).strip()
+
+def transcribir_wav_paralelo(wav_path, work_dir, workers=None, progress_cb=None):
+    """Transcribe un WAV largo repartiendo sus ventanas entre varios procesos de whisper"""
+    workers = workers or WHISPER_PARALLEL_WORKERS
+    ventanas_dir = os.path.join(work_dir, "ventanas")
+    os.makedirs(ventanas_dir, exist_ok=True)
+    try:
+        ventanas = dividir_wav(wav_path, ventanas_dir)
+        if len(ventanas) == 1:
+            return transcribir_wav(wav_path, os.path.join(work_dir, "transcripcion"), progress_cb=progress_cb)
+        workers = min(workers, len(ventanas))
+        # Repartir entre los procesos simultáneos los núcleos que le tocan a este trabajo
+        threads = max(1, (os.cpu_count() or 1) // TRANSCRIPTION_WORKERS // workers)
+        logger.info(f"Transcribiendo {len(ventanas)} ventanas con {workers} workers ({threads} hilos c/u)")
+        # Progreso global = media del progreso de cada ventana
+        avance = [0] * len(ventanas)
+        avance_lock = threading.Lock()
+
+        def transcribir_ventana(i):
+            def reportar(pct):
+                with avance_lock:
+                    avance[i] = pct
+                    total = sum(avance) // len(avance)
+                if progress_cb:
+                    progress_cb(total)
+            texto = transcribir_wav(ventanas[i], ventanas[i][:-len(".wav")], threads, reportar)
+            reportar(100)
+            return texto
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            textos = list(executor.map(transcribir_ventana, range(len(ventanas))))
+        return unir_transcripciones(textos)
+    finally:
+        shutil.rmtree(ventanas_dir, ignore_errors=True)
+
+# ================================
+# CACHÉ DE TRANSCRIPCIONES
+# ================================
+
+TRANSCRIPTION_CACHE_FOLDER = os.path.join(BASE_DIR, 'cache_transcripciones')
+TRANSCRIPTION_CACHE_MAX_MB = int(os.environ.get("TRANSCRIPTION_CACHE_MAX_MB", "200"))
+
+class TranscriptionCache:
+    """Caché persistente de transcripciones direccionada por contenido.
+
+    Cada entrada es un archivo <clave>.txt; el mtime marca el último uso y se
+    expulsan las menos usadas cuando se supera el tamaño máximo.
+    """
+    def __init__(self, folder, max_bytes):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+        self._size = sum(e.stat().st_size for e in os.scandir(folder) if e.name.endswith(".txt"))
+
+    @staticmethod
+    def make_key(audio_hash, model=None, language=None):
+        """Clave = hash del audio + modelo + idioma"""
+        model = model or WHISPER_MODEL
+        language = language or WHISPER_LANGUAGE
+        return hashlib.sha256(f"{audio_hash}|{model}|-l {language}".encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.folder, f"{key}.txt")
+
+    def get(self, key):
+        path = self._path(key)
+        with self._lock:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    texto = f.read()
+                os.utime(path)
+                self.hits += 1
+                return texto
+            except OSError:
+                self.misses += 1
+                return None
+
+    def put(self, key, texto):
+        path = self._path(key)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(texto)
+        with self._lock:
+            previo = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+            self._size += os.path.getsize(path) - previo
+            self._evict()
+
+    def _evict(self):
+        if self._size <= self.max_bytes:
+            return
+        entradas = sorted(
+            (e for e in os.scandir(self.folder) if e.name.endswith(".txt")),
+            key=lambda e: e.stat().st_mtime
+        )
+        for entrada in entradas:
+            if self._size <= self.max_bytes:
+                break
+            try:
+                tam = entrada.stat().st_size
+                os.remove(entrada.path)
+                self._size -= tam
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "size_bytes": self._size,
+                "max_bytes": self.max_bytes
+            }
+
+transcription_cache = TranscriptionCache(TRANSCRIPTION_CACHE_FOLDER, TRANSCRIPTION_CACHE_MAX_MB * 1024 * 1024)
+
+@medir_etapa("upload_save")
+def copiar_con_hash(stream, destino, chunk_size=1024 * 1024):
+    """Copia un stream a disco calculando su SHA-256 en la misma pasada"""
+    h = hashlib.sha256()
+    with open(destino, "wb") as f:
+        for bloque in iter(lambda: stream.read(chunk_size), b""):
+            h.update(bloque)
+            f.write(bloque)
+    return h.hexdigest()
+
+def guardar_archivo_con_hash(archivo, destino):
+    """Guarda el archivo subido calculando su SHA-256 en la misma pasada"""
+    archivo.stream.seek(0)
+    return copiar_con_hash(archivo.stream, destino)
+
+_opinion_lock = threading.Lock()
+
+@medir_etapa("transcript_write")
+def guardar_opinion(texto):
+    """Guarda el texto como Opinion###.txt y devuelve (nombre, ruta)"""
+    # Con varios workers dos trabajos pueden terminar a la vez: el número se
+    # reserva creando el archivo en modo exclusivo
+    with _opinion_lock:
+        while True:
+            siguiente_num = get_next_opinion_number()
+            nombre_archivo = f"Opinion{siguiente_num:03d}.txt"
+            destino_path = os.path.join(TEXTOS_FOLDER, nombre_archivo)
+            try:
+                with open(destino_path, "x", encoding="utf-8") as f:
+                    f.write(texto)
+                break
+            except FileExistsError:
+                continue
+    # También guardar en Transcripts_txt para compatibilidad
+    transcript_path = os.path.join(TRANSCRIPTS_FOLDER, nombre_archivo)
+    with open(transcript_path, "w", encoding="utf-8") as f:
+        f.write(texto)
+    return nombre_archivo, destino_path
+
+def duracion_wav(path):
+    """Duración en segundos de un WAV PCM leyendo su cabecera; None si no es WAV"""
+    try:
+        with wave.open(path, "rb") as wav:
+            return wav.getnframes() / float(wav.getframerate())
+    except (wave.Error, EOFError, OSError, ZeroDivisionError):
+        return None
+
+def process_audio_background(job_id, file_path, original_filename, file_hash=None):
     """Procesa el audio en segundo plano"""
     try:
-        jobs[job_id]["status"] = "processing"
-        jobs[job_id]["progress"] = 10
+        jobs.update(job_id, status="processing", progress=10)
         job_dir = os.path.join(JOBS_FOLDER, job_id)
         os.makedirs(job_dir, exist_ok=True)
         # Mover archivo al directorio del job
         original_path = os.path.join(job_dir, original_filename)
         shutil.move(file_path, original_path)
-        jobs[job_id]["progress"] = 20
+        jobs.update(job_id, progress=20)
         # Determinar si necesita conversión
-        if original_path.lower().endswith(".wav") and check_wav_format(original_path):
+        if audio_listo_para_whisper(original_path, necesita_wav=TRANSCRIPTION_MODE == "parallel", file_hash=file_hash):
             wav_path = original_path
-            logger.info(f"Archivo WAV ya en formato correcto: {original_filename}")
+            logger.info(f"Archivo ya en formato correcto: {original_filename}")
+        elif STREAM_AUDIO and TRANSCRIPTION_MODE != "parallel":
+            # ffmpeg alimenta directamente a whisper (el modo paralelo necesita el WAV completo)
+            wav_path = None
         else:
             # Convertir a WAV 16kHz mono
             wav_path = os.path.join(job_dir, "audio_converted.wav")
@@ -155,59 +1234,139 @@ def process_audio_background(job_id, file_path, original_filename):
             success, error = convert_audio_to_wav(original_path, wav_path)
             if not success:
                 raise Exception(f"Error en conversión: {error}")
-        jobs[job_id]["progress"] = 50
-        # Verificar que existe el binario de Whisper
-        if not os.path.exists(WHISPER_BINARY):
-            raise Exception(f"No se encontró whisper-cli en: {WHISPER_BINARY}")
-        if not os.path.exists(WHISPER_MODEL):
-            raise Exception(f"No se encontró el modelo en: {WHISPER_MODEL}")
-        # Ejecutar whisper.cpp
+        jobs.update(job_id, progress=50)
+        # Ejecutar whisper.cpp con el backend configurado
         output_path = os.path.join(job_dir, "transcripcion")
-        cmd = [
-            WHISPER_BINARY,
-            "-m", WHISPER_MODEL,
-            "-f", wav_path,
-            "-l", "es",
-            "-otxt",
-            "-of", output_path
-        ]
-        logger.info(f"Ejecutando Whisper: {' '.join(cmd)}")
-        result = subprocess.run(
-            cmd, 
-            check=True,
-            capture_output=True,
-            text=True
-        )
-        jobs[job_id]["progress"] = 80
-        # Leer el resultado
-        texto_path = output_path + ".txt"
-        if not os.path.exists(texto_path):
-            raise Exception(f"No se generó el archivo de transcripción: {texto_path}")
-        with open(texto_path, "r", encoding="utf-8") as f:
-            texto = f.read().strip()
+        # El progreso de whisper (0-100) se reparte en el tramo 50-80 del trabajo
+        ultimo = {"progress": 50}
+
+        def reportar_progreso(pct):
+            progreso = 50 + int(pct * 0.3)
+            if progreso > ultimo["progress"]:
+                ultimo["progress"] = progreso
+                jobs.update(job_id, progress=progreso)
+
+        inicio_whisper = time.perf_counter()
+        with medir_etapa("whisper"):
+            if wav_path is None:
+                texto = transcribir_audio_stream(original_path, output_path, reportar_progreso)
+            elif TRANSCRIPTION_MODE == "parallel":
+                texto = transcribir_wav_paralelo(wav_path, job_dir, progress_cb=reportar_progreso)
+            else:
+                texto = transcribir_wav(wav_path, output_path, progress_cb=reportar_progreso)
+        # Audio por segundo de reloj: sólo se conoce la duración cuando whisper leyó un WAV
+        duracion = duracion_wav(wav_path) if wav_path else None
+        if duracion:
+            METRICA_AUDIO_SEGUNDOS.inc(cantidad=duracion)
+            METRICA_WHISPER_SEGUNDOS.inc(cantidad=time.perf_counter() - inicio_whisper)
+        jobs.update(job_id, progress=80)
         if not texto:
             raise Exception("La transcripción está vacía")
+        if file_hash:
+            transcription_cache.put(TranscriptionCache.make_key(file_hash), texto)
         # Guardar con nombre Opinion###.txt
-        siguiente_num = get_next_opinion_number()
-        nombre_archivo = f"Opinion{siguiente_num:03d}.txt"
-        destino_path = os.path.join(TEXTOS_FOLDER, nombre_archivo)
-        with open(destino_path, "w", encoding="utf-8") as f:
-            f.write(texto)
-        # También guardar en Transcripts_txt para compatibilidad
-        transcript_path = os.path.join(TRANSCRIPTS_FOLDER, nombre_archivo)
-        with open(transcript_path, "w", encoding="utf-8") as f:
-            f.write(texto)
-        jobs[job_id]["progress"] = 100
-        jobs[job_id]["status"] = "completed"
-        jobs[job_id]["result"] = texto
-        jobs[job_id]["filename"] = nombre_archivo
-        jobs[job_id]["file_path"] = destino_path
+        nombre_archivo, destino_path = guardar_opinion(texto)
+        finalizar_trabajo(
+            job_id,
+            progress=100,
+            status="completed",
+            result=texto,
+            filename=nombre_archivo,
+            file_path=destino_path
+        )
         logger.info(f"Transcripción completada: {nombre_archivo}")
     except Exception as e:
         logger.error(f"Error en procesamiento de audio: {str(e)}")
-        jobs[job_id]["status"] = "failed"
-        jobs[job_id]["error"] = str(e)
-        jobs[job_id]["progress"] = 0
+        finalizar_trabajo(job_id, status="failed", error=str(e), progress=0)
+
+# ================================
+# COLA DE TRANSCRIPCIÓN
+# ================================
+
+TRANSCRIPTION_WORKERS = int(os.environ.get("TRANSCRIPTION_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+TRANSCRIPTION_QUEUE_SIZE = int(os.environ.get("TRANSCRIPTION_QUEUE_SIZE", "20"))
+# Cada trabajo de la cola reparte sus ventanas sólo entre su parte de los núcleos
+WHISPER_PARALLEL_WORKERS = int(os.environ.get("WHISPER_PARALLEL_WORKERS",
+                                              max(1, (os.cpu_count() or 2) // TRANSCRIPTION_WORKERS)))
+
+class TranscriptionQueue:
+    """Cola acotada de trabajos atendida por un número fijo de hilos"""
+    def __init__(self, workers, max_size):
+        self.workers = workers
+        self.max_size = max_size
+        self._pendientes = deque()
+        self._cond = threading.Condition()
+        self._en_ejecucion = 0
+        self._hilos = []
+
+    def _iniciar_hilos(self):
+        while len(self._hilos) < self.workers:
+            hilo = threading.Thread(target=self._worker, daemon=True)
+            hilo.start()
+            self._hilos.append(hilo)
+
+    def submit(self, job_id, target, *args, temporal=None):
+        """Encola un trabajo; devuelve False si la cola está llena.
+        `temporal` es el archivo subido que se borra si el trabajo desaparece antes de ejecutarse"""
+        with self._cond:
+            if len(self._pendientes) >= self.max_size:
+                return False
+            self._iniciar_hilos()
+            self._pendientes.append((job_id, target, args, temporal))
+            self._cond.notify_all()
+            return True
+
+    def submit_wait(self, job_id, target, *args, limit=None, temporal=None):
+        """Encola esperando a que la cola baje de `limit` trabajos (por defecto, su capacidad)"""
+        limit = min(limit or self.max_size, self.max_size)
+        with self._cond:
+            while len(self._pendientes) >= limit:
+                self._cond.wait()
+            self._iniciar_hilos()
+            self._pendientes.append((job_id, target, args, temporal))
+            self._cond.notify_all()
+
+    def is_full(self):
+        with self._cond:
+            return len(self._pendientes) >= self.max_size
+
+    def position(self, job_id):
+        """Posición (1 = siguiente) del trabajo en la cola, o None si ya no está esperando"""
+        with self._cond:
+            for i, (pendiente_id, *_) in enumerate(self._pendientes):
+                if pendiente_id == job_id:
+                    return i + 1
+        return None
+
+    def depth(self):
+        with self._cond:
+            return len(self._pendientes)
+
+    def running(self):
+        with self._cond:
+            return self._en_ejecucion
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._pendientes:
+                    self._cond.wait()
+                job_id, target, args, temporal = self._pendientes.popleft()
+                self._en_ejecucion += 1
+                # Despierta a quien espera hueco en la cola (lotes)
+                self._cond.notify_all()
+            try:
+                if job_id in jobs:
+                    target(job_id, *args)
+                elif temporal and os.path.exists(temporal):
+                    os.remove(temporal)
+            except Exception as e:
+                logger.error(f"Error no controlado en el trabajo {job_id}: {str(e)}")
+            finally:
+                with self._cond:
+                    self._en_ejecucion -= 1
+
+transcription_queue = TranscriptionQueue(TRANSCRIPTION_WORKERS, TRANSCRIPTION_QUEUE_SIZE)
 
 def limpiar_texto(texto):
     """Limpia el texto para análisis TF-IDF"""
@@ -219,8 +1378,22 @@ def limpiar_texto(texto):
     texto = ' '.join(texto.split())  # Normalizar espacios
     return texto
 
+@functools.lru_cache(maxsize=None)
+def _tabla_limpieza():
+    """Tabla de translate que elimina puntuación ASCII y todo carácter con isdigit()"""
+    digitos = (chr(c) for c in range(sys.maxunicode + 1) if chr(c).isdigit())
+    return str.maketrans("", "", string.punctuation + "".join(digitos))
+
+@medir_etapa("cleaning")
+def limpiar_texto_serie(serie):
+    """Versión vectorizada de limpiar_texto para una columna completa (mismo resultado)"""
+    es_texto = serie.map(type) == str
+    limpio = serie.where(es_texto, "").astype(str)
+    return limpio.str.lower().str.translate(_tabla_limpieza()).str.split().str.join(" ")
+
 def lematizar(tokens):
     """Lematiza tokens usando spaCy"""
+    nlp = modelo_spacy.get()
     if not nlp:
         return tokens
     try:
@@ -229,6 +1402,643 @@ def lematizar(tokens):
     except:
         return tokens
 
+# Lematización por lotes con nlp.pipe
+LEMMA_BATCH_SIZE = int(os.environ.get("LEMMA_BATCH_SIZE", "256"))
+LEMMA_N_PROCESS = int(os.environ.get("LEMMA_N_PROCESS", "1"))
+# Sólo se usan los lemas: el lematizador depende del morphologizer, no de parser ni NER
+LEMMA_DISABLE = ["parser", "ner"]
+
+# ================================
+# CACHÉ DE LEMAS
+# ================================
+
+LEMMA_CACHE_PATH = os.environ.get("LEMMA_CACHE_PATH", os.path.join(BASE_DIR, "cache_lemas.db"))
+LEMMA_CACHE_MEMORY_SIZE = int(os.environ.get("LEMMA_CACHE_MEMORY_SIZE", "50000"))
+# Filas máximas en disco; al pasarse se borran las escritas hace más tiempo (0 = sin límite)
+LEMMA_CACHE_MAX_ROWS = int(os.environ.get("LEMMA_CACHE_MAX_ROWS", "1000000"))
+
+class LemmaCache:
+    """Memoización de resultados de spaCy por texto normalizado.
+
+    Dos niveles: LRU en memoria del proceso y SQLite en disco (sobrevive
+    reinicios y se comparte entre procesos). Las claves llevan el espacio de
+    nombres (tipo de resultado) y el modelo spaCy para no mezclar versiones.
+    """
+    def __init__(self, path, memory_size, max_rows=LEMMA_CACHE_MAX_ROWS):
+        self.path = path
+        self.memory_size = memory_size
+        self.max_rows = max_rows
+        self._memoria = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.hits_memoria = 0
+        self.hits_disco = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS lemas (clave TEXT PRIMARY KEY, valor TEXT NOT NULL)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _prefijo(espacio):
+        nlp = modelo_spacy.get()
+        modelo = f"{nlp.meta.get('name')}-{nlp.meta.get('version')}" if nlp else "sin-modelo"
+        return f"{espacio}|{modelo}|"
+
+    def _recordar(self, clave, valor):
+        self._memoria[clave] = valor
+        self._memoria.move_to_end(clave)
+        while len(self._memoria) > self.memory_size:
+            self._memoria.popitem(last=False)
+
+    def get_many(self, espacio, textos):
+        """Devuelve {texto: valor} para los textos que ya estaban en caché"""
+        prefijo = self._prefijo(espacio)
+        encontrados = {}
+        pendientes = []
+        with self._lock:
+            for texto in textos:
+                clave = prefijo + texto
+                if clave in self._memoria:
+                    self._memoria.move_to_end(clave)
+                    encontrados[texto] = self._memoria[clave]
+                else:
+                    pendientes.append(texto)
+            self.hits_memoria += len(encontrados)
+        conn = self._conn()
+        en_disco = {}
+        for inicio in range(0, len(pendientes), 500):
+            bloque = [prefijo + t for t in pendientes[inicio:inicio + 500]]
+            marcadores = ",".join("?" * len(bloque))
+            for clave, valor in conn.execute(f"SELECT clave, valor FROM lemas WHERE clave IN ({marcadores})", bloque):
+                en_disco[clave[len(prefijo):]] = json.loads(valor)
+        with self._lock:
+            for texto, valor in en_disco.items():
+                self._recordar(prefijo + texto, valor)
+            self.hits_disco += len(en_disco)
+            self.misses += len(pendientes) - len(en_disco)
+        encontrados.update(en_disco)
+        return encontrados
+
+    def put_many(self, espacio, valores):
+        """Guarda {texto: valor} en memoria y en disco"""
+        if not valores:
+            return
+        prefijo = self._prefijo(espacio)
+        with self._lock:
+            for texto, valor in valores.items():
+                self._recordar(prefijo + texto, valor)
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO lemas (clave, valor) VALUES (?, ?)",
+                ((prefijo + texto, json.dumps(valor, ensure_ascii=False)) for texto, valor in valores.items())
+            )
+            if self.max_rows:
+                # INSERT OR REPLACE da a cada escritura un rowid mayor que todos los anteriores:
+                # se conservan las max_rows más recientes sin tener que contar la tabla
+                conn.execute("DELETE FROM lemas WHERE rowid <= (SELECT MAX(rowid) FROM lemas) - ?", (self.max_rows,))
+
+    def stats(self):
+        with self._lock:
+            hits = self.hits_memoria + self.hits_disco
+            total = hits + self.misses
+            return {
+                "hits_memoria": self.hits_memoria,
+                "hits_disco": self.hits_disco,
+                "misses": self.misses,
+                "hit_rate": round(hits / total, 3) if total else 0.0,
+                "entradas_memoria": len(self._memoria)
+            }
+
+lemma_cache = LemmaCache(LEMMA_CACHE_PATH, LEMMA_CACHE_MEMORY_SIZE)
+
+def pipe_con_cache(espacio, textos, procesar_doc, batch_size=None, n_process=1, disable=(), progress_cb=None):
+    """Aplica procesar_doc(doc) a cada texto distinto que no esté en caché y devuelve la lista completa.
+
+    progress_cb(hechos, total), si se indica, se llama tras cada lote de batch_size textos.
+    """
+    batch_size = batch_size or LEMMA_BATCH_SIZE
+    unicos = list(dict.fromkeys(textos))
+    resultados = lemma_cache.get_many(espacio, unicos)
+    faltantes = [t for t in unicos if t not in resultados]
+    if faltantes:
+        nuevos = {}
+        docs = modelo_spacy.get().pipe(faltantes, batch_size=batch_size, n_process=n_process, disable=list(disable))
+        for i, (texto, doc) in enumerate(zip(faltantes, docs), 1):
+            nuevos[texto] = procesar_doc(doc)
+            if progress_cb and (i % batch_size == 0 or i == len(faltantes)):
+                progress_cb(len(unicos) - len(faltantes) + i, len(unicos))
+        lemma_cache.put_many(espacio, nuevos)
+        resultados.update(nuevos)
+    return [resultados[t] for t in textos], len(unicos) - len(faltantes)
+
+def progreso_tramo(progress_cb, inicio, fin):
+    """Convierte un callback de porcentaje en uno (hechos, total) que avanza entre inicio y fin"""
+    if progress_cb is None:
+        return None
+    return lambda hechos, total: progress_cb(inicio + (fin - inicio) * hechos / total if total else fin)
+
+@medir_etapa("lemmatization")
+def lematizar_lote(lista_tokens, batch_size=None, n_process=None, progress_cb=None):
+    """Lematiza muchas filas con nlp.pipe; devuelve (lemmas por fila, estadísticas)"""
+    batch_size = batch_size or LEMMA_BATCH_SIZE
+    n_process = n_process or LEMMA_N_PROCESS
+    inicio = time.perf_counter()
+    desde_cache = 0
+    nlp = modelo_spacy.get()
+    if not nlp:
+        resultado = [lematizar(tokens) for tokens in lista_tokens]
+    else:
+        disable = [nombre for nombre in LEMMA_DISABLE if nombre in nlp.pipe_names]
+        textos = [" ".join(tokens) for tokens in lista_tokens]
+        try:
+            resultado, desde_cache = pipe_con_cache(
+                "lemas", textos,
+                lambda doc: [token.lemma_ for token in doc if not token.is_space],
+                batch_size=batch_size, n_process=n_process, disable=disable, progress_cb=progress_cb
+            )
+            resultado = [list(lemmas) for lemmas in resultado]
+        except Exception as e:
+            logger.warning(f"nlp.pipe falló ({e}); se lematiza fila por fila")
+            resultado = [lematizar(tokens) for tokens in lista_tokens]
+    segundos = time.perf_counter() - inicio
+    stats = {
+        "filas": len(resultado),
+        "segundos": round(segundos, 3),
+        "filas_por_segundo": round(len(resultado) / segundos, 1) if segundos > 0 else None,
+        "batch_size": batch_size,
+        "n_process": n_process,
+        "textos_desde_cache": desde_cache
+    }
+    logger.info(f"Lematización: {stats['filas']} filas en {stats['segundos']}s ({stats['filas_por_segundo']} filas/s)")
+    return resultado, stats
+
+# Salida TF-IDF: "dense" (matriz completa en CSV/JSON) o "sparse" (.npz + top-k por documento)
+TFIDF_OUTPUT = os.environ.get("TFIDF_OUTPUT", "dense")
+TFIDF_TOP_K = 10
+TFIDF_TOP_CORPUS = 25
+
+def top_terminos_por_documento(X, feature_names, k=TFIDF_TOP_K, indices=None):
+    """Los k términos de mayor peso de cada fila de una matriz CSR"""
+    X = X.tocsr()
+    resultado = []
+    for fila in range(X.shape[0]):
+        inicio, fin = X.indptr[fila], X.indptr[fila + 1]
+        pesos = X.data[inicio:fin]
+        columnas = X.indices[inicio:fin]
+        orden = np.argsort(-pesos, kind="stable")[:k]
+        resultado.append({
+            "fila": int(indices[fila]) if indices is not None else fila,
+            "terminos": [
+                {"termino": feature_names[columnas[j]], "peso": round(float(pesos[j]), 4)}
+                for j in orden
+            ]
+        })
+    return resultado
+
+def top_terminos_corpus(X, feature_names, k=TFIDF_TOP_CORPUS):
+    """Términos con mayor peso TF-IDF medio en todo el corpus, con su frecuencia documental"""
+    X = X.tocsr()
+    return top_terminos_de_sumas(np.asarray(X.sum(axis=0)).ravel(), X.getnnz(axis=0), X.shape[0], feature_names, k)
+
+def top_terminos_de_sumas(sumas, df_docs, n_docs, feature_names, k=TFIDF_TOP_CORPUS):
+    """Como top_terminos_corpus, a partir de sumas por columna y documentos por término acumulados"""
+    medias = sumas / n_docs if n_docs else sumas
+    orden = np.argsort(-medias, kind="stable")[:k]
+    return [
+        {"termino": feature_names[j], "peso_medio": round(float(medias[j]), 4), "documentos": int(df_docs[j])}
+        for j in orden
+    ]
+
+def guardar_tfidf_sparse(X, feature_names, timestamp):
+    """Guarda la matriz como .npz y el vocabulario (orden de columnas) como JSON"""
+    with medir_import("scipy.sparse"):
+        from scipy import sparse
+    matriz_path = os.path.join(RESULTS_FOLDER, f"tfidf_results_{timestamp}.npz")
+    vocabulario_path = os.path.join(RESULTS_FOLDER, f"tfidf_vocabulario_{timestamp}.json")
+    sparse.save_npz(matriz_path, X.tocsr())
+    with open(vocabulario_path, "w", encoding="utf-8") as f:
+        json.dump(list(feature_names), f, ensure_ascii=False)
+    return matriz_path, vocabulario_path
+
+TFIDF_PARAMS = {
+    "max_features": 1000,  # Limitar características
+    "min_df": 1,
+    "max_df": 0.95,
+    "ngram_range": (1, 2)  # Incluir bigramas
+}
+
+def textos_para_tfidf(df, progress_cb=None):
+    """Limpieza, tokenización, lematización y stopwords de un DataFrame con columna RESPUESTA.
+
+    Devuelve (textos procesados, estadísticas de lematización, error); error
+    indica la etapa en la que ya no quedaron filas.
+    """
+    # Eliminar filas vacías en la columna RESPUESTA
+    df = df.dropna(subset=['RESPUESTA'])
+    if df.empty:
+        return None, None, "No hay respuestas válidas para procesar"
+    df = df[df['RESPUESTA'].astype(str).str.strip() != '']
+    if df.empty:
+        return None, None, "No hay respuestas válidas para procesar"
+    # Procesamiento de texto
+    df = df.assign(texto_original=df['RESPUESTA'].astype(str))
+    df['texto_limpio'] = limpiar_texto_serie(df['texto_original'])
+    # Filtrar textos muy cortos
+    df = df[df['texto_limpio'].str.len() > 2]
+    if df.empty:
+        return None, None, "No hay textos válidos después de la limpieza"
+    # Tokenización
+    cargar_nltk()
+    from nltk.tokenize import word_tokenize
+    df = df.assign(tokens=df['texto_limpio'].apply(word_tokenize))
+    # Lematización
+    lemmas, stats_lematizacion = lematizar_lote(df['tokens'].tolist(), progress_cb=progress_cb)
+    df['lemmas'] = lemmas
+    # Remover stopwords
+    stop_words = stopwords_es()
+    df['lemmas_sin_stopwords'] = df['lemmas'].apply(
+        lambda x: [word for word in x if word not in stop_words and len(word) > 2]
+    )
+    # Preparar textos para TF-IDF
+    textos_procesados = df['lemmas_sin_stopwords'].apply(lambda x: ' '.join(x))
+    # Filtrar textos vacíos después del procesamiento
+    textos_procesados = textos_procesados[textos_procesados.str.len() > 0]
+    if textos_procesados.empty:
+        return textos_procesados, stats_lematizacion, "No hay textos válidos después del procesamiento"
+    return textos_procesados, stats_lematizacion, None
+
+# ================================
+# TF-IDF POR BLOQUES (CSV GRANDES)
+# ================================
+
+CSV_MAX_CONTENT_LENGTH = int(os.environ.get("CSV_MAX_MB", "1024")) * 1024 * 1024
+TFIDF_CHUNK_ROWS = int(os.environ.get("TFIDF_CHUNK_ROWS", "5000"))
+# Términos (unigramas + bigramas) que se cuentan como máximo en la primera pasada
+TFIDF_MAX_TERMINOS = int(os.environ.get("TFIDF_MAX_TERMINOS", "200000"))
+TFIDF_PREVIEW_DOCS = 100
+
+class ErrorCSV(Exception):
+    """Error de contenido del CSV que se devuelve al cliente como 400"""
+
+class TfidfPorBloques:
+    """TF-IDF equivalente a TfidfVectorizer(**TFIDF_PARAMS) construido bloque a bloque.
+
+    Primera pasada: se acumulan frecuencia documental y total por término.
+    Con eso se fija el vocabulario (max_df, min_df, max_features igual que
+    sklearn) y la segunda pasada sólo transforma cada bloque.
+
+    Para acotar la memoria, si se superan max_terminos se descartan los términos
+    menos frecuentes hasta quedar en la mitad (como en lossy counting). Mientras
+    no se pode, el resultado es idéntico al de sklearn; `podado` indica si ocurrió.
+    """
+    def __init__(self, max_features=None, min_df=1, max_df=1.0, ngram_range=(1, 1), max_terminos=None):
+        self.max_features = max_features
+        self.min_df = min_df
+        self.max_df = max_df
+        self.ngram_range = ngram_range
+        self.max_terminos = max_terminos or TFIDF_MAX_TERMINOS
+        self.df_counts = Counter()
+        self.tf_counts = Counter()
+        self.n_docs = 0
+        self.podado = False
+        self.vocabulary_ = None
+        self.idf_ = None
+
+    def contar(self, textos):
+        self.n_docs += len(textos)
+        if not textos:
+            return
+        with medir_import("sklearn"):
+            from sklearn.feature_extraction.text import CountVectorizer
+        try:
+            X = CountVectorizer(ngram_range=self.ngram_range).fit(textos)
+        except ValueError:
+            return  # bloque sin términos
+        matriz = X.transform(textos)
+        for termino, df, tf in zip(X.get_feature_names_out(), matriz.getnnz(axis=0), np.asarray(matriz.sum(axis=0)).ravel()):
+            self.df_counts[termino] += int(df)
+            self.tf_counts[termino] += int(tf)
+        if len(self.tf_counts) > self.max_terminos:
+            self._podar()
+
+    def _podar(self):
+        conservar = max(self.max_terminos // 2, self.max_features or 0)
+        terminos = [t for t, _ in self.tf_counts.most_common(conservar)]
+        self.tf_counts = Counter({t: self.tf_counts[t] for t in terminos})
+        self.df_counts = Counter({t: self.df_counts[t] for t in terminos})
+        self.podado = True
+
+    @medir_etapa("tfidf_fit")
+    def fijar_vocabulario(self):
+        terminos = sorted(self.df_counts)
+        dfs = np.array([self.df_counts[t] for t in terminos], dtype=np.int64)
+        tfs = np.array([self.tf_counts[t] for t in terminos], dtype=np.int64)
+        max_doc = self.max_df if isinstance(self.max_df, numbers.Integral) else self.max_df * self.n_docs
+        min_doc = self.min_df if isinstance(self.min_df, numbers.Integral) else self.min_df * self.n_docs
+        mask = (dfs <= max_doc) & (dfs >= min_doc)
+        if self.max_features is not None and mask.sum() > self.max_features:
+            mask_inds = (-tfs[mask]).argsort()[:self.max_features]
+            nueva = np.zeros(len(dfs), dtype=bool)
+            nueva[np.where(mask)[0][mask_inds]] = True
+            mask = nueva
+        if not mask.any():
+            raise ValueError("After pruning, no terms remain. Try a lower min_df or a higher max_df.")
+        conservados = [t for t, m in zip(terminos, mask) if m]
+        self.vocabulary_ = {t: i for i, t in enumerate(conservados)}
+        self.idf_ = np.log((1 + self.n_docs) / (1 + dfs[mask])) + 1
+        return conservados
+
+    def transformar(self, textos):
+        from sklearn.feature_extraction.text import CountVectorizer
+        from sklearn.preprocessing import normalize
+        with medir_import("scipy.sparse"):
+            from scipy import sparse
+        conteos = CountVectorizer(ngram_range=self.ngram_range, vocabulary=self.vocabulary_).transform(textos)
+        X = conteos.astype(np.float64) @ sparse.diags(self.idf_)
+        return normalize(sparse.csr_matrix(X), norm="l2", copy=False)
+
+def procesar_csv_por_bloques(origen, chunk_rows=None, top_k=TFIDF_TOP_K, progress_cb=None):
+    """TF-IDF de un CSV sin cargarlo completo en memoria.
+
+    Los textos ya procesados se guardan en un archivo temporal (uno por línea).
+    La matriz se escribe bloque a bloque como fragmentos .npz en un directorio
+    (bloque_00000.npz, ...; apilados en orden forman la matriz completa), así que
+    nunca está entera en memoria; los top-k de cada documento van a un .jsonl,
+    los del corpus salen de sumas por columna y la respuesta sólo incluye una muestra.
+    """
+    with medir_import("scipy.sparse"):
+        from scipy import sparse
+    chunk_rows = chunk_rows or TFIDF_CHUNK_ROWS
+    progress_cb = progress_cb or (lambda pct: None)
+    origen.seek(0, os.SEEK_END)
+    tam_total = origen.tell() or 1
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    fd, textos_path = tempfile.mkstemp(prefix="tfidf_textos_", suffix=".tsv", dir=JOBS_FOLDER)
+    os.close(fd)
+    try:
+        for encoding in ("utf-8", "latin-1"):
+            tfidf = TfidfPorBloques(**TFIDF_PARAMS)
+            filas = 0
+            stats = {"filas": 0, "segundos": 0.0}
+            origen.seek(0)
+            try:
+                bloques = pd.read_csv(origen, encoding=encoding, chunksize=chunk_rows)
+                with open(textos_path, "w", encoding="utf-8") as salida:
+                    for bloque in bloques:
+                        if bloque.shape[1] < 2:
+                            raise ErrorCSV("El CSV debe tener al menos dos columnas")
+                        filas += len(bloque)
+                        bloque = bloque.rename(columns={bloque.columns[1]: "RESPUESTA"})
+                        textos, stats_bloque, _ = textos_para_tfidf(bloque)
+                        if stats_bloque:
+                            stats["filas"] += stats_bloque["filas"]
+                            stats["segundos"] += stats_bloque["segundos"]
+                        if textos is None or textos.empty:
+                            continue
+                        for idx, texto in textos.items():
+                            salida.write(f"{idx}\t{texto.replace(chr(10), ' ')}\n")
+                        tfidf.contar(textos.tolist())
+                        # Primera pasada: 0-80% según lo leído del archivo
+                        progress_cb(80 * min(origen.tell(), tam_total) / tam_total)
+                break
+            except UnicodeDecodeError:
+                # La codificación puede fallar a mitad del archivo: se repite la pasada
+                continue
+            except pd.errors.EmptyDataError:
+                raise ErrorCSV("El archivo CSV está vacío")
+        else:
+            raise ErrorCSV("No se pudo leer el archivo CSV. Verifica la codificación.")
+        if filas == 0:
+            raise ErrorCSV("El archivo CSV está vacío")
+        if tfidf.n_docs == 0:
+            raise ErrorCSV("No hay textos válidos después del procesamiento")
+        try:
+            feature_names = tfidf.fijar_vocabulario()
+        except ValueError as e:
+            raise ErrorCSV(f"Error en vectorización TF-IDF: {str(e)}")
+        # Segunda pasada sobre los textos ya procesados (no sobre el CSV)
+        muestra = []
+        sumas = np.zeros(len(feature_names))
+        df_docs = np.zeros(len(feature_names), dtype=np.int64)
+        procesadas = nnz = bloques_escritos = 0
+        matriz_path = os.path.join(RESULTS_FOLDER, f"tfidf_results_{timestamp}")
+        os.makedirs(matriz_path, exist_ok=True)
+        vocabulario_path = os.path.join(RESULTS_FOLDER, f"tfidf_vocabulario_{timestamp}.json")
+        with open(vocabulario_path, "w", encoding="utf-8") as f:
+            json.dump(list(feature_names), f, ensure_ascii=False)
+        top_path = os.path.join(RESULTS_FOLDER, f"tfidf_top_terminos_{timestamp}.jsonl")
+        with open(textos_path, "r", encoding="utf-8") as entrada, open(top_path, "w", encoding="utf-8") as top_salida:
+            while True:
+                lineas = list(itertools.islice(entrada, chunk_rows))
+                if not lineas:
+                    break
+                indices, textos = zip(*(linea.rstrip("\n").split("\t", 1) for linea in lineas))
+                X_bloque = tfidf.transformar(list(textos))
+                sparse.save_npz(os.path.join(matriz_path, f"bloque_{bloques_escritos:05d}.npz"), X_bloque)
+                bloques_escritos += 1
+                sumas += np.asarray(X_bloque.sum(axis=0)).ravel()
+                df_docs += X_bloque.getnnz(axis=0)
+                procesadas += X_bloque.shape[0]
+                nnz += X_bloque.nnz
+                progress_cb(80 + 20 * procesadas / tfidf.n_docs)
+                for doc in top_terminos_por_documento(X_bloque, feature_names, top_k, [int(i) for i in indices]):
+                    top_salida.write(json.dumps(doc, ensure_ascii=False) + "\n")
+                    if len(muestra) < TFIDF_PREVIEW_DOCS:
+                        muestra.append(doc)
+        stats["segundos"] = round(stats["segundos"], 3)
+        stats["filas_por_segundo"] = round(stats["filas"] / stats["segundos"], 1) if stats["segundos"] else None
+        logger.info(f"Procesamiento CSV por bloques completado: ({procesadas}, {len(feature_names)}), nnz={nnz}")
+        return {
+            "data": muestra,
+            "top_corpus": top_terminos_de_sumas(sumas, df_docs, procesadas, feature_names),
+            "metadata": {
+                "formato": "sparse",
+                "modo": "bloques",
+                "filas_csv": filas,
+                "filas": procesadas,
+                "columnas": len(feature_names),
+                "nnz": int(nnz),
+                "archivo_guardado": matriz_path,
+                "bloques": bloques_escritos,
+                "vocabulario": vocabulario_path,
+                "vocabulario_podado": tfidf.podado,
+                "top_terminos": top_path,
+                "textos_procesados": tfidf.n_docs,
+                "lematizacion": stats
+            }
+        }
+    finally:
+        os.remove(textos_path)
+
+# ================================
+# ANÁLISIS EN SEGUNDO PLANO
+# ================================
+
+# /procesar, /sentimientos y /evaluar_metricas_entrenando aceptan async=1: el CSV
+# se guarda, se devuelve un job_id y el trabajo corre en esta cola compartida
+ANALISIS_WORKERS = int(os.environ.get("ANALISIS_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+ANALISIS_QUEUE_SIZE = int(os.environ.get("ANALISIS_QUEUE_SIZE", "10"))
+TIPOS_ANALISIS = ("procesar", "sentimientos", "evaluar")
+
+analisis_queue = TranscriptionQueue(ANALISIS_WORKERS, ANALISIS_QUEUE_SIZE)
+
+def pide_async():
+    return request.values.get("async", "").lower() in ("1", "true", "si", "sí")
+
+def ejecutar_analisis(job_id, funcion, csv_path, opciones):
+    """Corre funcion(stream, progress_cb=..., **opciones) y guarda su resultado en el trabajo"""
+    ultimo = {"progress": 0}
+
+    def reportar_progreso(pct):
+        pct = int(pct)
+        if pct > ultimo["progress"]:
+            ultimo["progress"] = pct
+            jobs.update(job_id, progress=pct)
+
+    try:
+        jobs.update(job_id, status="processing", progress=1)
+        with open(csv_path, "rb") as origen:
+            resultado = funcion(origen, progress_cb=reportar_progreso, **opciones)
+        finalizar_trabajo(job_id, status="completed", progress=100, result=resultado)
+        logger.info(f"Análisis {job_id} completado")
+    except ErrorCSV as e:
+        finalizar_trabajo(job_id, status="failed", error=str(e))
+    except Exception as e:
+        logger.error(f"Error en análisis {job_id}: {str(e)}")
+        finalizar_trabajo(job_id, status="failed", error=f"Error interno: {str(e)}")
+    finally:
+        if os.path.exists(csv_path):
+            os.remove(csv_path)
+
+def encolar_analisis(tipo, archivo, funcion, **opciones):
+    """Guarda el CSV subido y encola su análisis; responde 202 con el job_id"""
+    clean_old_jobs()
+    if analisis_queue.is_full():
+        return cola_llena_response(analisis_queue)
+    job_id = str(uuid.uuid4())
+    csv_path = os.path.join(JOBS_FOLDER, f"{job_id}.csv")
+    with medir_etapa("upload_save"):
+        archivo.save(csv_path)
+    jobs.create(job_id, nuevo_trabajo(archivo.filename, tipo=tipo))
+    if not analisis_queue.submit(job_id, objetivo_trabajo(ejecutar_analisis), funcion, csv_path, opciones,
+                                  temporal=csv_path):
+        jobs.delete(job_id)
+        os.remove(csv_path)
+        return cola_llena_response(analisis_queue)
+    logger.info(f"Encolado análisis '{tipo}': {archivo.filename} (Job: {job_id})")
+    return jsonify({"job_id": job_id, "tipo": tipo}), 202
+
+# ================================
+# PERFILADO BAJO DEMANDA
+# ================================
+
+# Sólo para administradores: se perfila la petición que traiga la cabecera X-Profile con PROFILING_TOKEN,
+# y el mismo token hace falta para descargar los perfiles. PROFILING_ENABLED=0 lo apaga sin quitar el token.
+# Sin token (o apagado) no se registra ningún hook: el coste es cero.
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "1") == "1"
+PROFILING_TOKEN = os.environ.get("PROFILING_TOKEN", "")
+PROFILING_HEADER = "X-Profile"
+PROFILING_TOP_N = int(os.environ.get("PROFILING_TOP_N", "30"))
+PROFILING_JOB_WAIT_SECONDS = 10
+PERFILADO_DISPONIBLE = PROFILING_ENABLED and bool(PROFILING_TOKEN)
+
+# cProfile sólo admite un perfilador activo por proceso (Python 3.12+), así que se serializan
+_lock_perfilador = threading.Lock()
+
+def pide_perfil():
+    """True si la petición trae el token de administrador en la cabecera X-Profile"""
+    token = request.headers.get(PROFILING_HEADER)
+    return bool(PROFILING_TOKEN) and token is not None and hmac.compare_digest(token, PROFILING_TOKEN)
+
+class Perfil:
+    """Perfila un bloque con cProfile y deja el .prof y un resumen top-N en RESULTS_FOLDER"""
+    def __init__(self, nombre, espera=0):
+        self.nombre = re.sub(r"[^\w.-]", "_", nombre)
+        self.espera = espera
+        self.url = None
+        self._perfil = None
+
+    def __enter__(self):
+        adquirido = _lock_perfilador.acquire(timeout=self.espera) if self.espera else _lock_perfilador.acquire(blocking=False)
+        if not adquirido:
+            logger.warning(f"Ya hay un perfil en curso; '{self.nombre}' se ejecuta sin perfilar")
+            return self
+        import cProfile
+        self._perfil = cProfile.Profile()
+        self._inicio = time.perf_counter()
+        self._perfil.enable()
+        return self
+
+    def __exit__(self, *exc):
+        if self._perfil is None:
+            return False
+        try:
+            self._perfil.disable()
+            self.url = self._guardar(time.perf_counter() - self._inicio)
+        except Exception as e:
+            logger.error(f"No se pudo guardar el perfil de '{self.nombre}': {str(e)}")
+        finally:
+            self._perfil = None
+            _lock_perfilador.release()
+        return False
+
+    def _guardar(self, duracion):
+        import pstats
+        base = f"perfil_{self.nombre}_{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+        self._perfil.dump_stats(os.path.join(RESULTS_FOLDER, base + ".prof"))
+        resumen = io.StringIO()
+        resumen.write(f"Perfil de '{self.nombre}': {duracion:.3f}s de reloj\n")
+        resumen.write(f"Perfil completo: {base}.prof (abrir con pstats o snakeviz)\n\n")
+        stats = pstats.Stats(self._perfil, stream=resumen).strip_dirs()
+        resumen.write(f"=== Top {PROFILING_TOP_N} por tiempo propio ===\n")
+        stats.sort_stats("tottime").print_stats(PROFILING_TOP_N)
+        resumen.write(f"=== Top {PROFILING_TOP_N} por tiempo acumulado ===\n")
+        stats.sort_stats("cumulative").print_stats(PROFILING_TOP_N)
+        with open(os.path.join(RESULTS_FOLDER, base + ".txt"), "w", encoding="utf-8") as f:
+            f.write(resumen.getvalue())
+        logger.info(f"Perfil de '{self.nombre}' guardado en {base}.txt")
+        return f"/perfil/{base}.txt"
+
+# Perfil del trabajo que corre en este hilo, para cerrarlo antes de publicar el estado final
+_perfil_trabajo = threading.local()
+
+def finalizar_trabajo(job_id, **campos):
+    """Último jobs.update de un trabajo; si se está perfilando, cierra antes el perfil y
+    publica perfil_url en la misma actualización, así quien espera "completed" ya lo ve"""
+    perfil = getattr(_perfil_trabajo, "perfil", None)
+    if perfil is not None:
+        _perfil_trabajo.perfil = None
+        perfil.__exit__(None, None, None)
+        if perfil.url:
+            campos["perfil_url"] = perfil.url
+    jobs.update(job_id, **campos)
+
+def objetivo_trabajo(target):
+    """target tal cual, o envuelto en un Perfil si la petición que lo encola se está perfilando"""
+    if not has_request_context() or not g.get("perfilar"):
+        return target
+
+    @functools.wraps(target)
+    def perfilado(job_id, *args):
+        # Espera a que termine el perfil de la petición que lo encoló
+        with Perfil(target.__name__, espera=PROFILING_JOB_WAIT_SECONDS) as perfil:
+            _perfil_trabajo.perfil = perfil
+            try:
+                target(job_id, *args)
+            finally:
+                _perfil_trabajo.perfil = None
+    return perfilado
+
 # ================================
 # RUTAS DE LA API
 # ================================
@@ -243,102 +2053,268 @@ def health_check():
     """Verificación de estado del sistema"""
     return jsonify({
         "status": "ok",
-        "spacy_loaded": nlp is not None,
+        "spacy_loaded": modelo_spacy.loaded,
         "whisper_binary": os.path.exists(WHISPER_BINARY),
         "whisper_model": os.path.exists(WHISPER_MODEL),
+        "whisper_backend": transcription_backend.nombre,
         "active_jobs": len(jobs),
+        "job_store": jobs.nombre,
+        "queue_depth": transcription_queue.depth(),
+        "queue_capacity": transcription_queue.max_size,
+        "queue_running": transcription_queue.running(),
+        "queue_workers": transcription_queue.workers,
+        "analisis_queue_depth": analisis_queue.depth(),
+        "analisis_queue_running": analisis_queue.running(),
+        "transcription_cache": transcription_cache.stats(),
+        "lemma_cache": lemma_cache.stats(),
+        "grafica_cache": grafica_cache.stats(),
+        "clasificador_activo": registro_clasificadores.version_activa(),
         "timestamp": datetime.now().isoformat()
     })
 
+def tfidf_de_csv(origen, modo=None, formato=None, top_k=None, progress_cb=None):
+    """TF-IDF de un CSV (stream binario); devuelve el dict de respuesta o lanza ErrorCSV"""
+    formato = formato or TFIDF_OUTPUT
+    top_k = top_k or TFIDF_TOP_K
+    progress_cb = progress_cb or (lambda pct: None)
+    # CSV grandes (solo si se pide modo=bloques): lectura por bloques, respuesta en formato sparse
+    if modo == "bloques":
+        return procesar_csv_por_bloques(origen, top_k=top_k, progress_cb=progress_cb)
+    # Leer CSV
+    with medir_etapa("csv_parse"):
+        try:
+            df = pd.read_csv(origen, encoding='utf-8')
+        except UnicodeDecodeError:
+            try:
+                origen.seek(0)
+                df = pd.read_csv(origen, encoding='latin-1')
+            except:
+                raise ErrorCSV("No se pudo leer el archivo CSV. Verifica la codificación.")
+    progress_cb(10)
+    # Validar estructura
+    if df.shape[1] < 2:
+        raise ErrorCSV("El CSV debe tener al menos dos columnas")
+    if df.empty:
+        raise ErrorCSV("El archivo CSV está vacío")
+    # Renombrar segunda columna a 'RESPUESTA'
+    segunda_columna = df.columns[1]
+    if segunda_columna != "RESPUESTA":
+        df.rename(columns={segunda_columna: "RESPUESTA"}, inplace=True)
+    # Verificar que tenemos datos para procesar
+    if "RESPUESTA" not in df.columns:
+        raise ErrorCSV("No se encontró una columna válida de 'RESPUESTA'")
+    textos_procesados, stats_lematizacion, error = textos_para_tfidf(df, progress_cb=progreso_tramo(progress_cb, 10, 80))
+    if error:
+        raise ErrorCSV(error)
+    # Vectorización TF-IDF
+    with medir_import("sklearn"):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+    vectorizador = TfidfVectorizer(**TFIDF_PARAMS)
+    try:
+        with medir_etapa("tfidf_fit"):
+            X_tfidf = vectorizador.fit_transform(textos_procesados)
+    except ValueError as e:
+        raise ErrorCSV(f"Error en vectorización TF-IDF: {str(e)}")
+    progress_cb(90)
+    feature_names = vectorizador.get_feature_names_out()
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    if formato == "sparse":
+        # Salida dispersa: sólo los términos relevantes de cada documento
+        matriz_path, vocabulario_path = guardar_tfidf_sparse(X_tfidf, feature_names, timestamp)
+        logger.info(f"Procesamiento CSV completado (sparse): {X_tfidf.shape}, nnz={X_tfidf.nnz}")
+        return {
+            "data": top_terminos_por_documento(X_tfidf, feature_names, top_k, textos_procesados.index),
+            "top_corpus": top_terminos_corpus(X_tfidf, feature_names),
+            "metadata": {
+                "formato": "sparse",
+                "filas": X_tfidf.shape[0],
+                "columnas": X_tfidf.shape[1],
+                "nnz": int(X_tfidf.nnz),
+                "densidad": round(X_tfidf.nnz / (X_tfidf.shape[0] * X_tfidf.shape[1]), 6),
+                "archivo_guardado": matriz_path,
+                "vocabulario": vocabulario_path,
+                "textos_procesados": len(textos_procesados),
+                "lematizacion": stats_lematizacion
+            }
+        }
+    # Crear DataFrame con resultados
+    tfidf_df = pd.DataFrame(X_tfidf.toarray(), columns=feature_names)
+    # Guardar resultados
+    resultado_path = os.path.join(RESULTS_FOLDER, f"tfidf_results_{timestamp}.csv")
+    tfidf_df.to_csv(resultado_path, index=False)
+    logger.info(f"Procesamiento CSV completado: {tfidf_df.shape}")
+    return {
+        "data": tfidf_df.to_dict(orient='records'),
+        "metadata": {
+            "filas": tfidf_df.shape[0],
+            "columnas": tfidf_df.shape[1],
+            "archivo_guardado": resultado_path,
+            "textos_procesados": len(textos_procesados),
+            "lematizacion": stats_lematizacion
+        }
+    }
+
+@app.before_request
+def _inicio_peticion():
+    g.inicio_peticion = time.perf_counter()
+
+@app.after_request
+def _contar_peticion(response):
+    endpoint = request.endpoint or "sin_ruta"
+    METRICA_PETICIONES.inc(endpoint, str(response.status_code))
+    inicio = g.get("inicio_peticion")
+    if inicio is not None:
+        METRICA_LATENCIA_HTTP.observe(endpoint, time.perf_counter() - inicio)
+    return response
+
+def _iniciar_perfil():
+    if pide_perfil():
+        g.perfilar = True
+        g.perfil = Perfil(request.endpoint or "sin_ruta").__enter__()
+
+def _cerrar_perfil(response):
+    perfil = g.pop("perfil", None)
+    if perfil is None:
+        return response
+    perfil.__exit__(None, None, None)
+    if perfil.url:
+        response.headers["X-Profile-Summary"] = perfil.url
+        datos = response.get_json(silent=True) if response.is_json else None
+        if isinstance(datos, dict):
+            datos["perfil_url"] = perfil.url
+            response.set_data(app.json.dumps(datos))
+    return response
+
+def _liberar_perfil(exc):
+    # Por si la respuesta no llegó a after_request
+    perfil = g.pop("perfil", None)
+    if perfil is not None:
+        perfil.__exit__(None, None, None)
+
+if PERFILADO_DISPONIBLE:
+    app.before_request(_iniciar_perfil)
+    app.after_request(_cerrar_perfil)
+    app.teardown_request(_liberar_perfil)
+
+@app.route("/perfil/<filename>")
+def descargar_perfil(filename):
+    """Descarga un perfil (.prof) o su resumen (.txt); requiere el token de administrador en X-Profile"""
+    if not pide_perfil():
+        return jsonify({"error": "No autorizado"}), 403
+    if not filename.startswith("perfil_") or not filename.endswith((".prof", ".txt")):
+        return jsonify({"error": "Archivo no encontrado"}), 404
+    file_path = os.path.join(RESULTS_FOLDER, filename)
+    if os.path.exists(file_path):
+        return send_from_directory(RESULTS_FOLDER, filename, mimetype="text/plain" if filename.endswith(".txt") else None)
+    return jsonify({"error": "Archivo no encontrado"}), 404
+
+@app.route("/metrics")
+def metrics():
+    """Métricas del proceso en formato de texto de Prometheus"""
+    lineas = []
+    for metrica in (METRICA_ETAPAS, METRICA_PETICIONES, METRICA_LATENCIA_HTTP, METRICA_AUDIO_SEGUNDOS, METRICA_WHISPER_SEGUNDOS):
+        lineas.extend(metrica.exponer())
+    lineas += ["# HELP app_jobs Trabajos en el almacén por estado", "# TYPE app_jobs gauge"]
+    for status in ("queued", "processing", "completed", "failed"):
+        lineas.append(f'app_jobs{{status="{status}"}} {jobs.count(status)}')
+    colas = (("transcripcion", transcription_queue), ("analisis", analisis_queue))
+    lineas += ["# HELP app_queue_depth Trabajos esperando en cada cola", "# TYPE app_queue_depth gauge"]
+    lineas += [f'app_queue_depth{{queue="{nombre}"}} {cola.depth()}' for nombre, cola in colas]
+    lineas += ["# HELP app_queue_running Trabajos en ejecución en cada cola", "# TYPE app_queue_running gauge"]
+    lineas += [f'app_queue_running{{queue="{nombre}"}} {cola.running()}' for nombre, cola in colas]
+    pared = METRICA_WHISPER_SEGUNDOS.total()
+    lineas += [
+        "# HELP app_audio_seconds_per_wall_second Segundos de audio transcritos por segundo de reloj de whisper",
+        "# TYPE app_audio_seconds_per_wall_second gauge",
+        f"app_audio_seconds_per_wall_second {round(METRICA_AUDIO_SEGUNDOS.total() / pared, 4) if pared else 0}"
+    ]
+    return Response("\n".join(lineas) + "\n", mimetype="text/plain; version=0.0.4")
+
+@app.route("/arranque")
+def tiempos_arranque():
+    """Desglose por dependencia del arranque y de las cargas diferidas posteriores"""
+    return jsonify({
+        "segundos_modulo": TIEMPO_ARRANQUE,
+        "importaciones": [
+            {"modulo": nombre, **datos} for nombre, datos in TIEMPOS_IMPORTACION.items()
+        ],
+        "spacy_cargado": modelo_spacy.loaded,
+        "sentimientos_cargado": sentiment_model.loaded
+    })
+
 @app.route("/procesar", methods=["POST"])
 def procesar_csv():
-    """Procesa archivo CSV para análisis TF-IDF"""
+    """Procesa archivo CSV para análisis TF-IDF (con async=1 devuelve un job_id)"""
     try:
+        # El límite de 1 GB solo aplica a /procesar?modo=bloques: el modo debe ir en la URL
+        # porque el límite tiene que fijarse antes de leer el cuerpo del formulario
+        modo = request.args.get("modo")
+        if modo == "bloques":
+            request.max_content_length = CSV_MAX_CONTENT_LENGTH
         archivo = request.files.get("file")
         if not archivo:
             return jsonify({"error": "No se subió ningún archivo"}), 400
-        # Leer CSV
-        try:
-            df = pd.read_csv(archivo, encoding='utf-8')
-        except UnicodeDecodeError:
-            try:
-                df = pd.read_csv(archivo, encoding='latin-1')
-            except:
-                return jsonify({"error": "No se pudo leer el archivo CSV. Verifica la codificación."}), 400
-        # Validar estructura
-        if df.shape[1] < 2:
-            return jsonify({"error": "El CSV debe tener al menos dos columnas"}), 400
-        if df.empty:
-            return jsonify({"error": "El archivo CSV está vacío"}), 400
-        # Renombrar segunda columna a 'RESPUESTA'
-        segunda_columna = df.columns[1]
-        if segunda_columna != "RESPUESTA":
-            df.rename(columns={segunda_columna: "RESPUESTA"}, inplace=True)
-        # Verificar que tenemos datos para procesar
-        if "RESPUESTA" not in df.columns:
-            return jsonify({"error": "No se encontró una columna válida de 'RESPUESTA'"}), 400
-        # Eliminar filas vacías en la columna RESPUESTA
-        df = df.dropna(subset=['RESPUESTA'])
-        df = df[df['RESPUESTA'].str.strip() != '']
-        if df.empty:
-            return jsonify({"error": "No hay respuestas válidas para procesar"}), 400
-        # Procesamiento de texto
-        df['texto_original'] = df['RESPUESTA'].astype(str)
-        df['texto_limpio'] = df['texto_original'].apply(limpiar_texto)
-        # Filtrar textos muy cortos
-        df = df[df['texto_limpio'].str.len() > 2]
-        if df.empty:
-            return jsonify({"error": "No hay textos válidos después de la limpieza"}), 400
-        # Tokenización
-        df['tokens'] = df['texto_limpio'].apply(word_tokenize)
-        # Lematización
-        df['lemmas'] = df['tokens'].apply(lematizar)
-        # Remover stopwords
-        try:
-            stop_words = set(stopwords.words('spanish'))
-        except:
-            stop_words = set()
-        df['lemmas_sin_stopwords'] = df['lemmas'].apply(
-            lambda x: [word for word in x if word not in stop_words and len(word) > 2]
-        )
-        # Preparar textos para TF-IDF
-        textos_procesados = df['lemmas_sin_stopwords'].apply(lambda x: ' '.join(x))
-        # Filtrar textos vacíos después del procesamiento
-        textos_procesados = textos_procesados[textos_procesados.str.len() > 0]
-        if textos_procesados.empty:
-            return jsonify({"error": "No hay textos válidos después del procesamiento"}), 400
-        # Vectorización TF-IDF
-        vectorizador = TfidfVectorizer(
-            max_features=1000,  # Limitar características
-            min_df=1,
-            max_df=0.95,
-            ngram_range=(1, 2)  # Incluir bigramas
-        )
+        opciones = {
+            "modo": modo or request.form.get("modo"),
+            "formato": request.form.get("formato", TFIDF_OUTPUT),
+            "top_k": request.form.get("top_k", TFIDF_TOP_K, type=int)
+        }
+        if pide_async():
+            return encolar_analisis("procesar", archivo, tfidf_de_csv, **opciones)
         try:
-            X_tfidf = vectorizador.fit_transform(textos_procesados)
-        except ValueError as e:
-            return jsonify({"error": f"Error en vectorización TF-IDF: {str(e)}"}), 400
-        # Crear DataFrame con resultados
-        feature_names = vectorizador.get_feature_names_out()
-        tfidf_df = pd.DataFrame(X_tfidf.toarray(), columns=feature_names)
-        # Guardar resultados
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        resultado_path = os.path.join(RESULTS_FOLDER, f"tfidf_results_{timestamp}.csv")
-        tfidf_df.to_csv(resultado_path, index=False)
-        logger.info(f"Procesamiento CSV completado: {tfidf_df.shape}")
-        return jsonify({
-            "data": tfidf_df.to_dict(orient='records'),
-            "metadata": {
-                "filas": tfidf_df.shape[0],
-                "columnas": tfidf_df.shape[1],
-                "archivo_guardado": resultado_path,
-                "textos_procesados": len(textos_procesados)
-            }
-        })
+            return jsonify(tfidf_de_csv(archivo.stream, **opciones))
+        except ErrorCSV as e:
+            return jsonify({"error": str(e)}), 400
+    except RequestEntityTooLarge:
+        return jsonify({"error": "Archivo demasiado grande; para CSV grandes usa /procesar?modo=bloques"}), 413
     except Exception as e:
         logger.error(f"Error en procesamiento CSV: {str(e)}")
         return jsonify({"error": f"Error interno: {str(e)}"}), 500
 
+def cola_llena_response(cola=None):
+    """Respuesta 503 cuando la cola (por defecto la de transcripción) está llena"""
+    cola = cola or transcription_queue
+    response = jsonify({
+        "error": "El servidor está ocupado, intenta de nuevo en unos minutos",
+        "queue_depth": cola.depth()
+    })
+    response.headers["Retry-After"] = "30"
+    return response, 503
+
+ALLOWED_AUDIO_EXTENSIONS = {'.mp3', '.wav', '.m4a', '.ogg', '.flac', '.aac', '.opus'}
+
+def nuevo_trabajo(filename, **extra):
+    """Registro inicial de un trabajo de transcripción en cola"""
+    trabajo = {
+        "status": "queued",
+        "filename": filename,
+        "start_time": time.time(),
+        "progress": 0,
+        "result": None,
+        "error": None
+    }
+    trabajo.update(extra)
+    return trabajo
+
+def completar_desde_cache(job_id, temp_path, filename, file_hash, **extra):
+    """Si el audio ya está en caché crea el trabajo completado y devuelve True"""
+    texto_cache = transcription_cache.get(TranscriptionCache.make_key(file_hash))
+    if not texto_cache:
+        return False
+    os.remove(temp_path)
+    nombre_archivo, destino_path = guardar_opinion(texto_cache)
+    trabajo = nuevo_trabajo(nombre_archivo, **extra)
+    trabajo.update({
+        "status": "completed",
+        "progress": 100,
+        "result": texto_cache,
+        "file_path": destino_path,
+        "cached": True
+    })
+    jobs.create(job_id, trabajo)
+    logger.info(f"Transcripción desde caché: {filename} -> {nombre_archivo} (Job: {job_id})")
+    return True
+
 @app.route("/transcribir", methods=["POST"])
 def transcribir_audio():
     """Inicia transcripción de audio (asíncrono)"""
@@ -356,54 +2332,223 @@ def transcribir_audio():
         # Verificar extensión
         logger.info(f"Archivo recibido para transcribir: '{archivo.filename}'")
         filename = archivo.filename.lower()
-        allowed_extensions = {'.mp3', '.wav', '.m4a', '.ogg', '.flac', '.aac', '.opus'}
-        if not any(filename.endswith(ext) for ext in allowed_extensions):
+        if not any(filename.endswith(ext) for ext in ALLOWED_AUDIO_EXTENSIONS):
             return jsonify({"error": "Formato de audio no soportado"}), 400
         # Limpiar trabajos antiguos
         clean_old_jobs()
         # Generar ID único
         job_id = str(uuid.uuid4())
-        # Guardar archivo temporalmente
+        # Guardar archivo temporalmente (el hash se calcula mientras se copia)
         temp_path = f"/tmp/{job_id}_{archivo.filename}"
-        archivo.save(temp_path)
+        file_hash = guardar_archivo_con_hash(archivo, temp_path)
         # Verificar que el archivo se guardó correctamente
         if not os.path.exists(temp_path) or os.path.getsize(temp_path) == 0:
             return jsonify({"error": "Error al guardar el archivo"}), 400
+        # Si este audio ya se transcribió, el trabajo termina de inmediato
+        if completar_desde_cache(job_id, temp_path, archivo.filename, file_hash):
+            return jsonify({"job_id": job_id, "cached": True})
+        # Rechazar si la cola ya está llena
+        if transcription_queue.is_full():
+            os.remove(temp_path)
+            return cola_llena_response()
         # Inicializar trabajo
-        jobs[job_id] = {
-            "status": "processing",
-            "filename": archivo.filename,
-            "start_time": time.time(),
-            "progress": 0,
-            "result": None,
-            "error": None
-        }
-        # Iniciar procesamiento en hilo separado
-        thread = threading.Thread(
-            target=process_audio_background,
-            args=(job_id, temp_path, archivo.filename)
-        )
-        thread.daemon = True
-        thread.start()
-        logger.info(f"Iniciada transcripción: {archivo.filename} (Job: {job_id})")
+        jobs.create(job_id, nuevo_trabajo(archivo.filename))
+        # Encolar para el pool de workers
+        if not transcription_queue.submit(job_id, objetivo_trabajo(process_audio_background), temp_path, archivo.filename, file_hash,
+                                        temporal=temp_path):
+            jobs.delete(job_id)
+            os.remove(temp_path)
+            return cola_llena_response()
+        logger.info(f"Encolada transcripción: {archivo.filename} (Job: {job_id})")
         return jsonify({"job_id": job_id})
     except Exception as e:
         logger.error(f"Error al iniciar transcripción: {str(e)}")
         return jsonify({"error": f"Error interno: {str(e)}"}), 500
 
-@app.route("/estado/<job_id>", methods=["GET"])
-def verificar_estado(job_id):
-    """Verifica el estado de un trabajo de transcripción"""
-    job = jobs.get(job_id)
-    if not job:
-        return jsonify({"error": "Trabajo no encontrado"}), 404
+# ================================
+# TRANSCRIPCIÓN POR LOTES
+# ================================
+
+BATCH_MAX_CONTENT_LENGTH = int(os.environ.get("BATCH_MAX_MB", "500")) * 1024 * 1024
+BATCH_MAX_FILES = int(os.environ.get("BATCH_MAX_FILES", "300"))
+MAX_AUDIO_SIZE = 45 * 1024 * 1024
+
+def _extension_permitida(nombre):
+    return any(nombre.lower().endswith(ext) for ext in ALLOWED_AUDIO_EXTENSIONS)
+
+def _clips_de_zip(archivo):
+    """Devuelve (nombre, stream) de los audios dentro de un ZIP subido"""
+    with zipfile.ZipFile(archivo.stream) as zf:
+        for info in zf.infolist():
+            # basename evita rutas tipo ../../ dentro del ZIP
+            nombre = os.path.basename(info.filename)
+            if info.is_dir() or not nombre or nombre.startswith(".") or "__MACOSX" in info.filename:
+                continue
+            if not _extension_permitida(nombre) or info.file_size > MAX_AUDIO_SIZE:
+                continue
+            with zf.open(info) as stream:
+                yield nombre, stream
+
+def _alimentar_lote(pendientes, target):
+    """Pasa los clips del lote a la cola según se libera espacio (los más cortos primero)"""
+    # Se deja la mitad de la cola libre para las subidas individuales
+    limite = max(1, transcription_queue.max_size // 2)
+    for job_id, temp_path, nombre, file_hash in pendientes:
+        if job_id not in jobs:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            continue
+        transcription_queue.submit_wait(job_id, target, temp_path, nombre, file_hash, limit=limite, temporal=temp_path)
+
+@app.route("/transcribir_lote", methods=["POST"])
+def transcribir_lote():
+    """Transcribe varios audios (campo 'audios') o un ZIP (campo 'zip') como un grupo"""
+    try:
+        request.max_content_length = BATCH_MAX_CONTENT_LENGTH
+        subidos = [a for a in request.files.getlist("audios") if a and a.filename]
+        zips = [z for z in request.files.getlist("zip") if z and z.filename]
+        if not subidos and not zips:
+            return jsonify({"error": "No se subió ningún archivo"}), 400
+        clean_old_jobs()
+        grupo_id = str(uuid.uuid4())
+        clips = []  # (tamaño, job_id, temp_path, nombre, hash)
+
+        def guardar_clip(nombre, stream):
+            job_id = str(uuid.uuid4())
+            temp_path = f"/tmp/{job_id}_{nombre}"
+            file_hash = copiar_con_hash(stream, temp_path)
+            tam = os.path.getsize(temp_path)
+            if tam == 0 or tam > MAX_AUDIO_SIZE:
+                os.remove(temp_path)
+                return
+            clips.append((tam, job_id, temp_path, nombre, file_hash))
+
+        def lote_excedido():
+            for clip in clips:
+                os.remove(clip[2])
+            return jsonify({"error": f"El lote excede el máximo de {BATCH_MAX_FILES} archivos"}), 400
+
+        # El límite se comprueba antes de copiar cada clip, sin extraer el resto del ZIP
+        for archivo in subidos:
+            if _extension_permitida(archivo.filename):
+                if len(clips) >= BATCH_MAX_FILES:
+                    return lote_excedido()
+                archivo.stream.seek(0)
+                guardar_clip(os.path.basename(archivo.filename), archivo.stream)
+        for archivo in zips:
+            try:
+                for nombre, stream in _clips_de_zip(archivo):
+                    if len(clips) >= BATCH_MAX_FILES:
+                        return lote_excedido()
+                    guardar_clip(nombre, stream)
+            except zipfile.BadZipFile:
+                for clip in clips:
+                    os.remove(clip[2])
+                return jsonify({"error": f"ZIP inválido: {archivo.filename}"}), 400
+        if not clips:
+            return jsonify({"error": "No se encontraron audios con formato soportado"}), 400
+        # Los más cortos primero: por duración y, si no se puede leer, al final por tamaño
+        duraciones = {c[1]: duracion_audio(c[2], c[4]) for c in clips}
+        clips.sort(key=lambda c: (0, duraciones[c[1]]) if duraciones[c[1]] else (1, c[0]))
+        pendientes = []
+        for _, job_id, temp_path, nombre, file_hash in clips:
+            if completar_desde_cache(job_id, temp_path, nombre, file_hash, grupo=grupo_id, original=nombre):
+                continue
+            jobs.create(job_id, nuevo_trabajo(nombre, grupo=grupo_id, original=nombre))
+            pendientes.append((job_id, temp_path, nombre, file_hash))
+        # El grupo no es un trabajo: su estado se deriva de los clips (estado_lote), así que
+        # no cuenta como "processing" ni lo toca la recuperación de huérfanos tras un reinicio
+        jobs.create(grupo_id, {
+            "tipo": "lote",
+            "status": "lote",
+            "filename": f"lote de {len(clips)} archivos",
+            "start_time": time.time(),
+            "progress": 0,
+            "jobs": [c[1] for c in clips]
+        })
+        # objetivo_trabajo consulta la petición, así que se resuelve aquí y no en el hilo
+        target = objetivo_trabajo(process_audio_background)
+        threading.Thread(target=_alimentar_lote, args=(pendientes, target), daemon=True).start()
+        logger.info(f"Lote {grupo_id}: {len(clips)} audios ({len(clips) - len(pendientes)} desde caché)")
+        return jsonify({"grupo_id": grupo_id, "total": len(clips), "job_ids": [c[1] for c in clips]})
+    except Exception as e:
+        logger.error(f"Error al iniciar lote: {str(e)}")
+        return jsonify({"error": f"Error interno: {str(e)}"}), 500
+
+def estado_lote(grupo_id, grupo):
+    """Progreso agregado de un lote a partir de sus trabajos"""
+    detalle = []
+    conteo = {"queued": 0, "processing": 0, "completed": 0, "failed": 0}
+    progreso_total = 0
+    for job_id in grupo["jobs"]:
+        job = jobs.get(job_id) or {"status": "failed", "progress": 0, "error": "Trabajo expirado"}
+        status = job.get("status", "failed")
+        conteo[status] = conteo.get(status, 0) + 1
+        progreso_total += 100 if status in ("completed", "failed") else job.get("progress", 0)
+        item = {"job_id": job_id, "archivo": job.get("original", job.get("filename")), "status": status}
+        if status == "completed":
+            item["saved_as"] = job.get("filename")
+        elif status == "failed":
+            item["error"] = job.get("error")
+        detalle.append(item)
+    total = len(grupo["jobs"])
+    terminado = conteo["completed"] + conteo["failed"] == total
+    return {
+        "grupo_id": grupo_id,
+        "status": "completed" if terminado else "processing",
+        "progress": int(progreso_total / total) if total else 100,
+        "total": total,
+        "completados": conteo["completed"],
+        "fallidos": conteo["failed"],
+        "en_cola": conteo["queued"],
+        "procesando": conteo["processing"],
+        "elapsed_time": int(time.time() - grupo["start_time"]),
+        "trabajos": detalle
+    }
+
+@app.route("/lote/<grupo_id>", methods=["GET"])
+def verificar_lote(grupo_id):
+    """Estado agregado de un lote de transcripciones"""
+    grupo = jobs.get(grupo_id)
+    if not grupo or grupo.get("tipo") != "lote":
+        return jsonify({"error": "Lote no encontrado"}), 404
+    return jsonify(estado_lote(grupo_id, grupo))
+
+@app.route("/lote/<grupo_id>/descargar", methods=["GET"])
+def descargar_lote(grupo_id):
+    """Descarga en un ZIP los Opinion###.txt ya generados por el lote"""
+    grupo = jobs.get(grupo_id)
+    if not grupo or grupo.get("tipo") != "lote":
+        return jsonify({"error": "Lote no encontrado"}), 404
+    buf = io.BytesIO()
+    incluidos = 0
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for job_id in grupo["jobs"]:
+            job = jobs.get(job_id)
+            if job and job.get("status") == "completed" and os.path.exists(job.get("file_path", "")):
+                zf.write(job["file_path"], arcname=job["filename"])
+                incluidos += 1
+    if not incluidos:
+        return jsonify({"error": "El lote aún no tiene transcripciones completadas"}), 404
+    buf.seek(0)
+    return send_file(buf, mimetype="application/zip", as_attachment=True, download_name=f"lote_{grupo_id[:8]}.zip")
+
+def estado_job(job_id, job):
+    """Respuesta de estado de un trabajo (compartida por /estado y su stream SSE)"""
     response = {
         "status": job["status"],
         "filename": job["filename"],
         "progress": job.get("progress", 0),
         "elapsed_time": int(time.time() - job["start_time"])
     }
-    if job["status"] == "completed":
+    analisis = job.get("tipo") in TIPOS_ANALISIS
+    if analisis:
+        response["tipo"] = job["tipo"]
+    if job["status"] == "queued":
+        response["queue_position"] = (analisis_queue if analisis else transcription_queue).position(job_id)
+    if job["status"] == "completed" and analisis:
+        response["resultado"] = job["result"]
+    elif job["status"] == "completed":
         response.update({
             "transcripcion": job["result"],
             "saved_as": job.get("filename", ""),
@@ -411,7 +2556,58 @@ def verificar_estado(job_id):
         })
     elif job["status"] == "failed":
         response["error"] = job.get("error", "Error desconocido")
-    return jsonify(response)
+    if job.get("perfil_url"):
+        response["perfil_url"] = job["perfil_url"]
+    return response
+
+@app.route("/estado/<job_id>", methods=["GET"])
+def verificar_estado(job_id):
+    """Verifica el estado de un trabajo (transcripción o análisis)"""
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "Trabajo no encontrado"}), 404
+    if job.get("tipo") == "lote":
+        return jsonify(estado_lote(job_id, job))
+    return jsonify(estado_job(job_id, job))
+
+SSE_POLL_SECONDS = 0.5
+SSE_HEARTBEAT_SECONDS = 15
+
+@app.route("/estado/<job_id>/stream", methods=["GET"])
+def stream_estado(job_id):
+    """Envía los cambios de estado del trabajo como Server-Sent Events"""
+    if job_id not in jobs:
+        return jsonify({"error": "Trabajo no encontrado"}), 404
+
+    def eventos():
+        anterior = None
+        ultimo_envio = time.time()
+        while True:
+            job = jobs.get(job_id)
+            if not job:
+                yield f"event: error\ndata: {json.dumps({'error': 'Trabajo no encontrado'})}\n\n"
+                return
+            if job.get("tipo") == "lote":
+                estado = estado_lote(job_id, job)
+            else:
+                estado = estado_job(job_id, job)
+            # elapsed_time cambia cada segundo; sólo se notifica si cambió otra cosa
+            clave = {k: v for k, v in estado.items() if k != "elapsed_time"}
+            if clave != anterior:
+                anterior = clave
+                ultimo_envio = time.time()
+                yield f"data: {json.dumps(estado, ensure_ascii=False)}\n\n"
+            elif time.time() - ultimo_envio > SSE_HEARTBEAT_SECONDS:
+                ultimo_envio = time.time()
+                yield ": ping\n\n"
+            if estado["status"] in ("completed", "failed"):
+                return
+            time.sleep(SSE_POLL_SECONDS)
+
+    return Response(eventos(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
 
 @app.route("/descargar/<filename>")
 def descargar_archivo(filename):
@@ -444,57 +2640,220 @@ def listar_archivos():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import seaborn as sns
-from transformers import pipeline
-from ftfy import fix_text
-import numpy as np
-import io
+def cargar_pyplot():
+    """matplotlib (backend Agg) y seaborn se importan al dibujar la primera gráfica"""
+    with medir_import("matplotlib"):
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+    with medir_import("seaborn"):
+        import seaborn as sns
+    return plt, sns
 
 def limpiar_texto_sentimiento(texto):
     if pd.isna(texto): return ""
+    with medir_import("ftfy"):
+        from ftfy import fix_text
     return fix_text(str(texto))
 
-def analizar_sentimientos_df(df):
-    classifier = pipeline("sentiment-analysis", model="nlptown/bert-base-multilingual-uncased-sentiment")
-    mapeo_polaridad = {
-        "1 star": "negativo",
-        "2 stars": "negativo",
-        "3 stars": "neutro",
-        "4 stars": "positivo",
-        "5 stars": "positivo"
-    }
-    valor_estrellas = {
-        "1 star": 1,
-        "2 stars": 2,
-        "3 stars": 3,
-        "4 stars": 4,
-        "5 stars": 5
+@medir_etapa("cleaning")
+def limpiar_texto_sentimiento_serie(serie):
+    """limpiar_texto_sentimiento sobre la columna, corriendo ftfy una vez por texto distinto"""
+    unicos = serie.drop_duplicates()
+    mapa = dict(zip(unicos, unicos.map(limpiar_texto_sentimiento)))
+    return serie.map(lambda texto: mapa[texto] if not pd.isna(texto) else "")
+
+# Modelo de sentimientos (se carga una sola vez por proceso)
+SENTIMENT_MODEL = os.environ.get("SENTIMENT_MODEL", "nlptown/bert-base-multilingual-uncased-sentiment")
+SENTIMENT_BATCH_SIZE = int(os.environ.get("SENTIMENT_BATCH_SIZE", "32"))
+
+MAPEO_POLARIDAD = {
+    "1 star": "negativo",
+    "2 stars": "negativo",
+    "3 stars": "neutro",
+    "4 stars": "positivo",
+    "5 stars": "positivo"
+}
+VALOR_ESTRELLAS = {
+    "1 star": 1,
+    "2 stars": 2,
+    "3 stars": 3,
+    "4 stars": 4,
+    "5 stars": 5
+}
+
+class SentimentModelHolder:
+    """Mantiene un único pipeline de sentimientos compartido por todo el proceso"""
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self._classifier = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._classifier is not None
+
+    def get(self):
+        """Devuelve el clasificador, cargándolo la primera vez que se pide"""
+        if self._classifier is None:
+            with self._lock:
+                if self._classifier is None:
+                    logger.info(f"Cargando modelo de sentimientos: {self.model_name}")
+                    with medir_import("transformers"):
+                        from transformers import pipeline
+                    with medir_import(f"pipeline({self.model_name})"):
+                        self._classifier = pipeline("sentiment-analysis", model=self.model_name)
+        return self._classifier
+
+sentiment_model = SentimentModelHolder(SENTIMENT_MODEL)
+
+def _resultado_sentimiento(etiqueta):
+    if etiqueta is None:
+        return {"sentimiento": "Error", "rank": None}
+    return {
+        "sentimiento": MAPEO_POLARIDAD.get(etiqueta, "No disponible"),
+        "rank": VALOR_ESTRELLAS.get(etiqueta)
     }
-    def predecir(texto):
+
+@medir_etapa("sentiment_inference")
+def predecir_sentimientos_lote(textos, batch_size=None, progress_cb=None):
+    """Clasifica una lista de textos por lotes conservando el resultado por fila.
+
+    progress_cb(hechos, total), si se indica, se llama tras cada lote.
+    """
+    batch_size = batch_size or SENTIMENT_BATCH_SIZE
+    resultados = [None] * len(textos)
+    pendientes = []
+    for i, texto in enumerate(textos):
         if pd.isna(texto) or texto.strip() == "":
-            return {"sentimiento": "No disponible", "rank": None}
+            resultados[i] = {"sentimiento": "No disponible", "rank": None}
+        else:
+            pendientes.append(i)
+    if not pendientes:
+        return resultados
+    classifier = sentiment_model.get()
+    for inicio in range(0, len(pendientes), batch_size):
+        lote = pendientes[inicio:inicio + batch_size]
         try:
-            resultado = classifier(texto)[0]["label"]
-            return {
-                "sentimiento": mapeo_polaridad.get(resultado, "No disponible"),
-                "rank": valor_estrellas.get(resultado)
-            }
+            salidas = classifier([textos[i] for i in lote], batch_size=batch_size)
+            etiquetas = [salida["label"] for salida in salidas]
         except Exception:
-            return {"sentimiento": "Error", "rank": None}
+            # Si falla el lote completo, se reintenta fila por fila para aislar el error
+            etiquetas = []
+            for i in lote:
+                try:
+                    etiquetas.append(classifier(textos[i])[0]["label"])
+                except Exception:
+                    etiquetas.append(None)
+        for i, etiqueta in zip(lote, etiquetas):
+            resultados[i] = _resultado_sentimiento(etiqueta)
+        if progress_cb:
+            progress_cb(min(inicio + batch_size, len(pendientes)), len(pendientes))
+    return resultados
+
+def analizar_sentimientos_df(df, batch_size=None, progress_cb=None):
     # Acceso corregido: usa 'respuesta' en minúsculas
-    df['respuesta'] = df['respuesta'].apply(limpiar_texto_sentimiento)
-    resultados = df['respuesta'].apply(predecir)
+    df['respuesta'] = limpiar_texto_sentimiento_serie(df['respuesta'])
+    resultados = pd.Series(
+        predecir_sentimientos_lote(df['respuesta'].tolist(), batch_size=batch_size, progress_cb=progress_cb),
+        index=df.index
+    )
     df['sentimiento_predicho'] = resultados.apply(lambda x: x["sentimiento"])
     df['rank'] = resultados.apply(lambda x: x["rank"])
     return df
 
-def graficar_sentimientos_backend(df):
-    # Filtrar para solo positivos/negativos
-    df_viz = df[df['sentimiento_predicho'].isin(['positivo', 'negativo'])]
-    sentimientos = df_viz['sentimiento_predicho'].value_counts()
+# ================================
+# GRÁFICAS (PNG CACHEABLES)
+# ================================
+
+# Las gráficas no se dibujan dentro de /sentimientos ni /evaluar_metricas_entrenando:
+# la respuesta JSON lleva una URL con los números a graficar y el PNG se genera al
+# pedirla, una sola vez por combinación de datos (caché en disco + ETag).
+GRAFICAS_FOLDER = os.path.join(BASE_DIR, 'cache_graficas')
+GRAFICAS_CACHE_MAX_MB = int(os.environ.get("GRAFICAS_CACHE_MAX_MB", "50"))
+# Subir al cambiar el aspecto de las gráficas para invalidar las ya guardadas
+GRAFICAS_VERSION = "1"
+ETIQUETAS_MATRIZ = ['negativo', 'neutro', 'positivo']
+
+class GraficaCache:
+    """PNG ya dibujados, un archivo <clave>.png por gráfica; expulsa por mtime al superar max_bytes"""
+    def __init__(self, folder, max_bytes):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+        self._size = sum(e.stat().st_size for e in os.scandir(folder) if e.name.endswith(".png"))
+
+    def _path(self, clave):
+        return os.path.join(self.folder, f"{clave}.png")
+
+    def get(self, clave):
+        path = self._path(clave)
+        with self._lock:
+            try:
+                with open(path, "rb") as f:
+                    png = f.read()
+                os.utime(path)
+                self.hits += 1
+                return png
+            except OSError:
+                self.misses += 1
+                return None
+
+    def put(self, clave, png):
+        path = self._path(clave)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(png)
+        with self._lock:
+            previo = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+            self._size += len(png) - previo
+            if self._size > self.max_bytes:
+                entradas = sorted(
+                    (e for e in os.scandir(self.folder) if e.name.endswith(".png")),
+                    key=lambda e: e.stat().st_mtime
+                )
+                for entrada in entradas:
+                    if self._size <= self.max_bytes:
+                        break
+                    try:
+                        tam = entrada.stat().st_size
+                        os.remove(entrada.path)
+                        self._size -= tam
+                    except OSError:
+                        pass
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "size_bytes": self._size,
+                "max_bytes": self.max_bytes
+            }
+
+grafica_cache = GraficaCache(GRAFICAS_FOLDER, GRAFICAS_CACHE_MAX_MB * 1024 * 1024)
+# pyplot guarda estado global: se dibuja una gráfica a la vez
+_lock_pyplot = threading.Lock()
+
+def url_grafica_sentimientos(positivos, negativos):
+    return "/grafica/sentimientos.png?" + urlencode({"positivo": int(positivos), "negativo": int(negativos)})
+
+def url_grafica_matriz(cm):
+    return "/grafica/matriz_confusion.png?" + urlencode({"cm": ";".join(",".join(str(int(v)) for v in fila) for fila in cm)})
+
+def graficar_sentimientos_backend(conteos):
+    """Barras + pastel de {sentimiento: cantidad}; sólo positivo/negativo, de mayor a menor"""
+    plt, _ = cargar_pyplot()
+    sentimientos = pd.Series(dict(sorted(
+        ((s, c) for s, c in conteos.items() if s in ('positivo', 'negativo') and c > 0),
+        key=lambda item: (-item[1], item[0])
+    )), dtype='int64')
     color_map = {'positivo': '#4CAF50', 'negativo': '#F44336'}
     colors = [color_map.get(s, '#9E9E9E') for s in sentimientos.index]
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 6))
@@ -514,37 +2873,100 @@ def graficar_sentimientos_backend(df):
     buf.seek(0)
     return buf
 
-@app.route("/sentimientos", methods=["POST"])
-def analizar_sentimientos():
-    archivo = request.files.get("file")
-    if not archivo:
-        return jsonify({"error": "No se subió ningún archivo"}), 400
+def graficar_matriz_confusion(cm):
+    plt, sns = cargar_pyplot()
+    fig, ax = plt.subplots(figsize=(7, 6))
+    sns.heatmap(np.array(cm), annot=True, fmt='d', cmap='viridis', xticklabels=ETIQUETAS_MATRIZ, yticklabels=ETIQUETAS_MATRIZ, ax=ax)
+    ax.set_xlabel('Predicción')
+    ax.set_ylabel('Verdadero')
+    ax.set_title('Matriz de Confusión')
+    buf = io.BytesIO()
+    fig.tight_layout()
+    fig.savefig(buf, format='png')
+    plt.close(fig)
+    buf.seek(0)
+    return buf
+
+def _enteros_no_negativos(valores):
+    numeros = [int(v) for v in valores]
+    if any(n < 0 for n in numeros):
+        raise ValueError("valores negativos")
+    return numeros
+
+@app.route("/grafica/<tipo>.png")
+def grafica(tipo):
+    """PNG de una gráfica a partir de los números de la URL; se dibuja sólo la primera vez"""
     try:
-        df = pd.read_csv(archivo, encoding='utf-8')
-    except UnicodeDecodeError:
-        df = pd.read_csv(archivo, encoding='latin-1')
+        if tipo == "sentimientos":
+            positivo, negativo = _enteros_no_negativos([request.args.get("positivo", 0), request.args.get("negativo", 0)])
+            datos = {"positivo": positivo, "negativo": negativo}
+            dibujar = lambda: graficar_sentimientos_backend(datos)
+        elif tipo == "matriz_confusion":
+            datos = [_enteros_no_negativos(fila.split(",")) for fila in request.args.get("cm", "").split(";")]
+            if len(datos) != len(ETIQUETAS_MATRIZ) or any(len(fila) != len(ETIQUETAS_MATRIZ) for fila in datos):
+                raise ValueError("la matriz debe ser 3x3")
+            dibujar = lambda: graficar_matriz_confusion(datos)
+        else:
+            return jsonify({"error": "Gráfica no encontrada"}), 404
+    except ValueError as e:
+        return jsonify({"error": f"Parámetros de gráfica inválidos: {e}"}), 400
+    clave = hashlib.sha256(json.dumps([tipo, datos, GRAFICAS_VERSION], sort_keys=True).encode()).hexdigest()
+    cabeceras = {"Cache-Control": "public, max-age=31536000, immutable", "ETag": f'"{clave}"'}
+    # El contenido depende sólo de la URL: si el navegador ya la tiene no hace falta ni leer el disco
+    if clave in request.if_none_match:
+        return Response(status=304, headers=cabeceras)
+    png = grafica_cache.get(clave)
+    if png is None:
+        with _lock_pyplot:
+            png = grafica_cache.get(clave)
+            if png is None:
+                with medir_etapa("chart_render"):
+                    png = dibujar().getvalue()
+                grafica_cache.put(clave, png)
+    return Response(png, mimetype="image/png", headers=cabeceras)
+
+def sentimientos_de_csv(origen, progress_cb=None):
+    """Sentimientos de un CSV (stream binario); devuelve el dict de respuesta o lanza ErrorCSV"""
+    progress_cb = progress_cb or (lambda pct: None)
+    with medir_etapa("csv_parse"):
+        try:
+            df = pd.read_csv(origen, encoding='utf-8')
+        except UnicodeDecodeError:
+            origen.seek(0)
+            df = pd.read_csv(origen, encoding='latin-1')
     # Renombrar columnas a minúsculas sin espacios
     df.columns = [c.lower().strip() for c in df.columns]
     if 'opinion' not in df.columns or 'respuesta' not in df.columns:
-        return jsonify({"error": "El CSV debe tener columnas 'Opinion' y 'Respuesta'."}), 400
+        raise ErrorCSV("El CSV debe tener columnas 'Opinion' y 'Respuesta'.")
+    progress_cb(5)
     # Procesar sentimientos
-    df = analizar_sentimientos_df(df)
+    df = analizar_sentimientos_df(df, progress_cb=progreso_tramo(progress_cb, 5, 90))
     # Guardar CSV con timestamp
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     resultado_path = os.path.join(SENTIMENTS_FOLDER, f"sentimientos_{timestamp}.csv")
     df.to_csv(resultado_path, index=False, encoding='utf-8-sig')
-    # Graficar y enviar imagen
-    buf = graficar_sentimientos_backend(df)
-    import base64
-    img_b64 = base64.b64encode(buf.getvalue()).decode()
-    return jsonify({
+    positivos = int((df['sentimiento_predicho'] == 'positivo').sum())
+    negativos = int((df['sentimiento_predicho'] == 'negativo').sum())
+    return {
         "archivo_guardado": resultado_path,
-        "grafica_b64": img_b64,
+        "grafica_url": url_grafica_sentimientos(positivos, negativos),
         "filas": len(df),
-        "positivos": int((df['sentimiento_predicho'] == 'positivo').sum()),
-        "negativos": int((df['sentimiento_predicho'] == 'negativo').sum()),
+        "positivos": positivos,
+        "negativos": negativos,
         "neutros": int((df['sentimiento_predicho'] == 'neutro').sum())
-    })
+    }
+
+@app.route("/sentimientos", methods=["POST"])
+def analizar_sentimientos():
+    archivo = request.files.get("file")
+    if not archivo:
+        return jsonify({"error": "No se subió ningún archivo"}), 400
+    if pide_async():
+        return encolar_analisis("sentimientos", archivo, sentimientos_de_csv)
+    try:
+        return jsonify(sentimientos_de_csv(archivo.stream))
+    except ErrorCSV as e:
+        return jsonify({"error": str(e)}), 400
 
 @app.route("/descargar_sentimiento/<filename>")
 def descargar_sentimiento(filename):
@@ -568,198 +2990,678 @@ def listar_sentimientos():
                 })
     return jsonify({"archivos": archivos})
 # --- NUEVO BLOQUE: MÉTRICAS Y EVALUACIÓN ---
-import pandas as pd
-import numpy as np
-import re
-import spacy
-import nltk
-from nltk.corpus import stopwords
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.linear_model import LogisticRegression
-from sklearn.metrics import accuracy_score, f1_score, recall_score, precision_score, classification_report, confusion_matrix
-from flask import Flask, request, jsonify
-from imblearn.over_sampling import SMOTE
-from imblearn.combine import SMOTETomek
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import seaborn as sns
-import io
-import base64
 
-# Cargar recursos NLP
-nlp = spacy.load('es_core_news_sm')
-nltk.download('stopwords')
-stop_words = set(stopwords.words('spanish'))
+PALABRAS_IMPORTANTES = {'no', 'ni', 'nunca', 'tampoco', 'nada', 'sin', 'pero'}
+_RE_URL_EMAIL = re.compile(r'https?://\S+|www\.\S+|\S+@\S+')
+_RE_NO_PALABRA = re.compile(r'[^\w\s!?¡¿]')
+_RE_DIGITOS = re.compile(r'\d+')
+_RE_ESPACIOS = re.compile(r'\s+')
 
-def limpiar_texto_avanzado(texto):
-    if not texto or pd.isna(texto):
-        return ""
-    texto = str(texto).lower()
-    texto = re.sub(r'https?://\S+|www\.\S+|\S+@\S+', '', texto)
-    texto = re.sub(r'[^\w\s!?¡¿]', ' ', texto)
-    texto = re.sub(r'\d+', '', texto)
-    texto = re.sub(r'\s+', ' ', texto).strip()
-    doc = nlp(texto)
-    palabras_importantes = {'no', 'ni', 'nunca', 'tampoco', 'nada', 'sin', 'pero'}
-    tokens = [token.lemma_ for token in doc if (token.text not in stop_words or token.text in palabras_importantes) and not token.is_space]
-    return ' '.join(tokens)
-
-def extraer_pos_tags(texto):
-    if not texto or pd.isna(texto) or len(texto.strip()) == 0:
-        return ""
-    try:
-        doc = nlp(texto)
-        pos_tags = [f"{token.text}_{token.pos_}" for token in doc]
-        return ' '.join(pos_tags)
-    except Exception as e:
-        return ""
+@medir_etapa("cleaning")
+def normalizar_avanzado_serie(serie):
+    """Normalización por regex (URLs, correos, símbolos, dígitos) aplicada a toda la columna"""
+    texto = serie.fillna("")
+    texto = texto.where(texto.astype(bool), "").astype(str).str.lower()
+    texto = texto.str.replace(_RE_URL_EMAIL, '', regex=True)
+    texto = texto.str.replace(_RE_NO_PALABRA, ' ', regex=True)
+    texto = texto.str.replace(_RE_DIGITOS, '', regex=True)
+    return texto.str.replace(_RE_ESPACIOS, ' ', regex=True).str.strip()
 
-@app.route('/evaluar_metricas_entrenando', methods=['POST'])
-def evaluar_metricas_entrenando():
-    archivo = request.files.get('file')
-    if not archivo:
-        return jsonify({'error': 'No se subió ningún archivo'}), 400
+def analizar_respuestas_serie(serie, batch_size=None, progress_cb=None):
+    """Un solo análisis spaCy por respuesta para obtener lemas y etiquetas POS.
+
+    Devuelve (texto_limpio, pos_tags). Ambas salidas salen del mismo Doc del
+    texto normalizado, así que las POS se etiquetan sobre la frase original
+    y no sobre los lemas ya unidos.
+    """
+    normalizado = normalizar_avanzado_serie(serie)
+    nlp = modelo_spacy.get()
+    stop_words = stopwords_es()
+    disable = [nombre for nombre in LEMMA_DISABLE if nombre in nlp.pipe_names]
+
+    def procesar(doc):
+        tokens = [token for token in doc
+                  if (token.text not in stop_words or token.text in PALABRAS_IMPORTANTES) and not token.is_space]
+        return [
+            ' '.join(token.lemma_ for token in tokens),
+            ' '.join(f"{token.lemma_}_{token.pos_}" for token in tokens)
+        ]
+
+    with medir_etapa("lemmatization"):
+        resultados, _ = pipe_con_cache("analisis", normalizado.tolist(), procesar,
+                                       batch_size=batch_size, disable=disable, progress_cb=progress_cb)
+    texto_limpio = pd.Series([r[0] for r in resultados], index=serie.index)
+    pos_tags = pd.Series([r[1] for r in resultados], index=serie.index)
+    return texto_limpio, pos_tags
+
+# Selección de modelo: las configuraciones se evalúan en paralelo y, opcionalmente,
+# con validación cruzada estratificada sobre el conjunto de entrenamiento
+METRICAS_WORKERS = int(os.environ.get("METRICAS_WORKERS", min(3, os.cpu_count() or 1)))
+METRICAS_CV_FOLDS = int(os.environ.get("METRICAS_CV_FOLDS", "0"))  # 0 = solo split train/test
+
+CONFIGURACIONES_LR = [
+    {
+        'nombre': 'Config 1: Penalizar clase negativa',
+        'params': {
+            'C': 0.1,
+            'class_weight': {1: 0.5, 2: 3.0, 3: 5.0},
+            'solver': 'liblinear',
+            'penalty': 'l1',
+            'max_iter': 5000,
+            'random_state': 42
+        }
+    },
+    {
+        'nombre': 'Config 2: Menor regularización',
+        'params': {
+            'C': 1.0,  # Menos regularización
+            'class_weight': {1: 0.2, 2: 2.0, 3: 3.0},
+            'solver': 'liblinear',
+            'penalty': 'l2',  # L2 en vez de L1
+            'max_iter': 5000,
+            'random_state': 42
+        }
+    },
+    {
+        'nombre': 'Config 3: Auto-balance',
+        'params': {
+            'C': 0.5,
+            'class_weight': 'balanced',
+            'solver': 'newton-cg',  # Solver alternativo
+            'penalty': 'l2',
+            'max_iter': 5000,
+            'random_state': 42
+        }
+    }
+]
+
+def rss_actual_mb():
+    """RSS actual del proceso en MB (pico histórico si no hay /proc)"""
     try:
-        df = pd.read_csv(archivo, encoding='utf-8')
-    except UnicodeDecodeError:
-        df = pd.read_csv(archivo, encoding='latin-1')
-    df.columns = [c.lower().strip() for c in df.columns]
-    if 'respuesta' not in df.columns or 'sentimiento_predicho' not in df.columns:
-        return jsonify({'error': "El CSV debe tener columnas 'respuesta' y 'sentimiento_predicho'."}), 400
-
-    # Limpiar texto y extraer POS
-    df['texto_limpio'] = df['respuesta'].apply(limpiar_texto_avanzado)
-    df['pos_tags'] = df['texto_limpio'].apply(extraer_pos_tags)
-
-    # Vectorizador TF-IDF texto y POS
-    tfidf_texto = TfidfVectorizer(max_features=500, min_df=2, max_df=0.9, ngram_range=(1,2), sublinear_tf=True, use_idf=True, norm='l2')
-    tfidf_pos = TfidfVectorizer(max_features=300, ngram_range=(1,2), min_df=1, sublinear_tf=True)
-    texto_features = tfidf_texto.fit_transform(df['texto_limpio'])
-    pos_features = tfidf_pos.fit_transform(df['pos_tags'])
-    X = np.hstack([texto_features.toarray(), pos_features.toarray()])
-
-    # Mapear sentimiento
-    mapping = {'negativo': 1, 'neutro': 2, 'positivo': 3}
-    y = df['sentimiento_predicho'].astype(str).str.strip().str.lower().map(mapping)
-    mask = ~y.isna()
-    X = X[mask]
-    y = y[mask].astype(int)
-    if len(y) == 0:
-        return jsonify({'error': 'No hay datos válidos para entrenar/comparar.'}), 400
-
-    # Split datos
-    from sklearn.model_selection import train_test_split
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, stratify=y, random_state=42)
-
-    # Balanceo agresivo con SMOTE
-    clases, conteos = np.unique(y_train, return_counts=True)
+        with open('/proc/self/statm') as f:
+            paginas = int(f.read().split()[1])
+        return paginas * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+class MedidorMemoria:
+    """Muestrea el RSS del proceso en segundo plano mientras dura el bloque `with`"""
+
+    def __init__(self, intervalo=0.05):
+        self.intervalo = intervalo
+        self.inicial = self.pico = 0.0
+        self._parar = threading.Event()
+        self._hilo = None
+
+    def __enter__(self):
+        self.inicial = self.pico = rss_actual_mb()
+        self._hilo = threading.Thread(target=self._muestrear, daemon=True)
+        self._hilo.start()
+        return self
+
+    def _muestrear(self):
+        while not self._parar.wait(self.intervalo):
+            self.pico = max(self.pico, rss_actual_mb())
+
+    def __exit__(self, *exc):
+        self._parar.set()
+        self._hilo.join()
+        self.pico = max(self.pico, rss_actual_mb())
+        return False
+
+def balancear_smote(X, y):
+    """SMOTE con los objetivos por clase de siempre; acepta y devuelve matrices dispersas"""
+    with medir_import("imblearn"):
+        from imblearn.over_sampling import SMOTE
+    clases, conteos = np.unique(y, return_counts=True)
     target_counts = {1: min(conteos[0], 40), 2: 50, 3: 50}
+    # SMOTE sólo sobremuestrea: una clase que ya supera su objetivo se deja como está
+    actuales = dict(zip(clases.tolist(), conteos.tolist()))
+    target_counts = {clase: max(objetivo, actuales.get(clase, 0)) for clase, objetivo in target_counts.items()}
     smote = SMOTE(sampling_strategy=target_counts, random_state=42, k_neighbors=min(5, min(conteos)-1))
-    X_resampled, y_resampled = smote.fit_resample(X_train, y_train)
-
-    # Probar diferentes configuraciones de Regresión Logística
-    configuraciones = [
-        {
-            'nombre': 'Config 1: Penalizar clase negativa',
-            'params': {
-                'C': 0.1,
-                'class_weight': {1: 0.5, 2: 3.0, 3: 5.0},
-                'solver': 'liblinear',
-                'penalty': 'l1',
-                'max_iter': 5000,
-                'random_state': 42
-            }
-        },
-        {
-            'nombre': 'Config 2: Menor regularización',
-            'params': {
-                'C': 1.0,  # Menos regularización
-                'class_weight': {1: 0.2, 2: 2.0, 3: 3.0},
-                'solver': 'liblinear',
-                'penalty': 'l2',  # L2 en vez de L1
-                'max_iter': 5000,
-                'random_state': 42
-            }
-        },
-        {
-            'nombre': 'Config 3: Auto-balance',
-            'params': {
-                'C': 0.5,
-                'class_weight': 'balanced',
-                'solver': 'newton-cg',  # Solver alternativo
-                'penalty': 'l2',
-                'max_iter': 5000,
-                'random_state': 42
-            }
-        }
-    ]
+    return smote.fit_resample(X, y)
+
+def puntuar_prediccion(y_true, y_pred):
+    """F1 macro penalizado si el modelo deja clases sin predecir o las desbalancea"""
+    from sklearn.metrics import classification_report
+    report = classification_report(y_true, y_pred, output_dict=True, zero_division=0)
+    pred_clases, pred_conteos = np.unique(y_pred, return_counts=True)
+    pred_distribucion = {cls: count for cls, count in zip(pred_clases, pred_conteos)}
+    for cls in [1, 2, 3]:
+        if cls not in pred_distribucion:
+            pred_distribucion[cls] = 0
+    clases_predichas = len([v for v in pred_distribucion.values() if v > 0])
+    balance_pred = min(pred_distribucion.values()) / max(pred_distribucion.values()) if max(pred_distribucion.values()) > 0 else 0
+    f1_macro = report['macro avg']['f1-score'] if 'macro avg' in report else 0
+    return f1_macro * (0.5 + 0.5 * balance_pred) * (clases_predichas / 3.0)
+
+def ajustar_y_puntuar(params, X_train, y_train, X_eval, y_eval):
+    from sklearn.linear_model import LogisticRegression
+    modelo = LogisticRegression(**params)
+    modelo.fit(X_train, y_train)
+    return modelo, puntuar_prediccion(y_eval, modelo.predict(X_eval))
+
+def seleccionar_configuracion(X_train, y_train, X_resampled, y_resampled, X_test, y_test, cv_folds=0, workers=None):
+    """Evalúa CONFIGURACIONES_LR en paralelo y devuelve (mejor_config, mejor_modelo, detalle).
+
+    Sin validación cruzada cada configuración se entrena con el train balanceado y
+    se puntúa contra el test, como siempre. Con cv_folds >= 2 se puntúa por la media
+    de los folds del train (SMOTE dentro de cada fold) y el modelo ganador se vuelve
+    a entrenar con todo el train balanceado.
+    """
+    from sklearn.linear_model import LogisticRegression
+    workers = workers or METRICAS_WORKERS
+    if cv_folds >= 2:
+        from sklearn.model_selection import StratifiedKFold
+        y_array = np.asarray(y_train)
+        splitter = StratifiedKFold(n_splits=cv_folds, shuffle=True, random_state=42)
+        folds = []
+        for train_idx, val_idx in splitter.split(X_train, y_array):
+            X_fold, y_fold = balancear_smote(X_train[train_idx], y_array[train_idx])
+            folds.append((X_fold, y_fold, X_train[val_idx], y_array[val_idx]))
+    else:
+        folds = [(X_resampled, y_resampled, X_test, y_test)]
+
+    tareas = [(i, f) for i in range(len(CONFIGURACIONES_LR)) for f in range(len(folds))]
+    # liblinear y las operaciones dispersas de newton-cg sueltan el GIL, así que
+    # los hilos reparten los ajustes entre núcleos sin copiar la matriz
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(tareas)))) as pool:
+        futuros = {tarea: pool.submit(ajustar_y_puntuar, CONFIGURACIONES_LR[tarea[0]]['params'], *folds[tarea[1]])
+                   for tarea in tareas}
+        resultados = {tarea: futuro.result() for tarea, futuro in futuros.items()}
 
     mejor_config = None
     mejor_puntuacion = 0
     mejor_modelo = None
-
-    # Probar cada configuración
-    for config in configuraciones:
-        modelo = LogisticRegression(**config['params'])
-        modelo.fit(X_resampled, y_resampled)
-        y_pred = modelo.predict(X_test)
-        # Métricas
-        report = classification_report(y_test, y_pred, output_dict=True)
-        pred_clases, pred_conteos = np.unique(y_pred, return_counts=True)
-        pred_distribucion = {cls: count for cls, count in zip(pred_clases, pred_conteos)}
-        for cls in [1, 2, 3]:
-            if cls not in pred_distribucion:
-                pred_distribucion[cls] = 0
-        clases_predichas = len([v for v in pred_distribucion.values() if v > 0])
-        balance_pred = min(pred_distribucion.values()) / max(pred_distribucion.values()) if max(pred_distribucion.values()) > 0 else 0
-        f1_macro = report['macro avg']['f1-score'] if 'macro avg' in report else 0
-        puntuacion = f1_macro * (0.5 + 0.5 * balance_pred) * (clases_predichas / 3.0)
+    detalle = []
+    # Se recorre en el orden original para que los empates se resuelvan igual que antes
+    for i, config in enumerate(CONFIGURACIONES_LR):
+        puntuaciones = [resultados[(i, f)][1] for f in range(len(folds))]
+        puntuacion = float(np.mean(puntuaciones))
+        detalle.append({
+            'nombre': config['nombre'],
+            'puntuacion': round(puntuacion, 4),
+            'puntuaciones_folds': [round(p, 4) for p in puntuaciones] if cv_folds >= 2 else None
+        })
         if puntuacion > mejor_puntuacion:
             mejor_puntuacion = puntuacion
             mejor_config = config
-            mejor_modelo = modelo
+            mejor_modelo = resultados[(i, 0)][0]
 
-    # Entrenar modelo final con la mejor configuración
-    if mejor_modelo is None:
-        mejor_modelo = LogisticRegression(class_weight='balanced', solver='liblinear', max_iter=5000)
+    if mejor_config is not None and cv_folds >= 2:
+        mejor_modelo = LogisticRegression(**mejor_config['params'])
         mejor_modelo.fit(X_resampled, y_resampled)
+    return mejor_config, mejor_modelo, detalle
 
-    y_pred_final = mejor_modelo.predict(X_test)
-
-    # Métricas finales
-    acc = accuracy_score(y_test, y_pred_final)
-    recall = recall_score(y_test, y_pred_final, average='macro')
-    precision = precision_score(y_test, y_pred_final, average='macro')
-    f1 = f1_score(y_test, y_pred_final, average='macro')
-    report = classification_report(y_test, y_pred_final, target_names=['negativo', 'neutro', 'positivo'], output_dict=True)
-    cm = confusion_matrix(y_test, y_pred_final, labels=[1,2,3])
-
-    # Graficar matriz de confusión
-    plt.figure(figsize=(7, 6))
-    sns.heatmap(cm, annot=True, fmt='d', cmap='viridis', xticklabels=['negativo', 'neutro', 'positivo'], yticklabels=['negativo', 'neutro', 'positivo'])
-    plt.xlabel('Predicción')
-    plt.ylabel('Verdadero')
-    plt.title('Matriz de Confusión')
-    buf = io.BytesIO()
-    plt.tight_layout()
-    plt.savefig(buf, format='png')
-    plt.close()
-    buf.seek(0)
-    img_b64 = base64.b64encode(buf.getvalue()).decode()
+def evaluar_de_csv(origen, cv_folds=None, progress_cb=None):
+    """Entrena y evalúa el clasificador con un CSV etiquetado; devuelve el dict de respuesta o lanza ErrorCSV"""
+    with medir_import("sklearn"):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.linear_model import LogisticRegression
+        from sklearn.metrics import accuracy_score, f1_score, recall_score, precision_score, classification_report, confusion_matrix
+    with medir_import("scipy.sparse"):
+        from scipy import sparse
+    progress_cb = progress_cb or (lambda pct: None)
+    cv_folds = METRICAS_CV_FOLDS if cv_folds is None else cv_folds
+    with medir_etapa("csv_parse"):
+        try:
+            df = pd.read_csv(origen, encoding='utf-8')
+        except UnicodeDecodeError:
+            origen.seek(0)
+            df = pd.read_csv(origen, encoding='latin-1')
+    df.columns = [c.lower().strip() for c in df.columns]
+    if 'respuesta' not in df.columns or 'sentimiento_predicho' not in df.columns:
+        raise ErrorCSV("El CSV debe tener columnas 'respuesta' y 'sentimiento_predicho'.")
+    progress_cb(5)
 
-    return jsonify({
+    inicio = time.perf_counter()
+    tiempos = {}
+    with MedidorMemoria() as memoria:
+        # Limpiar texto y extraer POS (un solo análisis spaCy por respuesta)
+        t = time.perf_counter()
+        df['texto_limpio'], df['pos_tags'] = analizar_respuestas_serie(df['respuesta'], progress_cb=progreso_tramo(progress_cb, 5, 60))
+        tiempos['analisis_spacy'] = time.perf_counter() - t
+
+        # Vectorizador TF-IDF texto y POS; la matriz se mantiene dispersa (CSR)
+        t = time.perf_counter()
+        tfidf_texto = TfidfVectorizer(max_features=500, min_df=2, max_df=0.9, ngram_range=(1,2), sublinear_tf=True, use_idf=True, norm='l2')
+        tfidf_pos = TfidfVectorizer(max_features=300, ngram_range=(1,2), min_df=1, sublinear_tf=True)
+        with medir_etapa("tfidf_fit"):
+            texto_features = tfidf_texto.fit_transform(df['texto_limpio'])
+            pos_features = tfidf_pos.fit_transform(df['pos_tags'])
+        X = sparse.hstack([texto_features, pos_features], format='csr')
+        tiempos['vectorizacion'] = time.perf_counter() - t
+
+        # Mapear sentimiento
+        mapping = {'negativo': 1, 'neutro': 2, 'positivo': 3}
+        y = df['sentimiento_predicho'].astype(str).str.strip().str.lower().map(mapping)
+        mask = ~y.isna()
+        X = X[mask.to_numpy()]
+        y = y[mask].astype(int)
+        if len(y) == 0:
+            raise ErrorCSV('No hay datos válidos para entrenar/comparar.')
+        progress_cb(65)
+
+        # Split datos
+        from sklearn.model_selection import train_test_split
+        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, stratify=y, random_state=42)
+
+        # Balanceo agresivo con SMOTE (trabaja directamente sobre la matriz dispersa)
+        t = time.perf_counter()
+        X_resampled, y_resampled = balancear_smote(X_train, y_train)
+        tiempos['smote'] = time.perf_counter() - t
+        progress_cb(70)
+
+        # Probar diferentes configuraciones de Regresión Logística en paralelo
+        if cv_folds >= 2:
+            cv_folds = min(cv_folds, int(np.unique(y_train, return_counts=True)[1].min()))
+        t = time.perf_counter()
+        try:
+            mejor_config, mejor_modelo, detalle_configs = seleccionar_configuracion(
+                X_train, y_train, X_resampled, y_resampled, X_test, y_test, cv_folds=cv_folds
+            )
+        except ValueError as e:
+            raise ErrorCSV(f'No se pudo evaluar con validación cruzada ({cv_folds} folds): {e}')
+        tiempos['seleccion_modelo'] = time.perf_counter() - t
+        progress_cb(90)
+
+        # Entrenar modelo final con la mejor configuración
+        if mejor_modelo is None:
+            mejor_modelo = LogisticRegression(class_weight='balanced', solver='liblinear', max_iter=5000)
+            mejor_modelo.fit(X_resampled, y_resampled)
+
+        y_pred_final = mejor_modelo.predict(X_test)
+
+        # Métricas finales
+        acc = accuracy_score(y_test, y_pred_final)
+        recall = recall_score(y_test, y_pred_final, average='macro')
+        precision = precision_score(y_test, y_pred_final, average='macro')
+        f1 = f1_score(y_test, y_pred_final, average='macro')
+        report = classification_report(y_test, y_pred_final, target_names=['negativo', 'neutro', 'positivo'], output_dict=True)
+        cm = confusion_matrix(y_test, y_pred_final, labels=[1,2,3])
+
+        # Guardar modelo + vectorizadores como versión reutilizable por /clasificar
+        t = time.perf_counter()
+        try:
+            modelo_version = registro_clasificadores.guardar(mejor_modelo, tfidf_texto, tfidf_pos, {
+                'configuracion': mejor_config['nombre'] if mejor_config else "Balanced Default",
+                'accuracy': round(acc, 4),
+                'f1': round(f1, 4),
+                'n_entrenamiento': int(len(y_train)),
+                'n_test': int(len(y_test)),
+                'n_features': int(X.shape[1]),
+                'cv_folds': cv_folds if cv_folds >= 2 else None
+            })
+            if MODELOS_AUTO_ACTIVAR:
+                registro_clasificadores.activar(modelo_version)
+        except Exception as e:
+            logger.warning(f"No se pudo guardar el clasificador: {e}")
+            modelo_version = None
+        tiempos['guardar_modelo'] = time.perf_counter() - t
+
+    return {
         'matriz_confusion': cm.tolist(),
-        'grafica_b64': img_b64,
+        'grafica_url': url_grafica_matriz(cm),
         'accuracy': round(acc, 4),
         'recall': round(recall, 4),
         'precision': round(precision, 4),
         'f1': round(f1, 4),
         'report': report,
         'n_muestras': int(len(y_test)),
-        'mejor_configuracion': mejor_config['nombre'] if mejor_config else "Balanced Default"
+        'mejor_configuracion': mejor_config['nombre'] if mejor_config else "Balanced Default",
+        'configuraciones': detalle_configs,
+        'cv_folds': cv_folds if cv_folds >= 2 else None,
+        'modelo_version': modelo_version,
+        'n_features': int(X.shape[1]),
+        'densidad_features': round(X.nnz / (X.shape[0] * X.shape[1]), 4) if X.shape[0] * X.shape[1] else 0,
+        'rendimiento': {
+            'tiempo_total_s': round(time.perf_counter() - inicio, 3),
+            'tiempos_s': {etapa: round(s, 3) for etapa, s in tiempos.items()},
+            'memoria_inicial_mb': round(memoria.inicial, 1),
+            'memoria_pico_mb': round(memoria.pico, 1),
+            'workers': METRICAS_WORKERS
+        }
+    }
+
+@app.route('/evaluar_metricas_entrenando', methods=['POST'])
+def evaluar_metricas_entrenando():
+    archivo = request.files.get('file')
+    if not archivo:
+        return jsonify({'error': 'No se subió ningún archivo'}), 400
+    cv_folds = request.form.get('cv_folds', METRICAS_CV_FOLDS, type=int)
+    if pide_async():
+        return encolar_analisis("evaluar", archivo, evaluar_de_csv, cv_folds=cv_folds)
+    try:
+        return jsonify(evaluar_de_csv(archivo.stream, cv_folds=cv_folds))
+    except ErrorCSV as e:
+        return jsonify({'error': str(e)}), 400
+
+# ================================
+# CLASIFICADOR PERSISTIDO (TF-IDF + REGRESIÓN LOGÍSTICA)
+# ================================
+
+MODELOS_FOLDER = os.environ.get("MODELOS_FOLDER", os.path.join(BASE_DIR, 'modelos'))
+# Por defecto un modelo recién entrenado no se activa solo: se elige con /modelos/<version>/activar
+MODELOS_AUTO_ACTIVAR = os.environ.get("MODELOS_AUTO_ACTIVAR", "0") == "1"
+MODELOS_EN_MEMORIA = int(os.environ.get("MODELOS_EN_MEMORIA", "2"))
+# Versiones que se conservan en disco; las más antiguas se borran (nunca la activa)
+MODELOS_MAX_VERSIONES = int(os.environ.get("MODELOS_MAX_VERSIONES", "10"))
+ETIQUETAS_SENTIMIENTO = {1: 'negativo', 2: 'neutro', 3: 'positivo'}
+
+class ModeloNoEncontrado(Exception):
+    pass
+
+class RegistroClasificadores:
+    """Versiones del clasificador entrenado en /evaluar_metricas_entrenando.
+
+    Cada versión es un .joblib con el modelo y los dos vectorizadores, más un
+    .json con sus metadatos para listar sin cargar nada. La versión activa se
+    guarda en activo.txt y los artefactos cargados se mantienen en memoria.
+    Sólo se conservan las `max_versiones` más recientes (más la activa).
+    """
+
+    VERSION_RE = re.compile(r'^clasificador_\d{8}_\d{6}_[0-9a-f]{6}$')
+
+    def __init__(self, folder, en_memoria=2, max_versiones=10):
+        self.folder = folder
+        self.en_memoria = max(1, en_memoria)
+        self.max_versiones = max(1, max_versiones)
+        self._cargados = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+
+    def _ruta(self, version, extension):
+        if not self.VERSION_RE.match(version or ""):
+            raise ModeloNoEncontrado(f"Versión inválida: {version}")
+        return os.path.join(self.folder, f"{version}.{extension}")
+
+    def guardar(self, modelo, tfidf_texto, tfidf_pos, metadatos):
+        import joblib
+        version = f"clasificador_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+        artefacto = {"modelo": modelo, "tfidf_texto": tfidf_texto, "tfidf_pos": tfidf_pos}
+        metadatos = dict(metadatos, version=version, creado=datetime.now().isoformat())
+        # Se escribe a un temporal y se renombra para no dejar artefactos a medias
+        ruta = self._ruta(version, "joblib")
+        joblib.dump(artefacto, ruta + ".tmp")
+        os.replace(ruta + ".tmp", ruta)
+        with open(self._ruta(version, "json"), 'w', encoding='utf-8') as f:
+            json.dump(metadatos, f, ensure_ascii=False, indent=2)
+        logger.info(f"Clasificador guardado: {version}")
+        self.podar()
+        return version
+
+    def podar(self):
+        """Borra las versiones más antiguas por encima de max_versiones, salvo la activa"""
+        activa = self.version_activa()
+        versiones = []
+        for filename in os.listdir(self.folder):
+            version, extension = os.path.splitext(filename)
+            if extension == ".joblib" and self.VERSION_RE.match(version):
+                versiones.append((os.stat(os.path.join(self.folder, filename)).st_mtime_ns, version))
+        # Más recientes primero (el nombre sólo tiene resolución de segundos)
+        versiones = [v for _, v in sorted(versiones, reverse=True)]
+        borradas = [v for v in versiones[self.max_versiones:] if v != activa]
+        for version in borradas:
+            for extension in ("joblib", "json"):
+                ruta = self._ruta(version, extension)
+                if os.path.exists(ruta):
+                    os.remove(ruta)
+            with self._lock:
+                self._cargados.pop(version, None)
+        if borradas:
+            logger.info(f"Clasificadores antiguos borrados: {', '.join(borradas)}")
+        return borradas
+
+    def version_activa(self):
+        try:
+            with open(os.path.join(self.folder, "activo.txt"), encoding='utf-8') as f:
+                version = f.read().strip()
+        except OSError:
+            return None
+        return version if self.VERSION_RE.match(version) and os.path.exists(self._ruta(version, "joblib")) else None
+
+    def activar(self, version):
+        if not os.path.exists(self._ruta(version, "joblib")):
+            raise ModeloNoEncontrado(f"No existe la versión {version}")
+        ruta = os.path.join(self.folder, "activo.txt")
+        with open(ruta + ".tmp", 'w', encoding='utf-8') as f:
+            f.write(version)
+        os.replace(ruta + ".tmp", ruta)
+        logger.info(f"Clasificador activo: {version}")
+
+    def listar(self):
+        activa = self.version_activa()
+        versiones = []
+        for filename in sorted(os.listdir(self.folder), reverse=True):
+            version, extension = os.path.splitext(filename)
+            if extension != ".json" or not self.VERSION_RE.match(version):
+                continue
+            try:
+                with open(os.path.join(self.folder, filename), encoding='utf-8') as f:
+                    metadatos = json.load(f)
+            except (OSError, ValueError):
+                continue
+            metadatos["activo"] = version == activa
+            versiones.append(metadatos)
+        return versiones
+
+    def cargar(self, version=None):
+        """Devuelve (version, artefacto); se lee del disco solo la primera vez"""
+        version = version or self.version_activa()
+        if version is None:
+            raise ModeloNoEncontrado("No hay ningún clasificador activo; entrena uno con /evaluar_metricas_entrenando "
+                                     "y actívalo con /modelos/<version>/activar")
+        ruta = self._ruta(version, "joblib")
+        with self._lock:
+            if version in self._cargados:
+                self._cargados.move_to_end(version)
+                return version, self._cargados[version]
+            if not os.path.exists(ruta):
+                raise ModeloNoEncontrado(f"No existe la versión {version}")
+            import joblib
+            artefacto = joblib.load(ruta)
+            self._cargados[version] = artefacto
+            while len(self._cargados) > self.en_memoria:
+                self._cargados.popitem(last=False)
+            return version, artefacto
+
+registro_clasificadores = RegistroClasificadores(MODELOS_FOLDER, MODELOS_EN_MEMORIA, MODELOS_MAX_VERSIONES)
+
+def clasificar_respuestas(serie, version=None):
+    """Clasifica una serie de respuestas con el clasificador persistido (sin transformers)"""
+    with medir_import("scipy.sparse"):
+        from scipy import sparse
+    version, artefacto = registro_clasificadores.cargar(version)
+    texto_limpio, pos_tags = analizar_respuestas_serie(serie.fillna("").astype(str))
+    X = sparse.hstack([
+        artefacto["tfidf_texto"].transform(texto_limpio),
+        artefacto["tfidf_pos"].transform(pos_tags)
+    ], format='csr')
+    modelo = artefacto["modelo"]
+    pred = modelo.predict(X)
+    confianza = modelo.predict_proba(X).max(axis=1) if hasattr(modelo, "predict_proba") else None
+    resultado = pd.DataFrame({
+        "sentimiento_predicho": [ETIQUETAS_SENTIMIENTO.get(int(p), "No disponible") for p in pred]
+    }, index=serie.index)
+    if confianza is not None:
+        resultado["confianza"] = np.round(confianza, 4)
+    return version, resultado
+
+@app.route("/clasificar", methods=["POST"])
+def clasificar():
+    """Clasifica un CSV (columna 'respuesta') o un JSON {"textos": [...]} con el modelo activo"""
+    datos_json = request.get_json(silent=True) if request.is_json else None
+    version = (datos_json or {}).get("version") or request.form.get("version") or request.args.get("version")
+    if datos_json is not None:
+        textos = datos_json.get("textos")
+        if not isinstance(textos, list):
+            return jsonify({"error": "El JSON debe tener una lista 'textos'."}), 400
+        df = None
+        serie = pd.Series(textos, dtype=object)
+    else:
+        archivo = request.files.get("file")
+        if not archivo:
+            return jsonify({"error": "Envía un CSV en 'file' o un JSON con 'textos'"}), 400
+        try:
+            df = pd.read_csv(archivo, encoding='utf-8')
+        except UnicodeDecodeError:
+            archivo.seek(0)
+            df = pd.read_csv(archivo, encoding='latin-1')
+        df.columns = [c.lower().strip() for c in df.columns]
+        if 'respuesta' not in df.columns:
+            return jsonify({"error": "El CSV debe tener una columna 'Respuesta'."}), 400
+        serie = df['respuesta']
+
+    inicio = time.perf_counter()
+    try:
+        version, resultado = clasificar_respuestas(serie, version)
+    except ModeloNoEncontrado as e:
+        return jsonify({"error": str(e)}), 404
+    segundos = time.perf_counter() - inicio
+    conteos = resultado["sentimiento_predicho"].value_counts()
+    respuesta = {
+        "version": version,
+        "filas": len(resultado),
+        "segundos": round(segundos, 3),
+        "positivos": int(conteos.get('positivo', 0)),
+        "negativos": int(conteos.get('negativo', 0)),
+        "neutros": int(conteos.get('neutro', 0))
+    }
+    if df is None:
+        respuesta["predicciones"] = resultado.to_dict(orient="records")
+    else:
+        for columna in resultado.columns:
+            df[columna] = resultado[columna]
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        resultado_path = os.path.join(SENTIMENTS_FOLDER, f"clasificacion_{timestamp}.csv")
+        df.to_csv(resultado_path, index=False, encoding='utf-8-sig')
+        respuesta["archivo_guardado"] = resultado_path
+    return jsonify(respuesta)
+
+@app.route("/modelos", methods=["GET"])
+def listar_modelos():
+    return jsonify({
+        "activo": registro_clasificadores.version_activa(),
+        "modelos": registro_clasificadores.listar()
     })
 
+@app.route("/modelos/<version>/activar", methods=["POST"])
+def activar_modelo(version):
+    try:
+        registro_clasificadores.activar(version)
+    except ModeloNoEncontrado as e:
+        return jsonify({"error": str(e)}), 404
+    return jsonify({"activo": version})
+
+# ================================
+# CALENTAMIENTO DE MODELOS
+# ================================
+
+# Modelos a cargar y probar al arrancar, separados por comas: spacy,sentimientos,whisper
+WARMUP_MODELS = [m.strip() for m in os.environ.get("WARMUP_MODELS", "").split(",") if m.strip()]
+WARMUP_WHISPER_SECONDS = float(os.environ.get("WARMUP_WHISPER_SECONDS", "1"))
+
+def _calentar_spacy():
+    nlp = modelo_spacy.get()
+    if nlp is None:
+        raise Exception(f"Modelo spaCy no instalado: {SPACY_MODEL}")
+    return lambda: list(nlp.pipe(["El servicio fue bueno, pero la espera fue larga."]))
+
+def _calentar_sentimientos():
+    classifier = sentiment_model.get()
+    return lambda: classifier(["El servicio fue muy bueno"], batch_size=1)
+
+def _calentar_whisper():
+    transcription_backend.preparar()
+
+    def inferir():
+        # Un clip en silencio recorre el mismo camino que un trabajo real y deja el modelo en la caché de páginas
+        with tempfile.TemporaryDirectory(dir=JOBS_FOLDER) as tmp:
+            wav_path = os.path.join(tmp, "silencio.wav")
+            with wave.open(wav_path, "wb") as wav:
+                wav.setnchannels(1)
+                wav.setsampwidth(2)
+                wav.setframerate(16000)
+                wav.writeframes(b"\x00\x00" * int(16000 * WARMUP_WHISPER_SECONDS))
+            transcribir_wav(wav_path, os.path.join(tmp, "silencio"))
+    return inferir
+
+class Calentamiento:
+    """Carga los modelos configurados y pasa una inferencia de prueba por cada uno.
+
+    Cada paso devuelve la función de inferencia tras cargar su modelo, así se
+    miden por separado la carga y la primera inferencia.
+    """
+    PASOS = {
+        "spacy": _calentar_spacy,
+        "sentimientos": _calentar_sentimientos,
+        "whisper": _calentar_whisper
+    }
+
+    def __init__(self, modelos):
+        desconocidos = [m for m in modelos if m not in self.PASOS]
+        if desconocidos:
+            logger.warning(f"Modelos de calentamiento desconocidos: {', '.join(desconocidos)}")
+        self.modelos = [m for m in modelos if m in self.PASOS]
+        self.estado = {m: {"estado": "pendiente"} for m in self.modelos}
+        self._lock = threading.Lock()
+        self._hilo = None
+
+    def iniciar(self):
+        """Lanza el calentamiento en segundo plano (una sola vez)"""
+        with self._lock:
+            if self._hilo is None and self.modelos:
+                self._hilo = threading.Thread(target=self.ejecutar, daemon=True)
+                self._hilo.start()
+
+    def ejecutar(self):
+        for modelo in self.modelos:
+            self.estado[modelo] = {"estado": "cargando"}
+            inicio = time.perf_counter()
+            try:
+                inferir = self.PASOS[modelo]()
+                carga = time.perf_counter() - inicio
+                self.estado[modelo] = {"estado": "inferencia", "segundos_carga": round(carga, 3)}
+                inicio = time.perf_counter()
+                inferir()
+                self.estado[modelo] = {
+                    "estado": "listo",
+                    "segundos_carga": round(carga, 3),
+                    "segundos_inferencia": round(time.perf_counter() - inicio, 3)
+                }
+                logger.info(f"🔥 Calentamiento de {modelo}: {self.estado[modelo]}")
+            except Exception as e:
+                self.estado[modelo] = {"estado": "error", "error": str(e)}
+                logger.error(f"Error en el calentamiento de {modelo}: {e}")
+
+    def listo(self):
+        return all(e["estado"] == "listo" for e in self.estado.values())
+
+calentamiento = Calentamiento(WARMUP_MODELS)
+
+@app.route("/ready")
+def ready():
+    """200 cuando los modelos configurados en WARMUP_MODELS ya se cargaron y probaron; 503 si no"""
+    listo = calentamiento.listo()
+    return jsonify({
+        "ready": listo,
+        "calentamiento": {m: dict(e) for m, e in calentamiento.estado.items()},
+        "modelos": {
+            "spacy": modelo_spacy.loaded,
+            "sentimientos": sentiment_model.loaded,
+            "whisper_backend": transcription_backend.nombre,
+            "whisper_disponible": transcription_backend.available()
+        }
+    }), 200 if listo else 503
+
+calentamiento.iniciar()
+
+# Fin del arranque: lo que se importe a partir de aquí cuenta como carga diferida
+TIEMPO_ARRANQUE = round(time.perf_counter() - _INICIO_ARRANQUE, 4)
+_arranque_terminado = True
+logger.info(f"Módulo cargado en {TIEMPO_ARRANQUE}s")
+
 if __name__ == "__main__":
     logger.info("Iniciando servidor Flask...")
     logger.info(f"Directorio base: {BASE_DIR}")
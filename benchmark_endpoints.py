@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark de extremo a extremo de los endpoints con datos sintéticos, sin servicios externos.
+
+Uso:
+    python benchmark_endpoints.py --guardar benchmark_baseline.json
+    python benchmark_endpoints.py --comparar benchmark_baseline.json --tolerancia 0.25
+    python benchmark_endpoints.py --endpoints procesar transcribir --filas 500 5000 --segundos-audio 10 60
+
+Genera encuestas CSV de tamaño creciente para /procesar, /sentimientos y /evaluar_metricas_entrenando,
+y audio WAV de duración creciente para /transcribir, y los pasa por el cliente de pruebas de Flask.
+whisper-cli se sustituye por un script que duerme una latencia configurable y el modelo de sentimientos
+por un clasificador de palabras clave, así que sólo se mide el código de la aplicación.
+spaCy (SPACY_MODEL) y los datos de nltk sí deben estar instalados.
+
+Por escenario se guarda el rendimiento (filas o segundos de audio por segundo), p50/p95 de latencia,
+el pico de RSS y el tiempo medio por petición de cada etapa del pipeline (las de /metrics).
+Con --comparar sale con código 1 si algún escenario empeora más que la tolerancia.
+"""
+
+import argparse
+import atexit
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import wave
+
+import numpy as np
+
+# Estado aislado: BASE_DIR (textos, resultados, cachés, trabajos, modelos...) en un directorio temporal
+TMP = tempfile.mkdtemp(prefix="benchmark_endpoints_")
+os.environ["BASE_DIR"] = TMP
+for variable in ("JOB_STORE_PATH", "MODELOS_FOLDER", "LEMMA_CACHE_PATH"):
+    os.environ.pop(variable, None)
+os.environ["WHISPER_BACKEND"] = "cli"
+os.environ["WARMUP_MODELS"] = ""
+
+import app
+
+POSITIVAS = ["excelente", "bueno", "amable", "rápido", "limpio", "recomiendo", "gracias", "perfecto"]
+NEGATIVAS = ["malo", "lento", "sucio", "caro", "terrible", "grosero", "tardaron", "nunca"]
+NEUTRAS = ["servicio", "atención", "personal", "tienda", "producto", "precio", "horario", "envío",
+           "el", "la", "fue", "muy", "pero", "un", "poco", "lugar", "espera", "calidad"]
+
+PLANTILLA_WHISPER = """#!{python}
+import sys, time, wave
+args = sys.argv[1:]
+entrada, salida = args[args.index("-f") + 1], args[args.index("-of") + 1]
+try:
+    with wave.open(entrada, "rb") as w:
+        duracion = w.getnframes() / float(w.getframerate())
+except Exception:
+    duracion = 0.0
+espera = ({latencia} + {por_segundo} * duracion) / 4
+for progreso in (25, 50, 75, 100):
+    time.sleep(espera)
+    print(f"whisper_print_progress_callback: progress = {{progreso}}%", file=sys.stderr, flush=True)
+with open(salida + ".txt", "w", encoding="utf-8") as f:
+    f.write("transcripción sintética de {{:.1f}} segundos".format(duracion))
+"""
+
+def instalar_whisper_falso(latencia, por_segundo):
+    """Apunta WHISPER_BINARY/WHISPER_MODEL a un whisper-cli simulado con la latencia pedida"""
+    binario = os.path.join(TMP, "whisper-cli")
+    with open(binario, "w") as f:
+        f.write(PLANTILLA_WHISPER.format(python=sys.executable, latencia=latencia, por_segundo=por_segundo))
+    os.chmod(binario, 0o755)
+    modelo = os.path.join(TMP, "ggml-falso.bin")
+    open(modelo, "wb").close()
+    app.WHISPER_BINARY, app.WHISPER_MODEL = binario, modelo
+
+def clasificador_local(textos, batch_size=None, **kwargs):
+    """Sustituto del pipeline de transformers: estrellas según palabras positivas y negativas"""
+    salidas = []
+    for texto in textos:
+        palabras = str(texto).lower().split()
+        puntos = sum(p in POSITIVAS for p in palabras) - sum(p in NEGATIVAS for p in palabras)
+        estrellas = 3 + max(-2, min(2, puntos))
+        salidas.append({"label": "1 star" if estrellas == 1 else f"{estrellas} stars", "score": 1.0})
+    return salidas
+
+def generar_encuesta(filas, seed):
+    """CSV Opinion,Respuesta,sentimiento_predicho válido para los tres endpoints de CSV"""
+    rng = random.Random(seed)
+    lineas = ["Opinion,Respuesta,sentimiento_predicho"]
+    for i in range(filas):
+        sentimiento = rng.choice(["positivo", "negativo", "neutro"])
+        palabras = rng.choices(NEUTRAS, k=rng.randint(4, 12))
+        if sentimiento != "neutro":
+            palabras += rng.choices(POSITIVAS if sentimiento == "positivo" else NEGATIVAS, k=rng.randint(1, 3))
+        rng.shuffle(palabras)
+        lineas.append(f"{i},{' '.join(palabras)},{sentimiento}")
+    return ("\n".join(lineas) + "\n").encode("utf-8")
+
+def generar_audio(segundos, seed):
+    """WAV 16 kHz mono con ruido suave; la semilla evita aciertos en la caché de transcripciones"""
+    muestras = np.random.default_rng(seed).integers(-300, 300, int(segundos * 16000), dtype=np.int16)
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(16000)
+        wav.writeframes(muestras.tobytes())
+    return buf.getvalue()
+
+def subir(client, url, campo, contenido, nombre):
+    return client.post(url, data={campo: (io.BytesIO(contenido), nombre)}, content_type="multipart/form-data")
+
+def peticion_csv(url):
+    def ejecutar(client, contenido):
+        respuesta = subir(client, url, "file", contenido, "encuesta.csv")
+        if respuesta.status_code != 200:
+            raise RuntimeError(f"{url} respondió {respuesta.status_code}: {respuesta.get_json()}")
+    return ejecutar
+
+def peticion_transcripcion(client, contenido, timeout=600):
+    respuesta = subir(client, "/transcribir", "audio", contenido, "audio.wav")
+    if respuesta.status_code != 200:
+        raise RuntimeError(f"/transcribir respondió {respuesta.status_code}: {respuesta.get_json()}")
+    job_id = respuesta.get_json()["job_id"]
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        estado = client.get(f"/estado/{job_id}").get_json()
+        if estado["status"] == "completed":
+            return
+        if estado["status"] == "failed":
+            raise RuntimeError(f"La transcripción falló: {estado.get('error')}")
+        time.sleep(0.01)
+    raise RuntimeError(f"La transcripción no terminó en {timeout}s")
+
+ENDPOINTS = {
+    "procesar": (peticion_csv("/procesar"), "filas"),
+    "sentimientos": (peticion_csv("/sentimientos"), "filas"),
+    "evaluar": (peticion_csv("/evaluar_metricas_entrenando"), "filas"),
+    "transcribir": (peticion_transcripcion, "segundos_audio"),
+}
+
+def medir_escenario(client, ejecutar, generar, tamano, repeticiones):
+    """Una ronda de calentamiento y `repeticiones` medidas, cada una con datos distintos"""
+    ejecutar(client, generar(tamano, seed=0))
+    etapas_antes = app.METRICA_ETAPAS.resumen()
+    latencias = []
+    with app.MedidorMemoria() as memoria:
+        for i in range(repeticiones):
+            contenido = generar(tamano, seed=i + 1)
+            inicio = time.perf_counter()
+            ejecutar(client, contenido)
+            latencias.append(time.perf_counter() - inicio)
+    etapas = {}
+    for etapa, (suma, total) in sorted(app.METRICA_ETAPAS.resumen().items()):
+        suma_antes, total_antes = etapas_antes.get(etapa, (0.0, 0))
+        if total > total_antes:
+            etapas[etapa] = round((suma - suma_antes) / repeticiones, 6)
+    return {
+        "tamano": tamano,
+        "repeticiones": repeticiones,
+        "rendimiento": round(tamano * repeticiones / sum(latencias), 3),
+        "p50_s": round(float(np.percentile(latencias, 50)), 6),
+        "p95_s": round(float(np.percentile(latencias, 95)), 6),
+        "rss_pico_mb": round(memoria.pico, 1),
+        "rss_incremento_mb": round(memoria.pico - memoria.inicial, 1),
+        "etapas_s": etapas
+    }
+
+def comparar(actual, baseline, tolerancia, holgura_s):
+    """Lista de regresiones de `actual` frente a `baseline` (escenarios comunes)"""
+    regresiones = []
+    for clave, res in actual["escenarios"].items():
+        ref = baseline.get("escenarios", {}).get(clave)
+        if not ref or "error" in res or "error" in ref:
+            continue
+        for campo in ("p50_s", "p95_s"):
+            if res[campo] > ref[campo] * (1 + tolerancia) and res[campo] - ref[campo] > holgura_s:
+                regresiones.append(f"{clave}: {campo} {ref[campo]:.4f}s -> {res[campo]:.4f}s")
+        if res["rendimiento"] < ref["rendimiento"] / (1 + tolerancia):
+            regresiones.append(f"{clave}: rendimiento {ref['rendimiento']} -> {res['rendimiento']} {res['unidad']}/s")
+        if res["rss_pico_mb"] > ref["rss_pico_mb"] * (1 + tolerancia):
+            regresiones.append(f"{clave}: RSS pico {ref['rss_pico_mb']} -> {res['rss_pico_mb']} MB")
+    return regresiones
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de endpoints con datos sintéticos")
+    parser.add_argument("--endpoints", nargs="+", choices=list(ENDPOINTS), default=list(ENDPOINTS))
+    parser.add_argument("--filas", type=int, nargs="+", default=[200, 1000, 5000])
+    parser.add_argument("--segundos-audio", type=float, nargs="+", default=[5, 30, 120])
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--latencia-whisper", type=float, default=0.05,
+                        help="Segundos fijos que tarda el whisper-cli simulado por archivo")
+    parser.add_argument("--whisper-por-segundo", type=float, default=0.005,
+                        help="Segundos extra del whisper-cli simulado por segundo de audio")
+    parser.add_argument("--guardar", help="Escribe los resultados como baseline JSON")
+    parser.add_argument("--comparar", help="Baseline JSON contra el que buscar regresiones")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="Empeoramiento relativo permitido")
+    parser.add_argument("--holgura", type=float, default=0.005,
+                        help="Diferencia absoluta de latencia (s) por debajo de la cual no se marca regresión")
+    args = parser.parse_args()
+    atexit.register(shutil.rmtree, TMP, ignore_errors=True)
+
+    instalar_whisper_falso(args.latencia_whisper, args.whisper_por_segundo)
+    # El pipeline real de transformers no se carga nunca
+    app.sentiment_model._classifier = clasificador_local
+    client = app.app.test_client()
+
+    resultados = {
+        "fecha": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("guardar", "comparar")},
+        "escenarios": {}
+    }
+    for nombre in args.endpoints:
+        ejecutar, unidad = ENDPOINTS[nombre]
+        tamanos = args.segundos_audio if unidad == "segundos_audio" else args.filas
+        generar = generar_audio if unidad == "segundos_audio" else generar_encuesta
+        for tamano in tamanos:
+            clave = f"{nombre}/{tamano:g}"
+            try:
+                res = medir_escenario(client, ejecutar, generar, tamano, args.repeticiones)
+            except RuntimeError as e:
+                res = {"tamano": tamano, "error": str(e)}
+                print(f"{clave:28s} ERROR {e}")
+            else:
+                print(f"{clave:28s} {res['rendimiento']:>10,.1f} {unidad}/s  p50 {res['p50_s']:8.3f}s"
+                      f"  p95 {res['p95_s']:8.3f}s  RSS pico {res['rss_pico_mb']:7.1f} MB")
+            res["unidad"] = unidad
+            resultados["escenarios"][clave] = res
+
+    if args.guardar:
+        with open(args.guardar, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, ensure_ascii=False, indent=2)
+        print(f"Baseline guardado en {args.guardar}")
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regresiones = comparar(resultados, baseline, args.tolerancia, args.holgura)
+        for regresion in regresiones:
+            print(f"REGRESIÓN {regresion}")
+        if regresiones:
+            raise SystemExit(1)
+        print(f"Sin regresiones frente a {args.comparar} (tolerancia {args.tolerancia:.0%})")
+
+if __name__ == "__main__":
+    main()
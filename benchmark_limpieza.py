@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Microbenchmark: limpieza fila por fila (.apply) vs. limpieza vectorizada por columna.
+
+Uso:
+    python benchmark_limpieza.py --filas 10000 100000 1000000
+    python benchmark_limpieza.py --csv respuestas.csv --columna RESPUESTA
+
+Verifica además que ambas versiones den exactamente el mismo resultado.
+limpiar_texto_avanzado incluye spaCy, así que se mide con menos filas (--filas-spacy) contra
+el texto limpio de analizar_respuestas_serie, que es lo que usa /evaluar_metricas_entrenando.
+"""
+
+import argparse
+import random
+import re
+import time
+
+import pandas as pd
+
+import app
+
+FRASES = [
+    "Muy bien, el servicio fue EXCELENTE!!!",
+    "No me gustó nada... 0 de 10",
+    "buen servicio",
+    "nada",
+    "Regular; tardaron 45 minutos en atenderme",
+    "¿Por qué no hay más horarios? ¡Urge!",
+    "Visiten www.ejemplo.com o escriban a contacto@ejemplo.mx",
+    "El personal es amable pero el lugar está sucio",
+    "Ã©l dijo que sÃ­",  # mojibake que corrige ftfy
+    "",
+]
+
+def limpiar_texto_avanzado(texto):
+    """Versión original fila por fila (referencia para la versión por columna)"""
+    if not texto or pd.isna(texto):
+        return ""
+    texto = str(texto).lower()
+    texto = re.sub(r'https?://\S+|www\.\S+|\S+@\S+', '', texto)
+    texto = re.sub(r'[^\w\s!?¡¿]', ' ', texto)
+    texto = re.sub(r'\d+', '', texto)
+    texto = re.sub(r'\s+', ' ', texto).strip()
+    doc = app.modelo_spacy.get()(texto)
+    stop_words = app.stopwords_es()
+    tokens = [token.lemma_ for token in doc
+              if (token.text not in stop_words or token.text in app.PALABRAS_IMPORTANTES) and not token.is_space]
+    return ' '.join(tokens)
+
+def generar_columna(filas, seed=42):
+    rng = random.Random(seed)
+    valores = []
+    for _ in range(filas):
+        texto = " ".join(rng.choice(FRASES) for _ in range(rng.randint(1, 4)))
+        valores.append(texto if rng.random() > 0.02 else None)
+    return pd.Series(valores, dtype=object)
+
+def medir(funcion, serie):
+    inicio = time.perf_counter()
+    resultado = funcion(serie)
+    return time.perf_counter() - inicio, resultado
+
+def comparar(nombre, por_fila, vectorizada, serie):
+    t_fila, r_fila = medir(lambda s: s.apply(por_fila), serie)
+    t_vec, r_vec = medir(vectorizada, serie)
+    iguales = r_fila.reset_index(drop=True).equals(r_vec.reset_index(drop=True))
+    print(f"{nombre:28s} {len(serie):>9,d} filas  apply {t_fila:8.3f}s  vectorizado {t_vec:8.3f}s"
+          f"  x{t_fila / t_vec if t_vec else 0:6.1f}  {'OK' if iguales else 'DIFERENTE'}")
+    return iguales
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de limpieza de texto")
+    parser.add_argument("--filas", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--filas-spacy", type=int, default=5_000)
+    parser.add_argument("--csv", help="CSV real a usar en lugar de datos sintéticos")
+    parser.add_argument("--columna", default="RESPUESTA")
+    args = parser.parse_args()
+
+    if args.csv:
+        series = [pd.read_csv(args.csv)[args.columna].astype(object)]
+    else:
+        series = [generar_columna(n) for n in args.filas]
+
+    ok = True
+    for serie in series:
+        # Precalienta la tabla de translate para no medir su construcción
+        app.limpiar_texto_serie(serie.head(1))
+        ok &= comparar("limpiar_texto", app.limpiar_texto, app.limpiar_texto_serie, serie)
+        ok &= comparar("limpiar_texto_sentimiento", app.limpiar_texto_sentimiento,
+                       app.limpiar_texto_sentimiento_serie, serie)
+    if app.modelo_spacy.get() is not None:
+        serie = series[0].head(args.filas_spacy)
+        ok &= comparar("limpiar_texto_avanzado", limpiar_texto_avanzado,
+                       lambda s: app.analizar_respuestas_serie(s)[0], serie)
+    if not ok:
+        raise SystemExit("Las versiones vectorizadas no coinciden con las originales")
+
+if __name__ == "__main__":
+    main()
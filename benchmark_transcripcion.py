@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: transcripción de una sola llamada vs. transcripción paralela por ventanas.
+
+Uso:
+    python benchmark_transcripcion.py --audio entrevista.wav --workers 1 2 4 8
+    python benchmark_transcripcion.py --minutos 10      # genera un WAV sintético
+
+El audio debe estar en WAV 16kHz mono (el mismo que produce convert_audio_to_wav).
+Usa el backend configurado en app.py (WHISPER_BACKEND, WHISPER_BINARY, ...).
+"""
+
+import argparse
+import json
+import math
+import os
+import struct
+import tempfile
+import time
+import wave
+
+import app
+
+def generar_wav(ruta, minutos, rate=16000):
+    """Genera un WAV 16kHz mono con un tono tenue para pruebas"""
+    total = int(minutos * 60 * rate)
+    with wave.open(ruta, "wb") as salida:
+        salida.setnchannels(1)
+        salida.setsampwidth(2)
+        salida.setframerate(rate)
+        bloque = rate
+        for inicio in range(0, total, bloque):
+            n = min(bloque, total - inicio)
+            muestras = (int(800 * math.sin(2 * math.pi * 220 * (inicio + i) / rate)) for i in range(n))
+            salida.writeframes(struct.pack(f"<{n}h", *muestras))
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    texto = ""
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        texto = funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos), texto
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara transcripción single-shot vs. paralela")
+    parser.add_argument("--audio", help="WAV 16kHz mono a transcribir")
+    parser.add_argument("--minutos", type=float, default=5, help="Duración del WAV sintético si no se da --audio")
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4, os.cpu_count() or 2])
+    parser.add_argument("--repeticiones", type=int, default=1)
+    parser.add_argument("--salida", help="Guardar resultados en JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        audio = args.audio
+        if not audio:
+            audio = os.path.join(tmp, "sintetico.wav")
+            generar_wav(audio, args.minutos)
+        with wave.open(audio, "rb") as w:
+            duracion = w.getnframes() / w.getframerate()
+
+        resultados = {"audio": audio, "duracion_s": round(duracion, 1), "backend": app.transcription_backend.nombre, "corridas": []}
+        base, _ = medir(lambda: app.transcribir_wav(audio, os.path.join(tmp, "single")), args.repeticiones)
+        resultados["corridas"].append({"modo": "single", "workers": 1, "segundos": round(base, 2), "speedup": 1.0})
+        print(f"single            {base:8.2f}s  (x1.00)  {duracion / base:6.1f}s audio/s")
+
+        for workers in args.workers:
+            tiempo, _ = medir(lambda: app.transcribir_wav_paralelo(audio, tmp, workers=workers), args.repeticiones)
+            speedup = base / tiempo if tiempo else 0
+            resultados["corridas"].append({"modo": "parallel", "workers": workers, "segundos": round(tiempo, 2), "speedup": round(speedup, 2)})
+            print(f"parallel w={workers:<4d}   {tiempo:8.2f}s  (x{speedup:.2f})  {duracion / tiempo:6.1f}s audio/s")
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -147,9 +147,9 @@ if (elements.trans_btnTranscribir) {
         elements.trans_errorAUD.textContent = '❌ ' + (data.error || "No se pudo iniciar la transcripción");
         return;
       }
-      // Iniciar polling para progreso y resultado
+      // Seguir progreso y resultado (SSE si está disponible, si no polling)
       const jobId = data.job_id;
-      pollTranscripcionEstado(jobId);
+      seguirTranscripcionEstado(jobId);
     } catch (err) {
       elements.trans_btnTranscribir.disabled = false;
       hide(elements.trans_loaderAUD);
@@ -159,6 +159,67 @@ if (elements.trans_btnTranscribir) {
   });
 }
 
+// --- SEGUIMIENTO DEL ESTADO DE LA TRANSCRIPCIÓN ---
+// Devuelve true si el trabajo sigue en curso
+function renderTranscripcionEstado(data) {
+  // Progreso
+  elements.trans_progressContainer.style.display = "block";
+  let progreso = data.progress || 0;
+  elements.trans_progressBar.style.width = progreso + "%";
+  elements.trans_progressText.textContent = `Progreso: ${progreso}%`;
+  // Estado
+  if (data.status === "queued") {
+    const posicion = data.queue_position ? ` (posición ${data.queue_position})` : '';
+    elements.trans_transcriptionStatus.textContent = "En cola" + posicion + "...";
+    return true;
+  } else if (data.status === "processing") {
+    elements.trans_transcriptionStatus.textContent = "Procesando audio (" + progreso + "%)...";
+    return true;
+  } else if (data.status === "completed") {
+    hide(elements.trans_loaderAUD);
+    show(elements.trans_statusAUD);
+    elements.trans_resultadoTranscripcion.innerHTML = data.transcripcion || "Transcripción vacía";
+    elements.trans_resultadoTranscripcion.classList.remove('empty');
+    elements.trans_btnTranscribir.disabled = false;
+    elements.trans_progressBar.style.width = "100%";
+    elements.trans_progressText.textContent = "¡Transcripción completada!";
+  } else if (data.status === "failed") {
+    mostrarErrorTranscripcion(data.error || "Error al transcribir");
+  } else {
+    mostrarErrorTranscripcion("Estado desconocido");
+  }
+  return false;
+}
+
+function mostrarErrorTranscripcion(msg) {
+  hide(elements.trans_loaderAUD);
+  show(elements.trans_errorAUD);
+  elements.trans_errorAUD.textContent = '❌ ' + msg;
+  elements.trans_btnTranscribir.disabled = false;
+  elements.trans_progressContainer.style.display = "none";
+  elements.trans_progressText.textContent = '';
+}
+
+function seguirTranscripcionEstado(jobId) {
+  if (!window.EventSource) {
+    pollTranscripcionEstado(jobId);
+    return;
+  }
+  const source = new EventSource(`/estado/${jobId}/stream`);
+  let terminado = false;
+  source.onmessage = function (event) {
+    if (!renderTranscripcionEstado(JSON.parse(event.data))) {
+      terminado = true;
+      source.close();
+    }
+  };
+  source.onerror = function () {
+    source.close();
+    // Conexión SSE cortada (proxy, servidor sin soporte...): seguir con polling
+    if (!terminado) pollTranscripcionEstado(jobId);
+  };
+}
+
 // --- POLLING DEL ESTADO DE LA TRANSCRIPCIÓN ---
 function pollTranscripcionEstado(jobId) {
   let intentos = 0;
@@ -168,42 +229,15 @@ function pollTranscripcionEstado(jobId) {
       .then(resp => resp.json())
       .then(data => {
         intentos++;
-        // Progreso
-        elements.trans_progressContainer.style.display = "block";
-        let progreso = data.progress || 0;
-        elements.trans_progressBar.style.width = progreso + "%";
-        elements.trans_progressText.textContent = `Progreso: ${progreso}%`;
-        // Estado
-        if (data.status === "processing") {
-          elements.trans_transcriptionStatus.textContent = "Procesando audio (" + progreso + "%)...";
+        if (renderTranscripcionEstado(data)) {
           if (intentos < maxIntentos) setTimeout(consultar, 2000);
-          else mostrarError("Tiempo de espera excedido.");
-        } else if (data.status === "completed") {
-          hide(elements.trans_loaderAUD);
-          show(elements.trans_statusAUD);
-          elements.trans_resultadoTranscripcion.innerHTML = data.transcripcion || "Transcripción vacía";
-          elements.trans_resultadoTranscripcion.classList.remove('empty');
-          elements.trans_btnTranscribir.disabled = false;
-          elements.trans_progressBar.style.width = "100%";
-          elements.trans_progressText.textContent = "¡Transcripción completada!";
-        } else if (data.status === "failed") {
-          mostrarError(data.error || "Error al transcribir");
-        } else {
-          mostrarError("Estado desconocido");
+          else mostrarErrorTranscripcion("Tiempo de espera excedido.");
         }
       })
       .catch(() => {
-        mostrarError("Error de conexión con el backend");
+        mostrarErrorTranscripcion("Error de conexión con el backend");
       });
   }
-  function mostrarError(msg) {
-    hide(elements.trans_loaderAUD);
-    show(elements.trans_errorAUD);
-    elements.trans_errorAUD.textContent = '❌ ' + msg;
-    elements.trans_btnTranscribir.disabled = false;
-    elements.trans_progressContainer.style.display = "none";
-    elements.trans_progressText.textContent = '';
-  }
   consultar();
 }
 
@@ -313,7 +347,7 @@ if (elements.sent_btnProcesar) {
       } else {
         // Mostrar gráfica solo positivo/negativo
         elements.sent_charts.style.display = 'block';
-        document.getElementById('sent_barChart').outerHTML = `<img src="data:image/png;base64,${data.grafica_b64}" style="max-width:100%;">`;
+        document.getElementById('sent_barChart').outerHTML = `<img id="sent_barChart" src="${data.grafica_url}" style="max-width:100%;">`;
         document.getElementById('sent_pieChart').style.display = 'none';
         // Mostrar resultados y enlace de descarga
         lastSentimientoFile = data.archivo_guardado.split('/').pop(); // <--- Guarda el último archivo generado
@@ -451,7 +485,7 @@ if (eval_btnCargarMetrics) {
         <div><strong>F1-score:</strong> ${data.f1}</div>
       `;
       eval_chartsMetrics.style.display = 'block';
-      eval_confusionMatrix.outerHTML = `<img src="data:image/png;base64,${data.grafica_b64}" style="max-width:100%;">`;
+      document.getElementById('eval_confusionMatrix').outerHTML = `<img id="eval_confusionMatrix" src="${data.grafica_url}" style="max-width:100%;">`;
       show(eval_statusML);
       setTimeout(() => hide(eval_statusML), 3000);
 
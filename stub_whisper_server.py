@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Servidor whisper.cpp falso para pruebas sin modelo ni GPU.
+
+Acepta los mismos argumentos que whisper-server (-m, -l, --host, --port) y
+responde POST /inference con un texto fijo, así que sirve como
+WHISPER_SERVER_BINARY para el backend "pool" o como WHISPER_SERVER_URLS
+para el backend "server".
+
+Variables de entorno:
+    STUB_WHISPER_TEXT   texto devuelto (por defecto uno de ejemplo)
+    STUB_WHISPER_DELAY  segundos de espera simulada por petición
+"""
+
+import argparse
+import json
+import os
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TEXTO = os.environ.get("STUB_WHISPER_TEXT", "Esta es una transcripción de prueba.")
+DELAY = float(os.environ.get("STUB_WHISPER_DELAY", "0"))
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            # Subidas en streaming: consumir todos los trozos
+            while True:
+                tam = int(self.rfile.readline().strip() or b"0", 16)
+                self.rfile.read(tam + 2)
+                if tam == 0:
+                    break
+        else:
+            longitud = int(self.headers.get("Content-Length", 0))
+            self.rfile.read(longitud)
+        if self.path.rstrip("/") != "/inference":
+            self.send_error(404)
+            return
+        if DELAY:
+            time.sleep(DELAY)
+        cuerpo = json.dumps({"text": TEXTO}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, format, *args):
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description="whisper-server falso")
+    parser.add_argument("-m", "--model", default="")
+    parser.add_argument("-l", "--language", default="es")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    args, _ = parser.parse_known_args()
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
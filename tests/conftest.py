@@ -0,0 +1,46 @@
+import os
+import sys
+import tempfile
+
+# Antes de importar app: todos los datos (textos, resultados, trabajos, cachés) en un directorio temporal
+BASE_DIR = tempfile.mkdtemp(prefix="tests_app_")
+os.environ["BASE_DIR"] = BASE_DIR
+for variable in ("JOB_STORE_PATH", "MODELOS_FOLDER", "LEMMA_CACHE_PATH", "PROFILING_ENABLED", "PROFILING_TOKEN"):
+    os.environ.pop(variable, None)
+os.environ["WARMUP_MODELS"] = ""
+os.environ["WHISPER_BACKEND"] = "cli"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import app as app_module
+
+@pytest.fixture
+def app():
+    return app_module
+
+@pytest.fixture
+def client():
+    return app_module.app.test_client()
+
+WHISPER_FALSO = """#!{python}
+import sys
+args = sys.argv[1:]
+salida = args[args.index("-of") + 1]
+print("whisper_print_progress_callback: progress = 100%", file=sys.stderr)
+with open(salida + ".txt", "w", encoding="utf-8") as f:
+    f.write("transcripción de " + args[args.index("-f") + 1].rsplit("/", 1)[-1])
+"""
+
+@pytest.fixture
+def whisper_falso(tmp_path, monkeypatch):
+    """whisper-cli simulado que escribe una transcripción fija al instante"""
+    binario = tmp_path / "whisper-cli"
+    binario.write_text(WHISPER_FALSO.format(python=sys.executable))
+    binario.chmod(0o755)
+    modelo = tmp_path / "ggml-falso.bin"
+    modelo.write_bytes(b"")
+    monkeypatch.setattr(app_module, "WHISPER_BINARY", str(binario))
+    monkeypatch.setattr(app_module, "WHISPER_MODEL", str(modelo))
+    return binario
@@ -0,0 +1,12 @@
+import os
+import subprocess
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_importar_app_no_carga_dependencias_diferidas(tmp_path):
+    codigo = ("import sys, app; "
+              "print(sorted(m for m in ('scipy', 'requests', 'sklearn', 'spacy') if m in sys.modules))")
+    entorno = dict(os.environ, BASE_DIR=str(tmp_path), WARMUP_MODELS="", PYTHONPATH=RAIZ)
+    salida = subprocess.run([sys.executable, "-c", codigo], capture_output=True, text=True, env=entorno, check=True)
+    assert salida.stdout.strip().splitlines()[-1] == "[]"
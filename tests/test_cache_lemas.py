@@ -0,0 +1,14 @@
+import sqlite3
+
+def test_cache_de_lemas_acota_las_filas_en_disco(app, tmp_path):
+    ruta = str(tmp_path / "lemas.db")
+    cache = app.LemmaCache(ruta, memory_size=100, max_rows=5)
+    for i in range(8):
+        cache.put_many("prueba", {f"texto {i}": [f"lema {i}"]})
+    # Reescribir una clave la hace reciente
+    cache.put_many("prueba", {"texto 3": ["lema 3"]})
+
+    filas = sqlite3.connect(ruta).execute("SELECT COUNT(*) FROM lemas").fetchone()[0]
+    assert filas == 5
+    en_disco = app.LemmaCache(ruta, memory_size=100, max_rows=5).get_many("prueba", [f"texto {i}" for i in range(8)])
+    assert sorted(en_disco) == ["texto 3", "texto 4", "texto 5", "texto 6", "texto 7"]
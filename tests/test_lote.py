@@ -0,0 +1,122 @@
+import io
+import os
+import time
+import wave
+import zipfile
+
+import numpy as np
+
+def wav(segundos, seed):
+    muestras = np.random.default_rng(seed).integers(-300, 300, int(segundos * 16000), dtype=np.int16)
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(16000)
+        w.writeframes(muestras.tobytes())
+    return buf.getvalue()
+
+def esperar_lote(client, grupo_id, timeout=30):
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        estado = client.get(f"/lote/{grupo_id}").get_json()
+        if estado["status"] != "processing":
+            return estado
+        time.sleep(0.05)
+    raise AssertionError(f"El lote no terminó: {estado}")
+
+def test_lote_transcribe_y_descarga_zip(client, whisper_falso):
+    audios = [(io.BytesIO(wav(0.5 + i, seed=100 + i)), f"clip{i}.wav") for i in range(3)]
+    respuesta = client.post("/transcribir_lote", data={"audios": audios}, content_type="multipart/form-data")
+    assert respuesta.status_code == 200
+    grupo_id = respuesta.get_json()["grupo_id"]
+
+    estado = esperar_lote(client, grupo_id)
+    assert estado["status"] == "completed"
+    assert estado["completados"] == 3
+
+    descarga = client.get(f"/lote/{grupo_id}/descargar")
+    assert descarga.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(descarga.data)) as zf:
+        assert len(zf.namelist()) == 3
+
+def test_lote_no_queda_como_trabajo_en_proceso(client, whisper_falso):
+    audios = [(io.BytesIO(wav(0.5, seed=200 + i)), f"clip{i}.wav") for i in range(2)]
+    grupo_id = client.post("/transcribir_lote", data={"audios": audios},
+                           content_type="multipart/form-data").get_json()["grupo_id"]
+    assert esperar_lote(client, grupo_id)["status"] == "completed"
+    assert client.get(f"/estado/{grupo_id}").get_json()["status"] == "completed"
+    metricas = client.get("/metrics").data.decode()
+    assert 'app_jobs{status="processing"} 0' in metricas
+
+def test_lote_zip_respeta_el_maximo_sin_extraer_todo(client, app, monkeypatch):
+    monkeypatch.setattr(app, "BATCH_MAX_FILES", 2)
+    copiados = []
+    copiar = app.copiar_con_hash
+    monkeypatch.setattr(app, "copiar_con_hash", lambda stream, destino: copiados.append(destino) or copiar(stream, destino))
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for i in range(5):
+            zf.writestr(f"clip{i}.wav", wav(0.2, seed=300 + i))
+    buf.seek(0)
+    respuesta = client.post("/transcribir_lote", data={"zip": (buf, "lote.zip")}, content_type="multipart/form-data")
+    assert respuesta.status_code == 400
+    assert len(copiados) == 2
+    assert not any(os.path.exists(destino) for destino in copiados)
+
+def test_trabajos_activos_no_expiran_y_el_ttl_cuenta_desde_el_final(app, tmp_path):
+    for store in (app.MemoryJobStore(ttl=60), app.SqliteJobStore(str(tmp_path / "jobs.db"), ttl=60)):
+        inicio = time.time() - 3600
+        store.create("en_cola", {"status": "queued", "start_time": inicio})
+        store.create("terminado", {"status": "queued", "start_time": inicio})
+        store.update("terminado", status="completed")
+        assert store.expired(time.time()) == []
+        assert store.expired(time.time() + 61) == ["terminado"]
+
+def test_lote_sigue_mientras_queden_clips(app):
+    inicio = time.time() - 2 * app.JOB_TTL_SECONDS
+    app.jobs.create("clip-activo", {"status": "processing", "start_time": inicio})
+    app.jobs.create("grupo-viejo", {"tipo": "lote", "status": "lote", "start_time": inicio, "jobs": ["clip-activo"]})
+    app.clean_old_jobs()
+    assert "grupo-viejo" in app.jobs
+    app.jobs.delete("clip-activo")
+    app.clean_old_jobs()
+    assert "grupo-viejo" not in app.jobs
+
+def test_cola_borra_el_temporal_de_un_trabajo_descartado(app, tmp_path):
+    temporal = tmp_path / "subida.wav"
+    temporal.write_bytes(b"audio")
+    ejecutados = []
+    cola = app.TranscriptionQueue(1, 5)
+    assert cola.submit("trabajo-inexistente", lambda *args: ejecutados.append(args), str(temporal), temporal=str(temporal))
+    limite = time.monotonic() + 5
+    while temporal.exists() and time.monotonic() < limite:
+        time.sleep(0.01)
+    assert not temporal.exists()
+    assert ejecutados == []
+
+def wav_estereo(segundos, seed, framerate=48000):
+    muestras = np.random.default_rng(seed).integers(-300, 300, int(segundos * framerate) * 2, dtype=np.int16)
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(2)
+        w.setsampwidth(2)
+        w.setframerate(framerate)
+        w.writeframes(muestras.tobytes())
+    return buf.getvalue()
+
+def test_lote_ordena_por_duracion_y_no_por_tamano(client, app, whisper_falso):
+    corto_pesado = wav_estereo(1, seed=400)
+    largo_liviano = wav(3, seed=401)
+    assert len(corto_pesado) > len(largo_liviano)
+    audios = [(io.BytesIO(largo_liviano), "largo.wav"), (io.BytesIO(corto_pesado), "corto.wav")]
+    respuesta = client.post("/transcribir_lote", data={"audios": audios}, content_type="multipart/form-data").get_json()
+    assert [app.jobs.get(j)["original"] for j in respuesta["job_ids"]] == ["corto.wav", "largo.wav"]
+    esperar_lote(client, respuesta["grupo_id"])
+
+def test_probe_audio_lee_la_duracion_del_wav(app, tmp_path):
+    ruta = tmp_path / "clip.wav"
+    ruta.write_bytes(wav(2.5, seed=402))
+    info = app.probe_audio(str(ruta))
+    assert (info["sample_rate"], info["channels"]) == (16000, 1)
+    assert abs(info["duracion"] - 2.5) < 1e-6
@@ -0,0 +1,23 @@
+import numpy as np
+from scipy import sparse
+
+def _datos(conteos):
+    y = np.concatenate([np.full(n, clase) for clase, n in conteos.items()])
+    X = sparse.random(len(y), 30, density=0.3, format="csr", random_state=0)
+    return X, y
+
+def _conteos(y):
+    clases, conteos = np.unique(y, return_counts=True)
+    return dict(zip(clases.tolist(), conteos.tolist()))
+
+def test_balancear_smote_sobremuestrea_clases_pequenas(app):
+    X, y = _datos({1: 10, 2: 20, 3: 30})
+    X_res, y_res = app.balancear_smote(X, y)
+    assert _conteos(y_res) == {1: 10, 2: 50, 3: 50}
+    assert sparse.issparse(X_res)
+
+def test_balancear_smote_no_reduce_clases_mayores_que_su_objetivo(app):
+    # Antes SMOTE recibía objetivos menores que la clase y lanzaba ValueError (500 en /evaluar)
+    X, y = _datos({1: 60, 2: 120, 3: 45})
+    _, y_res = app.balancear_smote(X, y)
+    assert _conteos(y_res) == {1: 60, 2: 120, 3: 50}
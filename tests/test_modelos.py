@@ -0,0 +1,33 @@
+import pytest
+
+def registro(app, tmp_path, **kwargs):
+    return app.RegistroClasificadores(str(tmp_path / "modelos"), **kwargs)
+
+def test_guardar_no_activa_por_defecto(app, client, tmp_path, monkeypatch):
+    reg = registro(app, tmp_path)
+    monkeypatch.setattr(app, "registro_clasificadores", reg)
+    anterior = reg.version_activa()
+    reg.guardar({"m": 1}, None, None, {})
+
+    assert reg.version_activa() == anterior
+    respuesta = client.post("/clasificar", json={"textos": ["el servicio fue bueno"]})
+    assert respuesta.status_code == 404
+
+def test_registro_conserva_solo_las_versiones_recientes_y_la_activa(app, tmp_path):
+    reg = registro(app, tmp_path, max_versiones=2)
+    primera = reg.guardar({"m": 0}, None, None, {})
+    reg.activar(primera)
+    versiones = [reg.guardar({"m": i}, None, None, {}) for i in range(1, 5)]
+
+    conservadas = {m["version"] for m in reg.listar()}
+    assert conservadas == {primera, *versiones[-2:]}
+    assert reg.version_activa() == primera
+    for version in versiones[:2]:
+        with pytest.raises(app.ModeloNoEncontrado):
+            reg.cargar(version)
+
+def test_clasificar_sin_activar_pide_activacion(app, tmp_path):
+    reg = registro(app, tmp_path)
+    reg.guardar({"m": 1}, None, None, {})
+    with pytest.raises(app.ModeloNoEncontrado, match="activar"):
+        reg.cargar()
@@ -0,0 +1,45 @@
+import os
+
+from flask import g
+
+def test_trabajo_perfilado_publica_perfil_con_el_estado_final(app, monkeypatch):
+    job_id = "perfil-trabajo"
+    app.jobs.create(job_id, app.nuevo_trabajo("encuesta.csv", tipo="sentimientos"))
+    csv_path = os.path.join(app.JOBS_FOLDER, f"{job_id}.csv")
+    with open(csv_path, "w") as f:
+        f.write("a,b\n1,2\n")
+    actualizaciones = []
+    update = app.jobs.update
+    monkeypatch.setattr(app.jobs, "update", lambda jid, **campos: actualizaciones.append(campos) or update(jid, **campos))
+
+    with app.app.test_request_context("/sentimientos"):
+        g.perfilar = True
+        target = app.objetivo_trabajo(app.ejecutar_analisis)
+    target(job_id, lambda origen, progress_cb: {"filas": len(origen.read())}, csv_path, {})
+
+    final = actualizaciones[-1]
+    assert final["status"] == "completed"
+    assert final["perfil_url"].startswith("/perfil/perfil_ejecutar_analisis_")
+    resumen = os.path.join(app.RESULTS_FOLDER, final["perfil_url"].rsplit("/", 1)[-1])
+    assert os.path.exists(resumen)
+    assert app.jobs.get(job_id)["perfil_url"] == final["perfil_url"]
+
+def test_pide_perfil_exige_el_token_de_administrador(app, monkeypatch):
+    monkeypatch.setattr(app, "PROFILING_TOKEN", "secreto")
+    for cabeceras, esperado in (({}, False), ({"X-Profile": "otro"}, False), ({"X-Profile": "secreto"}, True)):
+        with app.app.test_request_context("/procesar", headers=cabeceras):
+            assert app.pide_perfil() is esperado
+    monkeypatch.setattr(app, "PROFILING_TOKEN", "")
+    with app.app.test_request_context("/procesar", headers={"X-Profile": ""}):
+        assert app.pide_perfil() is False
+
+def test_descargar_perfil_requiere_token(app, client, monkeypatch):
+    monkeypatch.setattr(app, "PROFILING_TOKEN", "secreto")
+    nombre = "perfil_prueba_20260101_000000_abcdef.txt"
+    with open(os.path.join(app.RESULTS_FOLDER, nombre), "w") as f:
+        f.write("resumen")
+    assert client.get(f"/perfil/{nombre}").status_code == 403
+    assert client.get(f"/perfil/{nombre}", headers={"X-Profile": "otro"}).status_code == 403
+    respuesta = client.get(f"/perfil/{nombre}", headers={"X-Profile": "secreto"})
+    assert respuesta.status_code == 200
+    assert respuesta.data == b"resumen"
@@ -0,0 +1,46 @@
+import os
+import socket
+import time
+
+import pytest
+
+STUB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "stub_whisper_server.py")
+
+@pytest.fixture
+def pools(app):
+    creados = []
+
+    def crear(binary=STUB, **kwargs):
+        pool = app.PoolBackend(2, binary, "modelo-falso.bin", **kwargs)
+        creados.append(pool)
+        return pool
+    yield crear
+    for pool in creados:
+        pool.close()
+
+def test_pools_de_procesos_distintos_no_comparten_puertos(pools):
+    # Dos workers de gunicorn = dos PoolBackend con la misma configuración
+    a, b = pools(base_port=0), pools(base_port=0)
+    a.preparar()
+    b.preparar()
+    assert a.available() and b.available()
+    assert not set(a.urls) & set(b.urls)
+
+def test_pool_falla_si_el_servidor_termina_al_arrancar(app, pools, tmp_path):
+    binario = tmp_path / "whisper-server"
+    binario.write_text("#!/bin/sh\nexit 3\n")
+    binario.chmod(0o755)
+    inicio = time.monotonic()
+    with pytest.raises(app.BackendNoDisponible, match="terminó al arrancar"):
+        pools(binary=str(binario), base_port=0).preparar()
+    assert time.monotonic() - inicio < 10
+
+def test_pool_no_confunde_un_puerto_ajeno_con_su_servidor(app, pools):
+    ajeno = socket.socket()
+    ajeno.bind(("127.0.0.1", 0))
+    ajeno.listen()
+    try:
+        with pytest.raises(app.BackendNoDisponible, match="en uso"):
+            pools(base_port=ajeno.getsockname()[1]).preparar()
+    finally:
+        ajeno.close()
@@ -0,0 +1,85 @@
+import glob
+import io
+import json
+import os
+import random
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+PALABRAS = ("servicio atención rápido lento precio caro barato amable personal tienda producto "
+            "envío calidad espera horario limpio sucio excelente malo bueno").split()
+
+def textos(n, seed=0):
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(PALABRAS, k=rng.randint(3, 10))) for _ in range(n)]
+
+def por_bloques(tfidf, docs, tam):
+    bloques = [docs[i:i + tam] for i in range(0, len(docs), tam)]
+    for bloque in bloques:
+        tfidf.contar(bloque)
+    tfidf.fijar_vocabulario()
+    return sparse.vstack([tfidf.transformar(bloque) for bloque in bloques], format="csr")
+
+def test_tfidf_por_bloques_igual_a_sklearn(app):
+    docs = textos(500)
+    params = dict(app.TFIDF_PARAMS, max_features=40)
+    esperado = TfidfVectorizer(**params).fit_transform(docs)
+    tfidf = app.TfidfPorBloques(**params)
+    obtenido = por_bloques(tfidf, docs, 64)
+    assert not tfidf.podado
+    assert abs(obtenido - esperado).max() < 1e-12
+
+def test_tfidf_por_bloques_acota_los_terminos_contados(app):
+    tfidf = app.TfidfPorBloques(**dict(app.TFIDF_PARAMS, max_features=10), max_terminos=60)
+    for i in range(0, 500, 50):
+        tfidf.contar(textos(50, seed=i))
+        assert len(tfidf.tf_counts) <= 60
+    assert tfidf.podado
+    assert len(tfidf.fijar_vocabulario()) == 10
+
+def test_procesar_csv_por_bloques_escribe_fragmentos(app, monkeypatch):
+    def textos_simples(df, progress_cb=None):
+        serie = df["RESPUESTA"].dropna().astype(str).str.lower()
+        return serie, {"filas": len(serie), "segundos": 0.0}, None
+    monkeypatch.setattr(app, "textos_para_tfidf", textos_simples)
+    docs = textos(230, seed=7)
+    csv = pd.DataFrame({"id": range(len(docs)), "respuesta": docs}).to_csv(index=False).encode()
+
+    resultado = app.procesar_csv_por_bloques(io.BytesIO(csv), chunk_rows=50, top_k=3)
+    meta = resultado["metadata"]
+    fragmentos = sorted(glob.glob(os.path.join(meta["archivo_guardado"], "bloque_*.npz")))
+    assert meta["bloques"] == len(fragmentos) == 5
+    X = sparse.vstack([sparse.load_npz(f) for f in fragmentos], format="csr")
+    assert X.shape == (meta["filas"], meta["columnas"]) == (230, meta["columnas"])
+    assert X.nnz == meta["nnz"]
+    with open(meta["vocabulario"], encoding="utf-8") as f:
+        vocabulario = json.load(f)
+    esperado = app.top_terminos_corpus(X, vocabulario)
+    assert [t["termino"] for t in resultado["top_corpus"]] == [t["termino"] for t in esperado]
+    assert [t["documentos"] for t in resultado["top_corpus"]] == [t["documentos"] for t in esperado]
+    assert np.allclose([t["peso_medio"] for t in resultado["top_corpus"]], [t["peso_medio"] for t in esperado])
+
+def test_procesar_solo_usa_bloques_si_se_pide(app, client, monkeypatch):
+    def textos_simples(df, progress_cb=None):
+        serie = df["RESPUESTA"].dropna().astype(str).str.lower()
+        return serie, {"filas": len(serie), "segundos": 0.0}, None
+    monkeypatch.setattr(app, "textos_para_tfidf", textos_simples)
+    docs = textos(200, seed=3)
+    csv = pd.DataFrame({"id": range(len(docs)), "respuesta": docs}).to_csv(index=False).encode()
+    monkeypatch.setitem(app.app.config, "MAX_CONTENT_LENGTH", len(csv) // 2)
+
+    # Sin modo=bloques rige el límite general y la respuesta no cambia de formato
+    r = client.post("/procesar", data={"file": (io.BytesIO(csv), "datos.csv"), "modo": "bloques"})
+    assert r.status_code == 413
+    monkeypatch.setitem(app.app.config, "MAX_CONTENT_LENGTH", len(csv) * 2)
+    r = client.post("/procesar", data={"file": (io.BytesIO(csv), "datos.csv")})
+    assert r.status_code == 200
+    assert "bloques" not in r.get_json().get("metadata", {})
+
+    monkeypatch.setitem(app.app.config, "MAX_CONTENT_LENGTH", len(csv) // 2)
+    r = client.post("/procesar?modo=bloques", data={"file": (io.BytesIO(csv), "datos.csv")})
+    assert r.status_code == 200
+    assert r.get_json()["metadata"]["bloques"] == 1
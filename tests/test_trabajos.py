@@ -0,0 +1,28 @@
+import sqlite3
+
+def test_reinicio_marca_como_fallidos_los_trabajos_de_otra_instancia(app, tmp_path):
+    ruta = str(tmp_path / "jobs.db")
+    anterior = app.SqliteJobStore(ruta, instancia="arranque-1")
+    anterior.create("en_cola", {"status": "queued"})
+    anterior.create("procesando", {"status": "processing"})
+    anterior.create("terminado", {"status": "completed"})
+
+    # Otro proceso del mismo arranque no toca los trabajos activos
+    app.SqliteJobStore(ruta, instancia="arranque-1")
+    assert anterior.get("en_cola")["status"] == "queued"
+
+    nuevo = app.SqliteJobStore(ruta, instancia="arranque-2")
+    assert nuevo.get("en_cola")["status"] == "failed"
+    assert nuevo.get("procesando")["status"] == "failed"
+    assert nuevo.get("terminado")["status"] == "completed"
+
+def test_base_sin_columna_instancia_se_migra(app, tmp_path):
+    ruta = str(tmp_path / "jobs.db")
+    conn = sqlite3.connect(ruta)
+    conn.execute("CREATE TABLE jobs (job_id TEXT PRIMARY KEY, status TEXT NOT NULL, start_time REAL NOT NULL, "
+                 "expires_at REAL NOT NULL, pid INTEGER, data TEXT NOT NULL)")
+    conn.execute("INSERT INTO jobs VALUES ('viejo', 'processing', 0, 3600, 1, '{\"status\": \"processing\"}')")
+    conn.commit()
+    conn.close()
+    store = app.SqliteJobStore(ruta, instancia="arranque-1")
+    assert store.get("viejo")["status"] == "failed"
@@ -0,0 +1,41 @@
+import pytest
+
+def test_unir_transcripciones_quita_solape_de_varias_palabras(app):
+    assert app.unir_transcripciones(["uno dos tres cuatro", "tres cuatro cinco"]) == "uno dos tres cuatro cinco"
+
+def test_unir_transcripciones_quita_solape_de_una_palabra(app):
+    assert app.unir_transcripciones(["cinco seis siete", "siete ocho nueve"]) == "cinco seis siete ocho nueve"
+
+def test_unir_transcripciones_solape_de_una_palabra_con_puntuacion(app):
+    assert app.unir_transcripciones(["hasta el siete.", "Siete, ocho"]) == "hasta el siete. ocho"
+
+def test_unir_transcripciones_sin_solape_conserva_todo(app):
+    assert app.unir_transcripciones(["uno dos", "tres cuatro"]) == "uno dos tres cuatro"
+
+def test_unir_transcripciones_palabra_comun_lejos_de_la_frontera_no_es_solape(app):
+    unido = app.unir_transcripciones(["volvió a su casa", "luego dijo casa grande"])
+    assert unido == "volvió a su casa luego dijo casa grande"
+
+FFMPEG_ROTO = "#!/bin/sh\necho 'archivo.ogg: Invalid data found when processing input' >&2\nexit 1\n"
+
+class BackendQueLee:
+    def transcribe_pipe(self, stream, output_prefix, threads=None, progress_cb=None):
+        stream.read()
+        return "texto"
+
+def test_error_de_ffmpeg_lleva_un_solo_prefijo(app, tmp_path, monkeypatch):
+    ffmpeg = tmp_path / "ffmpeg"
+    ffmpeg.write_text(FFMPEG_ROTO)
+    ffmpeg.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{tmp_path}:{app.os.environ['PATH']}")
+    entrada = tmp_path / "archivo.ogg"
+    entrada.write_bytes(b"no es audio")
+
+    ok, error = app.convert_audio_to_wav(str(entrada), str(tmp_path / "salida.wav"))
+    assert not ok
+    assert error == "archivo.ogg: Invalid data found when processing input"
+
+    with pytest.raises(Exception) as error_stream:
+        app._transcribir_stream_con(BackendQueLee(), str(entrada), str(tmp_path / "salida"))
+    assert str(error_stream.value).count("Error en conversión:") == 1
+    assert "Invalid data found" in str(error_stream.value)